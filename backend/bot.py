@@ -28,6 +28,8 @@ from aiogram.types import (
 )
 
 from gigafile_client import gigafile_client
+from gigafile_proxy import gigafile_proxy
+from upload_dedup import hash_file
 from i18n import get_lang, t, LANG_NAMES, SUPPORTED_LANGS
 
 logger = logging.getLogger(__name__)
@@ -55,6 +57,9 @@ dp = Dispatcher(storage=MemoryStorage())
 # Track active tasks for cancellation
 _active_tasks: dict[int, asyncio.Event] = {}
 
+# Job queue (jobs.JobManager) set by setup_webhook: URL re-uploads run in the transfer workers
+_jobs = None
+
 # User language preferences (in-memory, chat_id -> lang)
 _user_langs: dict[int, str] = {}
 
@@ -86,8 +91,12 @@ def _esc(s: str) -> str:
     return s
 
 
-def _links_text(lang: str, page_url: str, direct_url: str, proxy_url: str, filename: str = "") -> str:
+def _links_text(
+    lang: str, page_url: str, direct_url: str, proxy_url: str, filename: str = "", size: int | None = None,
+) -> str:
     fn_line = f"\n\n*{_esc(t(lang, 'file_label'))}* `{_esc(filename)}`" if filename else ""
+    if size is not None:
+        fn_line = f"\n\n{_esc(t(lang, 'file_info', name=filename or '-', size=f'{size / (1024 * 1024):.1f}'))}"
     return (
         f"{_esc(t(lang, 'done'))}\n\n"
         f"*{_esc(t(lang, 'page_url'))}*\n"
@@ -107,6 +116,24 @@ def _make_links(server_num: str, file_id: str) -> tuple[str, str, str]:
     return page_url, direct_url, proxy_url
 
 
+async def _answer_gigafile_links(message: Message, lang: str, server_num: str, file_id: str):
+    """Links for a GigaFile file, with its name and size - or a notice that the link has expired."""
+    page_url, direct_url, proxy_url = _make_links(server_num, file_id)
+    meta = {}
+    try:
+        meta = await gigafile_proxy.metadata(page_url)
+    except Exception as e:
+        logger.warning("Metadata lookup for %s failed: %s", page_url, e)
+    if meta and not meta['alive']:
+        await message.answer(_esc(t(lang, 'link_expired')), parse_mode="MarkdownV2")
+        return
+    await message.answer(
+        _links_text(lang, page_url, direct_url, proxy_url, meta.get('filename') or "", meta.get('size')),
+        parse_mode="MarkdownV2",
+        reply_markup=_links_keyboard(lang, page_url, proxy_url),
+    )
+
+
 def _links_keyboard(lang: str, page_url: str, proxy_url: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -179,6 +206,31 @@ def _make_progress_cb(status_msg: Message, cancel_event: asyncio.Event, lang: st
     return cb
 
 
+async def _upload_url(url: str, duration: int, status_msg: Message, cancel_event: asyncio.Event,
+                      chat_id: int, lang: str) -> dict:
+    """Re-upload `url` as a queued job and follow its progress; in-process without a job queue."""
+    cb = _make_progress_cb(status_msg, cancel_event, lang)
+    if _jobs is None:
+        return await gigafile_client.upload_from_url(
+            url, lifetime=duration,
+            progress_cb=cb, cancel_event=cancel_event,
+            journal_meta={'chat_id': chat_id, 'lang': lang},
+            owner=f"tg:{chat_id}",
+        )
+    job = await _jobs.submit(
+        {'url': url, 'duration': duration, 'meta': {'chat_id': chat_id, 'lang': lang}}, owner=f"tg:{chat_id}",
+    )
+    cancel_sent = False
+    async for job in _jobs.events(job['id']):
+        if cancel_event.is_set() and not cancel_sent:
+            cancel_sent = True
+            await _jobs.cancel(job['id'])
+        progress = job.get('progress')
+        if progress and progress.get('stage'):
+            await cb(progress['stage'], progress['percent'])
+    return job.get('result') or {'success': False, 'error': job.get('error') or job['status']}
+
+
 def _is_gigafile_url(url: str) -> bool:
     return bool(GIGAFILE_ANY_RE.search(url))
 
@@ -348,11 +400,7 @@ async def cb_duration(callback: CallbackQuery, state: FSMContext):
 
         status_msg = await callback.message.edit_text(t(lang, 'init'))
         try:
-            cb = _make_progress_cb(status_msg, cancel_event, lang)
-            result = await gigafile_client.upload_from_url(
-                pending_url, lifetime=duration,
-                progress_cb=cb, cancel_event=cancel_event,
-            )
+            result = await _upload_url(pending_url, duration, status_msg, cancel_event, chat_id, lang)
 
             if cancel_event.is_set():
                 await status_msg.edit_text(t(lang, 'cancelled'))
@@ -391,7 +439,9 @@ async def cb_duration(callback: CallbackQuery, state: FSMContext):
     try:
         cb = _make_progress_cb(status_msg, cancel_event, lang)
         result = await gigafile_client.upload_file_path(
-            file_path, lifetime=duration, progress_cb=cb
+            file_path, lifetime=duration, progress_cb=cb,
+            journal_meta={'chat_id': chat_id, 'lang': lang, 'file_name': file_name}, spool=True,
+            owner=f"tg:{chat_id}", content_hash=data.get('content_hash'),
         )
 
         if cancel_event.is_set():
@@ -417,6 +467,19 @@ async def cb_duration(callback: CallbackQuery, state: FSMContext):
                 pass
 
 
+async def _download_to_temp(telegram_path: str, file_name: str) -> tuple[str, str]:
+    """Spool a Telegram file to a temp file -> (path, sha256 for upload dedup), all off the event loop."""
+    fd, tmp_path = tempfile.mkstemp(suffix=f"_{file_name}")
+    os.close(fd)
+    try:
+        # A path makes aiogram write through aiofiles; the hash is computed in the executor afterwards
+        await bot.download_file(telegram_path, tmp_path)
+        return tmp_path, await hash_file(tmp_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 # Handle files/documents
 @dp.message(F.document)
 async def handle_document(message: Message, state: FSMContext):
@@ -436,11 +499,10 @@ async def handle_document(message: Message, state: FSMContext):
     status_msg = await message.answer(t(lang, 'receiving_file'))
     try:
         file_info = await bot.get_file(doc.file_id)
-        tmp_path = tempfile.mktemp(suffix=f"_{file_name}")
-        await bot.download_file(file_info.file_path, tmp_path)
+        tmp_path, content_hash = await _download_to_temp(file_info.file_path, file_name)
 
         await state.set_state(BotStates.waiting_upload_settings)
-        await state.update_data(file_path=tmp_path, file_name=file_name)
+        await state.update_data(file_path=tmp_path, file_name=file_name, content_hash=content_hash)
         await status_msg.edit_text(
             f"*{_esc(t(lang, 'file_info', name=file_name, size=f'{file_size_mb:.1f}'))}*\n\n{_esc(t(lang, 'choose_duration'))}",
             parse_mode="MarkdownV2",
@@ -463,11 +525,10 @@ async def handle_photo(message: Message, state: FSMContext):
     try:
         file_info = await bot.get_file(photo.file_id)
         file_name = f"photo_{photo.file_unique_id}.jpg"
-        tmp_path = tempfile.mktemp(suffix=f"_{file_name}")
-        await bot.download_file(file_info.file_path, tmp_path)
+        tmp_path, content_hash = await _download_to_temp(file_info.file_path, file_name)
 
         await state.set_state(BotStates.waiting_upload_settings)
-        await state.update_data(file_path=tmp_path, file_name=file_name)
+        await state.update_data(file_path=tmp_path, file_name=file_name, content_hash=content_hash)
         await status_msg.edit_text(
             f"*{_esc(t(lang, 'file_info', name=file_name, size=f'{file_size_mb:.1f}'))}*\n\n{_esc(t(lang, 'choose_duration'))}",
             parse_mode="MarkdownV2",
@@ -497,11 +558,10 @@ async def handle_video(message: Message, state: FSMContext):
     status_msg = await message.answer(t(lang, 'receiving_file'))
     try:
         file_info = await bot.get_file(video.file_id)
-        tmp_path = tempfile.mktemp(suffix=f"_{file_name}")
-        await bot.download_file(file_info.file_path, tmp_path)
+        tmp_path, content_hash = await _download_to_temp(file_info.file_path, file_name)
 
         await state.set_state(BotStates.waiting_upload_settings)
-        await state.update_data(file_path=tmp_path, file_name=file_name)
+        await state.update_data(file_path=tmp_path, file_name=file_name, content_hash=content_hash)
         await status_msg.edit_text(
             f"*{_esc(t(lang, 'file_info', name=file_name, size=f'{file_size_mb:.1f}'))}*\n\n{_esc(t(lang, 'choose_duration'))}",
             parse_mode="MarkdownV2",
@@ -524,14 +584,7 @@ async def handle_text(message: Message, state: FSMContext):
         if _is_own_proxy_url(found_url):
             gf_info = _extract_gigafile_info(found_url)
             if gf_info:
-                server_num, file_id = gf_info
-                page_url, direct_url, proxy_url = _make_links(server_num, file_id)
-                kb = _links_keyboard(lang, page_url, proxy_url)
-                await message.answer(
-                    _links_text(lang, page_url, direct_url, proxy_url),
-                    parse_mode="MarkdownV2",
-                    reply_markup=kb,
-                )
+                await _answer_gigafile_links(message, lang, *gf_info)
                 return
             else:
                 await message.answer(
@@ -543,14 +596,7 @@ async def handle_text(message: Message, state: FSMContext):
     gf_info = _extract_gigafile_info(text)
 
     if gf_info:
-        server_num, file_id = gf_info
-        page_url, direct_url, proxy_url = _make_links(server_num, file_id)
-        kb = _links_keyboard(lang, page_url, proxy_url)
-        await message.answer(
-            _links_text(lang, page_url, direct_url, proxy_url),
-            parse_mode="MarkdownV2",
-            reply_markup=kb,
-        )
+        await _answer_gigafile_links(message, lang, *gf_info)
         return
 
     if url_m:
@@ -587,11 +633,7 @@ async def handle_text(message: Message, state: FSMContext):
 
             status_msg = await message.answer(t(lang, 'init'))
             try:
-                cb = _make_progress_cb(status_msg, cancel_event, lang)
-                result = await gigafile_client.upload_from_url(
-                    found_url, lifetime=explicit_duration,
-                    progress_cb=cb, cancel_event=cancel_event,
-                )
+                result = await _upload_url(found_url, explicit_duration, status_msg, cancel_event, chat_id, lang)
 
                 if cancel_event.is_set():
                     await status_msg.edit_text(t(lang, 'cancelled'))
@@ -632,9 +674,10 @@ async def handle_text(message: Message, state: FSMContext):
 
 # Lifecycle
 
-async def setup_webhook(token: str, webhook_url: str, proxy_base: str):
-    global bot, _proxy_base_url
+async def setup_webhook(token: str, webhook_url: str, proxy_base: str, jobs=None):
+    global bot, _proxy_base_url, _jobs
     _proxy_base_url = proxy_base
+    _jobs = jobs
     bot = Bot(token=token)
 
     # Set bot commands for quick access
@@ -658,6 +701,25 @@ async def setup_webhook(token: str, webhook_url: str, proxy_base: str):
     logger.info("Webhook set to %s", webhook_url)
 
 
+async def notify_resumed_upload(meta: dict, result: dict):
+    """Deliver the links of an upload that was resumed after a restart."""
+    chat_id = meta.get('chat_id')
+    if not bot or not chat_id:
+        return
+    lang = meta.get('lang', 'en')
+    if result.get('success'):
+        proxy_url = f"{_proxy_base_url}/api/proxy?url={result['page_url']}"
+        filename = meta.get('file_name') or result.get('filename', '')
+        await bot.send_message(
+            chat_id,
+            _links_text(lang, result['page_url'], result['direct_url'], proxy_url, filename),
+            parse_mode="MarkdownV2",
+            reply_markup=_links_keyboard(lang, result['page_url'], proxy_url),
+        )
+    elif result.get('error') != 'cancelled':
+        await bot.send_message(chat_id, f"{t(lang, 'error')} {result.get('error', t(lang, 'unknown_error'))}")
+
+
 async def teardown_webhook():
     if bot:
         await bot.delete_webhook()
@@ -1,27 +1,61 @@
 """
 GigaFile.nu async client - MEMORY-SAFE for large files (4GB+)
-Key fix: chunks are read from disk ON DEMAND inside the semaphore,
-so only UPLOAD_CONCURRENCY * CHUNK_SIZE bytes are ever in RAM.
+Key fix: chunk bodies are streamed straight from an offset/length window of
+the file (FileWindowPayload), so an in-flight chunk holds ~FILE_PAYLOAD_READ
+bytes of RAM no matter how big the chunk is.
+Chunk size and the number of parallel chunk POSTs adapt to the measured link.
 """
 import aiohttp
+import aiohttp.payload
 import asyncio
 import uuid
 import re
 import math
 import os
+import statistics
 import tempfile
+import time
 import logging
-from typing import Optional, Dict, Any, Callable, Awaitable
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Awaitable, List
 from urllib.parse import urlparse, unquote
 
+from transfer_scheduler import TransferJob, transfer_scheduler
+from spool_cache import SpoolCache, SpoolLease
+from upload_dedup import UploadDedupIndex, hash_file, new_hasher
+from upload_journal import UploadJournal
+
 logger = logging.getLogger(__name__)
 
-CHUNK_SIZE = 50 * 1024 * 1024       # 50 MB per chunk
-UPLOAD_CONCURRENCY = 4              # parallel chunk uploads (max RAM = 4 * 50MB = 200MB)
+CHUNK_SIZE = 50 * 1024 * 1024       # 50 MB per chunk (default when the link is unknown)
+MIN_CHUNK_SIZE = 10 * 1024 * 1024   # GigaFile docs: 10 MB for reliability ...
+MAX_CHUNK_SIZE = 100 * 1024 * 1024  # ... up to 100 MB for speed
+CHUNK_TARGET_SECONDS = 15           # aim for ~15s per chunk POST on a single stream
+UPLOAD_CONCURRENCY = 4              # initial parallel chunk uploads
+MAX_UPLOAD_CONCURRENCY = 8          # GigaFile allows up to 8 parallel chunk streams
+FILE_PAYLOAD_READ = 256 * 1024     # pread slice per socket write for chunk bodies
 VALID_LIFETIMES = {3, 5, 7, 14, 30, 60, 100}
 MAX_RETRIES = 3
 DOWNLOAD_READ_CHUNK = 2 * 1024 * 1024   # 2MB streaming read for downloads
 STALL_TIMEOUT = 120                 # seconds without data -> stall detected
+MAX_STALL_RETRIES = 8               # stalls resume via Range, so they get a bigger budget ...
+STALL_BACKOFF = 2                   # ... and a short linear backoff (seconds per stall)
+RESUME_MAX_AGE = 24 * 3600          # journaled uploads idle longer than this are dropped
+
+# Long-lived pooled sessions, one per purpose: (total connections, per host)
+POOL_LIMITS = {
+    'upload': (64, 4 * MAX_UPLOAD_CONCURRENCY),   # chunk POSTs to NN.gigafile.nu
+    'download': (128, 16),                         # source downloads for re-upload
+    'control': (16, 4),                            # gigafile.nu server lookup
+}
+DNS_CACHE_TTL = 300                 # seconds (aiohttp default: 10)
+KEEPALIVE_TIMEOUT = 75              # seconds an idle pooled connection is kept (aiohttp default: 15)
+PIPELINE_WINDOW = MAX_UPLOAD_CONCURRENCY + 2  # chunks spooled ahead of the uploader
+STREAM_UPLOAD_WINDOW = 3            # in-memory chunks per streamed upload (one filling, the rest uploading)
+STREAM_UPLOAD_MEMORY = 512 * 1024 * 1024  # chunk buffers of all streamed uploads together
+SEGMENT_CONNECTIONS = 8             # ranged connections per source download (Accept-Ranges: bytes)
+SEGMENT_MIN_SIZE = 16 * 1024 * 1024  # segments are never split below this size
+BATCH_PARALLELISM = 4               # URLs re-uploaded at once by upload_many_from_urls, across all batches
 
 
 def _extract_filename_from_cd(cd: str) -> Optional[str]:
@@ -42,27 +76,477 @@ def _filename_from_url(url: str) -> str:
     return unquote(name) if name else 'file'
 
 
-def _read_chunk_sync(filepath: str, chunk_no: int) -> bytes:
-    """Read one chunk from file at given position. Sync helper for run_in_executor."""
-    with open(filepath, 'rb') as f:
-        f.seek(chunk_no * CHUNK_SIZE)
-        return f.read(CHUNK_SIZE)
+def _unlink_quiet(path: Optional[str]) -> None:
+    if path and os.path.exists(path):
+        try:
+            os.unlink(path)
+        except Exception:
+            pass
+
+
+class FileWindowPayload(aiohttp.payload.Payload):
+    """
+    Multipart body part streamed from `length` bytes of `path` at `offset`.
+    The window is read with os.pread FILE_PAYLOAD_READ bytes at a time, so
+    nothing bigger than one slice is ever buffered, and every write()
+    re-reads the file - a retried POST keeps no chunk buffer alive.
+    `throttle(nbytes)` is awaited before each slice (bandwidth cap).
+    """
+
+    _autoclose = True   # the fd is opened and closed inside write()
+
+    def __init__(
+        self,
+        path: str,
+        offset: int,
+        length: int,
+        throttle: Optional[Callable[[int], Awaitable[None]]] = None,
+        **kwargs: Any,
+    ):
+        kwargs.setdefault('content_type', 'application/octet-stream')
+        super().__init__(path, **kwargs)
+        self._path = path
+        self._offset = offset
+        self._size = length
+        self._throttle = throttle
+
+    def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+        raise TypeError("FileWindowPayload holds binary file data")
+
+    async def write(self, writer) -> None:
+        await self.write_with_length(writer, None)
+
+    async def write_with_length(self, writer, content_length: Optional[int]) -> None:
+        loop = asyncio.get_running_loop()
+        remaining = self._size if content_length is None else min(self._size, content_length)
+        pos = self._offset
+        fd = await loop.run_in_executor(None, os.open, self._path, os.O_RDONLY)
+        try:
+            while remaining > 0:
+                data = await loop.run_in_executor(None, os.pread, fd, min(FILE_PAYLOAD_READ, remaining), pos)
+                if not data:
+                    raise IOError(f"{self._path} is shorter than expected at offset {pos}")
+                if self._throttle:
+                    await self._throttle(len(data))
+                await writer.write(data)
+                pos += len(data)
+                remaining -= len(data)
+        finally:
+            os.close(fd)
+
+
+class ChunkBufferPayload(aiohttp.payload.Payload):
+    """
+    Multipart body part from an in-memory chunk (upload_stream). Written in
+    FILE_PAYLOAD_READ slices so `throttle(nbytes)` can pace it like
+    FileWindowPayload; a retried POST writes the same buffer again.
+    """
+
+    def __init__(
+        self,
+        data: bytearray,
+        throttle: Optional[Callable[[int], Awaitable[None]]] = None,
+        **kwargs: Any,
+    ):
+        kwargs.setdefault('content_type', 'application/octet-stream')
+        super().__init__(data, **kwargs)
+        self._data = data
+        self._size = len(data)
+        self._throttle = throttle
+
+    def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+        raise TypeError("ChunkBufferPayload holds binary file data")
+
+    async def write(self, writer) -> None:
+        await self.write_with_length(writer, None)
+
+    async def write_with_length(self, writer, content_length: Optional[int]) -> None:
+        view = memoryview(self._data)[:self._size if content_length is None else min(self._size, content_length)]
+        for pos in range(0, len(view), FILE_PAYLOAD_READ):
+            piece = view[pos:pos + FILE_PAYLOAD_READ]
+            if self._throttle:
+                await self._throttle(len(piece))
+            await writer.write(piece)
+
+
+def _preallocate(fd: int, size: int) -> None:
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+
+def _content_range(resp: aiohttp.ClientResponse) -> Optional[tuple[int, int, Optional[int]]]:
+    """Parse `Content-Range: bytes start-end/total` -> (start, end, total or None)."""
+    m = re.match(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', resp.headers.get('Content-Range', ''))
+    if not m:
+        return None
+    return int(m.group(1)), int(m.group(2)), None if m.group(3) == '*' else int(m.group(3))
+
+
+class _SourceChanged(aiohttp.ClientPayloadError):
+    """A ranged request showed that the source is no longer the same file."""
+
+
+class _SegmentsFailed(aiohttp.ClientPayloadError):
+    """A segmented download gave up; bytes [0, prefix) of the file are complete."""
+
+    def __init__(self, prefix: int, cause: BaseException):
+        super().__init__(f"Segmented download failed after {prefix} contiguous bytes: {cause}")
+        self.prefix = prefix
+
+
+def _validator(resp: aiohttp.ClientResponse) -> Optional[str]:
+    """Strong ETag, else Last-Modified - the value usable in If-Range."""
+    etag = resp.headers.get('ETag', '')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return resp.headers.get('Last-Modified')
+
+
+def _same_source(validator: Optional[str], resp: aiohttp.ClientResponse) -> bool:
+    """Does `resp` still carry the validator taken from the first response?"""
+    if not validator:
+        return True
+    header = 'ETag' if validator.startswith('"') else 'Last-Modified'
+    return resp.headers.get(header, validator) == validator
+
+
+class _RetryBudget:
+    """
+    Separate retry budgets for one download: stalls (read timeouts) resume
+    with a Range request and get a short linear backoff, hard failures (HTTP
+    errors, resets) get MAX_RETRIES attempts with exponential backoff.
+    """
+
+    def __init__(self):
+        self.stalls = 0
+        self.failures = 0
+
+    def next_delay(self, exc: Optional[BaseException]) -> Optional[float]:
+        """Count `exc` (None = bad HTTP status); None means the budget is spent."""
+        if isinstance(exc, asyncio.TimeoutError):
+            self.stalls += 1
+            return min(STALL_BACKOFF * self.stalls, 30) if self.stalls <= MAX_STALL_RETRIES else None
+        self.failures += 1
+        return 2 ** (self.failures - 1) if self.failures < MAX_RETRIES else None
+
+    def __str__(self) -> str:
+        return f"stall {self.stalls}/{MAX_STALL_RETRIES}, failure {self.failures}/{MAX_RETRIES}"
+
+
+class _ByteBudget:
+    """
+    Bytes held by all streamed uploads of the process. acquire() waits until
+    the bytes fit; a request bigger than the whole budget is let through
+    once nothing else is held, so one huge chunk cannot wait forever.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.waits = 0
+        self.peak = 0
+        self._freed = asyncio.Event()
+
+    async def acquire(self, nbytes: int) -> None:
+        if not self._fits(nbytes):
+            self.waits += 1
+            while not self._fits(nbytes):
+                self._freed.clear()
+                await self._freed.wait()
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.used == 0 or self.used + nbytes <= self.limit
+
+    def release(self, nbytes: int) -> None:
+        self.used -= nbytes
+        self._freed.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'limit': self.limit, 'used': self.used, 'peak': self.peak, 'waits': self.waits}
+
+
+class _Segment:
+    """
+    Byte range [pos, end) of a segmented download; `end` shrinks when the
+    segment is split. `written` trails `pos`: bytes up to it are on disk.
+    """
+
+    __slots__ = ('pos', 'end', 'first', 'written', 'started')
+
+    def __init__(self, pos: int, end: int):
+        self.pos = pos
+        self.end = end
+        self.first = pos
+        self.written = pos
+        self.started = time.monotonic()
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.end - self.pos)
+
+    def eta(self) -> float:
+        rate = (self.pos - self.first) / max(time.monotonic() - self.started, 1e-3)
+        return self.remaining / rate if rate > 0 else float('inf')
+
+
+def _chunk_timing_trace() -> aiohttp.TraceConfig:
+    """
+    Trace hooks for upload sessions. Pass a dict as `trace_request_ctx` and it
+    gets 'sent' (last body write handed to the socket) and 'end' (response
+    headers received); the gap is the RTT sample for AdaptiveConcurrency.
+    """
+    async def on_chunk_sent(session, ctx, params):
+        if isinstance(ctx.trace_request_ctx, dict):
+            ctx.trace_request_ctx['sent'] = time.monotonic()
+
+    async def on_request_end(session, ctx, params):
+        if isinstance(ctx.trace_request_ctx, dict):
+            ctx.trace_request_ctx['end'] = time.monotonic()
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_chunk_sent.append(on_chunk_sent)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+def _connection_stats_trace(stats: Dict[str, int]) -> aiohttp.TraceConfig:
+    """Count new vs reused connections and DNS lookups vs cache hits into `stats`."""
+    def counter(key: str):
+        async def hook(session, ctx, params):
+            stats[key] += 1
+        return hook
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(counter('created'))
+    trace.on_connection_reuseconn.append(counter('reused'))
+    trace.on_dns_resolvehost_end.append(counter('dns_lookups'))
+    trace.on_dns_cache_hit.append(counter('dns_cache_hits'))
+    return trace
+
+
+def _choose_chunk_size(file_size: int, stream_bps: Optional[float]) -> int:
+    """
+    Pick the chunk size for one file: ~CHUNK_TARGET_SECONDS of transfer on a
+    single stream at the observed bandwidth, clamped to the documented
+    10-100 MB range. Smaller files get smaller chunks so they still spread
+    over parallel streams.
+    """
+    size = int(stream_bps * CHUNK_TARGET_SECONDS) if stream_bps else CHUNK_SIZE
+    size = min(size, MAX_CHUNK_SIZE)
+    size = min(size, file_size // UPLOAD_CONCURRENCY)
+    size = max(size, MIN_CHUNK_SIZE)
+    return size // (1024 * 1024) * (1024 * 1024)
+
+
+class AdaptiveConcurrency:
+    """
+    Limiter for the parallel chunk POSTs of one upload that adapts to the link.
+
+    Completed chunks are grouped into epochs of `limit` chunks. At the end of
+    an epoch its aggregate throughput is compared with the previous one:
+    a gain of more than GROW_GAIN repeats the last move (initially +1 stream),
+    a loss of more than SHRINK_LOSS reverses it, and an RTT inflated beyond
+    RTT_INFLATION x the best sample always drops a stream.
+    Every decision is logged so it can be compared with the static settings.
+    """
+
+    GROW_GAIN = 1.10
+    SHRINK_LOSS = 0.90
+    RTT_INFLATION = 2.0
+
+    def __init__(self, label: str, chunk_size: int, initial: int = UPLOAD_CONCURRENCY):
+        self.label = label
+        self.chunk_size = chunk_size
+        self.maximum = MAX_UPLOAD_CONCURRENCY
+        self.limit = max(1, min(initial, self.maximum))
+        self.stream_bps: Optional[float] = None   # EWMA of per-stream throughput
+        self.min_rtt: Optional[float] = None
+        self.total_bytes = 0
+        self._started = time.monotonic()
+        self._active = 0
+        self._cond = asyncio.Condition()
+        self._last_move = 1
+        self._prev_rate: Optional[float] = None
+        self._epoch_start = self._started
+        self._epoch_bytes = 0
+        self._epoch_chunks = 0
+        self._epoch_rtts: list[float] = []
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    async def record(self, nbytes: int, elapsed: float, rtt: Optional[float] = None) -> None:
+        """Feed one completed chunk POST into the controller."""
+        sample = nbytes / max(elapsed, 1e-3)
+        self.stream_bps = sample if self.stream_bps is None else 0.7 * self.stream_bps + 0.3 * sample
+        self.total_bytes += nbytes
+        if rtt is not None:
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            self._epoch_rtts.append(rtt)
+        self._epoch_bytes += nbytes
+        self._epoch_chunks += 1
+        if self._epoch_chunks < self.limit:
+            return
+
+        now = time.monotonic()
+        rate = self._epoch_bytes / max(now - self._epoch_start, 1e-3)
+        rtt_now = statistics.median(self._epoch_rtts) if self._epoch_rtts else None
+        inflated = bool(rtt_now and self.min_rtt and rtt_now > self.RTT_INFLATION * self.min_rtt)
+
+        if inflated:
+            move, reason = -1, 'rtt inflated'
+        elif self._prev_rate is None:
+            move, reason = 1, 'probe'
+        elif rate > self._prev_rate * self.GROW_GAIN:
+            move, reason = self._last_move, 'throughput up'
+        elif rate < self._prev_rate * self.SHRINK_LOSS:
+            move, reason = -self._last_move, 'throughput down'
+        else:
+            move, reason = 0, 'plateau'
+
+        old = self.limit
+        self.limit = max(1, min(self.maximum, self.limit + move))
+        if self.limit != old:
+            self._last_move = move
+        logger.info(
+            "[%s] concurrency %d -> %d (%s): %.1f MB/s aggregate, %.1f MB/s per stream, rtt %s (min %s)",
+            self.label, old, self.limit, reason, rate / 1e6, self.stream_bps / 1e6,
+            f"{rtt_now * 1000:.0f}ms" if rtt_now is not None else '-',
+            f"{self.min_rtt * 1000:.0f}ms" if self.min_rtt is not None else '-',
+        )
+
+        self._prev_rate = rate
+        self._epoch_start = now
+        self._epoch_bytes = 0
+        self._epoch_chunks = 0
+        self._epoch_rtts = []
+        async with self._cond:
+            self._cond.notify_all()
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self._started, 1e-3)
+        return (
+            f"{self.total_bytes / 1e6:.0f} MB in {elapsed:.1f}s ({self.total_bytes / elapsed / 1e6:.1f} MB/s), "
+            f"chunk {self.chunk_size // (1024 * 1024)} MB, final concurrency {self.limit} "
+            f"(static: {UPLOAD_CONCURRENCY} x {CHUNK_SIZE // (1024 * 1024)} MB)"
+        )
 
 
 class GigaFileClient:
     def __init__(self):
         self._server_cache: str | None = None
         self._server_cache_ts: float = 0
+        self._server_lookup: Optional[asyncio.Future] = None
+        # Global limit for batch URL re-uploads (upload_many_from_urls); the semaphore is created on first use
+        self.batch_parallelism = BATCH_PARALLELISM
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        # Memory of all upload_stream() chunk buffers together; created on first use like the batch slots
+        self.stream_memory = STREAM_UPLOAD_MEMORY
+        self._stream_buffers: Optional[_ByteBudget] = None
+        # server -> (per-stream bytes/s, last concurrency) learned from previous uploads
+        self._link_stats: Dict[str, tuple[float, int]] = {}
+        # Optional persistent journal (upload_journal.py) that makes uploads resumable
+        self.journal: Optional[UploadJournal] = None
+        # Optional content-hash index (upload_dedup.py): identical files reuse earlier links
+        self.dedup: Optional[UploadDedupIndex] = None
+        # Optional disk cache of downloaded URL sources (spool_cache.py)
+        self.spool_cache: Optional[SpoolCache] = None
+        self._active_tokens: set[str] = set()
+        # Pooled sessions (see POOL_LIMITS) and per-upload cookies for the shared upload pool
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._pool_stats: Dict[str, Dict[str, int]] = {}
+        self._upload_cookies: Dict[str, Dict[str, str]] = {}
+
+    def _session(self, purpose: str) -> aiohttp.ClientSession:
+        """
+        Long-lived pooled session for 'upload', 'download' or 'control' traffic,
+        created lazily and kept until close(). Keep-alive connections and the
+        DNS cache are reused across jobs, so TLS handshakes to gigafile.nu and
+        NN.gigafile.nu stay rare; connection_stats() shows how rare.
+        """
+        session = self._sessions.get(purpose)
+        if session is not None and not session.closed:
+            return session
+        limit, per_host = POOL_LIMITS[purpose]
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=per_host,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ssl=False if purpose == 'download' else True,
+        )
+        stats = self._pool_stats.setdefault(
+            purpose, {'created': 0, 'reused': 0, 'dns_lookups': 0, 'dns_cache_hits': 0}
+        )
+        traces = [_connection_stats_trace(stats)]
+        if purpose == 'upload':
+            traces.append(_chunk_timing_trace())
+        # Upload cookies are kept per token (_upload_cookies), not in the shared jar
+        cookie_jar = aiohttp.DummyCookieJar() if purpose == 'upload' else None
+        session = aiohttp.ClientSession(connector=connector, trace_configs=traces, cookie_jar=cookie_jar)
+        self._sessions[purpose] = session
+        return session
+
+    async def close(self) -> None:
+        """Close the pooled sessions (FastAPI lifespan shutdown)."""
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+    def stream_stats(self) -> Optional[Dict[str, Any]]:
+        """Memory budget of upload_stream() chunk buffers (None before the first streamed upload)."""
+        return self._stream_buffers.stats() if self._stream_buffers else None
+
+    def connection_stats(self) -> Dict[str, Dict[str, Any]]:
+        """New vs reused connections per pool; a high reuse ratio means few handshakes."""
+        result = {}
+        for purpose, stats in self._pool_stats.items():
+            total = stats['created'] + stats['reused']
+            result[purpose] = dict(stats, reuse_ratio=round(stats['reused'] / total, 3) if total else None)
+        return result
+
+    def _new_controller(self, server: str, filename: str, file_size: int) -> AdaptiveConcurrency:
+        stream_bps, limit = self._link_stats.get(server, (None, UPLOAD_CONCURRENCY))
+        chunk_size = _choose_chunk_size(file_size, stream_bps)
+        logger.info(
+            "[%s] chunk size %d MB for %.1f MB file on %s (stream estimate %s)",
+            filename, chunk_size // (1024 * 1024), file_size / (1024 * 1024), server,
+            f"{stream_bps / 1e6:.1f} MB/s" if stream_bps else 'none',
+        )
+        return AdaptiveConcurrency(filename, chunk_size, initial=limit)
+
+    def _remember_link(self, server: str, controller: AdaptiveConcurrency) -> None:
+        if controller.stream_bps:
+            self._link_stats[server] = (controller.stream_bps, controller.limit)
+        logger.info("[%s] upload finished: %s", controller.label, controller.summary())
 
     async def get_server(self) -> str:
-        import time
         now = time.monotonic()
         if self._server_cache and (now - self._server_cache_ts) < 300:
             return self._server_cache
+        # Concurrent callers on a cold cache (e.g. a batch starting) share one lookup
+        if self._server_lookup is None:
+            self._server_lookup = asyncio.ensure_future(self._lookup_server())
+            self._server_lookup.add_done_callback(lambda _: setattr(self, '_server_lookup', None))
+        return await asyncio.shield(self._server_lookup)
+
+    async def _lookup_server(self) -> str:
+        now = time.monotonic()
         timeout = aiohttp.ClientTimeout(total=15, sock_connect=10, sock_read=10)
-        async with aiohttp.ClientSession() as s:
-            async with s.get('https://gigafile.nu/', timeout=timeout) as resp:
-                text = await resp.text()
+        async with self._session('control').get('https://gigafile.nu/', timeout=timeout) as resp:
+            text = await resp.text()
         m = re.search(r'var server\s*=\s*"(.+?)"', text)
         if not m:
             raise RuntimeError("Failed to find GigaFile server")
@@ -76,28 +560,53 @@ class GigaFileClient:
         server: str,
         token: str,
         filename: str,
-        chunk_data: bytes,
+        filepath: str,
+        offset: int,
+        length: int,
         chunk_no: int,
         total_chunks: int,
         lifetime: int,
+        controller: Optional[AdaptiveConcurrency] = None,
+        job: Optional[TransferJob] = None,
+        data: Optional[bytearray] = None,
     ) -> dict:
+        """POST one chunk: `length` bytes of `filepath` at `offset`, or the in-memory `data`."""
+        throttle = (lambda n: job.throttle('upload', n)) if job else None
         for attempt in range(MAX_RETRIES):
             try:
+                timing: dict = {}
                 form = aiohttp.FormData()
                 form.add_field('id', token)
                 form.add_field('name', filename)
                 form.add_field('chunk', str(chunk_no))
                 form.add_field('chunks', str(total_chunks))
                 form.add_field('lifetime', str(lifetime))
-                form.add_field('file', chunk_data, filename='blob', content_type='application/octet-stream')
+                # Fresh payload per attempt: a retry re-reads the file window
+                if data is not None:
+                    payload = ChunkBufferPayload(data, throttle)
+                else:
+                    payload = FileWindowPayload(filepath, offset, length, throttle)
+                form.add_field('file', payload, filename='blob')
                 timeout = aiohttp.ClientTimeout(total=600, sock_connect=30, sock_read=300)
-                async with session.post(
-                    f'https://{server}/upload_chunk.php',
-                    data=form,
-                    timeout=timeout,
-                ) as resp:
-                    result = await resp.json()
-                    return result
+                # Global slot: time spent queued for it is not part of the link sample
+                async with job.slot('upload') if job else nullcontext():
+                    started = time.monotonic()
+                    async with session.post(
+                        f'https://{server}/upload_chunk.php',
+                        data=form,
+                        timeout=timeout,
+                        cookies=self._upload_cookies.get(token),
+                        trace_request_ctx=timing,
+                    ) as resp:
+                        if resp.cookies:
+                            self._upload_cookies.setdefault(token, {}).update(
+                                (k, morsel.value) for k, morsel in resp.cookies.items()
+                            )
+                        result = await resp.json()
+                if controller:
+                    rtt = timing['end'] - timing['sent'] if 'sent' in timing and 'end' in timing else None
+                    await controller.record(length, time.monotonic() - started, rtt)
+                return result
             except Exception as e:
                 logger.warning("Chunk %d/%d attempt %d failed: %s", chunk_no + 1, total_chunks, attempt + 1, e)
                 if attempt == MAX_RETRIES - 1:
@@ -116,61 +625,204 @@ class GigaFileClient:
         lifetime: int,
         progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
         cancel_event: Optional[asyncio.Event] = None,
+        controller: Optional[AdaptiveConcurrency] = None,
+        done: Optional[set[int]] = None,
+        on_chunk: Optional[Callable[[int, Optional[str]], Awaitable[None]]] = None,
+        job: Optional[TransferJob] = None,
     ) -> Optional[str]:
         """
         MEMORY-SAFE chunk uploader.
-        Reads chunks from DISK inside the semaphore, so max RAM used
-        = UPLOAD_CONCURRENCY * CHUNK_SIZE (4 * 50MB = ~200MB) regardless of file size.
+        Chunk bodies are streamed from DISK windows inside the adaptive limiter,
+        so each in-flight chunk holds ~FILE_PAYLOAD_READ bytes regardless of size.
+        Chunks in `done` (already accepted, e.g. before a restart) are skipped;
+        `on_chunk(chunk_no, url)` is awaited after every accepted chunk.
         """
+        if controller is None:
+            controller = AdaptiveConcurrency(filename, CHUNK_SIZE)
+        chunk_size = controller.chunk_size
+        file_size = os.path.getsize(filepath)
+        done = done or set()
         result_url: Optional[str] = None
-        completed = 0
+        completed = len(done)
         lock = asyncio.Lock()
 
+        def window(chunk_no: int) -> tuple[int, int]:
+            offset = chunk_no * chunk_size
+            return offset, max(0, min(chunk_size, file_size - offset))
+
         # GigaFile requires first chunk to be uploaded first (establishes session)
-        loop = asyncio.get_event_loop()
-        first_chunk = await loop.run_in_executor(None, _read_chunk_sync, filepath, 0)
-        try:
-            r = await self._upload_chunk(session, server, token, filename, first_chunk, 0, total_chunks, lifetime)
-        finally:
-            del first_chunk  # free immediately
-        if 'url' in r:
-            result_url = r['url']
-        completed = 1
-        if progress_cb and total_chunks > 0:
-            await progress_cb('upload', min(99, int(completed * 100 / total_chunks)))
-
-        if total_chunks == 1:
-            return result_url
+        if 0 not in done:
+            r = await self._upload_chunk(
+                session, server, token, filename, filepath, *window(0), 0, total_chunks, lifetime, controller, job
+            )
+            if 'url' in r:
+                result_url = r['url']
+            completed += 1
+            if on_chunk:
+                await on_chunk(0, r.get('url'))
+            if progress_cb and total_chunks > 0:
+                await progress_cb('upload', min(99, int(completed * 100 / total_chunks)))
 
-        # Remaining chunks - semaphore limits concurrency AND memory usage
-        sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        remaining = [i for i in range(1, total_chunks) if i not in done]
+        if not remaining:
+            return result_url
 
+        # Remaining chunks - the adaptive limiter bounds concurrency
         async def upload_one(chunk_no: int):
             nonlocal result_url, completed
             if cancel_event and cancel_event.is_set():
                 return
-            async with sem:
+            async with controller:
                 if cancel_event and cancel_event.is_set():
                     return
-                # Read chunk from disk INSIDE the semaphore (memory-safe)
-                chunk_data = await loop.run_in_executor(None, _read_chunk_sync, filepath, chunk_no)
-                try:
-                    r = await self._upload_chunk(session, server, token, filename, chunk_data, chunk_no, total_chunks, lifetime)
-                finally:
-                    del chunk_data  # free immediately after upload
+                r = await self._upload_chunk(
+                    session, server, token, filename, filepath, *window(chunk_no),
+                    chunk_no, total_chunks, lifetime, controller, job
+                )
 
                 if 'url' in r:
                     result_url = r['url']
+                if on_chunk:
+                    await on_chunk(chunk_no, r.get('url'))
                 async with lock:
                     completed += 1
                     if progress_cb:
                         pct = min(99, int(completed * 100 / total_chunks))
                         await progress_cb('upload', pct)
 
-        tasks = [asyncio.create_task(upload_one(i)) for i in range(1, total_chunks)]
+        tasks = [asyncio.create_task(upload_one(i)) for i in remaining]
         await asyncio.gather(*tasks)
         return result_url
 
+    async def _download_segmented(
+        self,
+        session: aiohttp.ClientSession,
+        resp: aiohttp.ClientResponse,
+        fd: int,
+        size: int,
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        job: Optional[TransferJob] = None,
+    ) -> int:
+        """
+        aria2-style download of `size` bytes into the preallocated `fd` over up
+        to SEGMENT_CONNECTIONS connections, written with os.pwrite.
+        The already open 200 response `resp` is the first segment and covers
+        the whole file until it is split. Whenever a connection is free, the
+        segment with the longest ETA is cut in half and the back half is
+        fetched with a ranged GET, so slow segments are rebalanced onto fast
+        connections. Ranged requests carry If-Range, and a reply that is not a
+        matching 206 fails the download. Returns the number of bytes written;
+        when a segment runs out of retries, _SegmentsFailed tells the caller
+        how much of the file is complete from byte 0, so it can resume there.
+        """
+        loop = asyncio.get_running_loop()
+        url = str(resp.url)
+        validator = _validator(resp)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=STALL_TIMEOUT)
+        segments: list[_Segment] = []
+        failures: list[BaseException] = []
+        written = 0
+
+        def split() -> Optional[_Segment]:
+            live = [seg for seg in segments if seg.remaining >= 2 * SEGMENT_MIN_SIZE]
+            if not live:
+                return None
+            slow = max(live, key=lambda seg: (seg.eta(), seg.remaining))
+            mid = slow.pos + slow.remaining // 2
+            seg = _Segment(mid, slow.end)
+            slow.end = mid
+            segments.append(seg)
+            return seg
+
+        def stopped() -> bool:
+            return bool(failures) or bool(cancel_event and cancel_event.is_set())
+
+        async def pump(seg: _Segment, r: aiohttp.ClientResponse) -> None:
+            nonlocal written
+            async for data in r.content.iter_chunked(DOWNLOAD_READ_CHUNK):
+                if stopped():
+                    return
+                take = min(len(data), seg.end - seg.pos)
+                if take > 0:
+                    at = seg.pos
+                    seg.pos += take      # claim the bytes before awaiting so split() sees them
+                    if job:
+                        await job.throttle('download', take)
+                    await loop.run_in_executor(None, os.pwrite, fd, memoryview(data)[:take], at)
+                    seg.written = at + take
+                    written += take
+                    if progress_cb:
+                        await progress_cb('download', min(99, int(written * 100 / size)))
+                if seg.pos >= seg.end:
+                    return
+            if seg.pos < seg.end:
+                raise aiohttp.ClientPayloadError(f"Segment ended early at byte {seg.pos} of {seg.end}")
+
+        async def fetch(seg: _Segment, slot_held: bool) -> None:
+            for attempt in range(MAX_RETRIES):
+                if stopped() or seg.remaining == 0:
+                    return
+                headers = {'Range': f'bytes={seg.pos}-{seg.end - 1}'}
+                if validator:
+                    headers['If-Range'] = validator
+                try:
+                    async with (job.slot('download') if job and not slot_held else nullcontext()), \
+                            session.get(url, headers=headers, timeout=timeout) as r:
+                        cr = _content_range(r) if r.status == 206 else None
+                        if cr is None or cr[0] != seg.pos or cr[2] not in (None, size):
+                            raise _SourceChanged(
+                                f"Ranged request got HTTP {r.status} {r.headers.get('Content-Range')}"
+                            )
+                        await pump(seg, r)
+                    return
+                except _SourceChanged:
+                    raise
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    logger.warning("Segment at %d attempt %d failed: %s", seg.pos, attempt + 1, e)
+                    if attempt == MAX_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+
+        async def worker(seg: Optional[_Segment], first: bool = False) -> None:
+            try:
+                if first:
+                    try:
+                        await pump(seg, resp)
+                    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                        logger.warning("First segment failed at byte %d: %s - continuing with a ranged request", seg.pos, e)
+                    if not resp.content.at_eof():
+                        resp.close()     # stream was cut short by a split - drop the connection
+                # The first worker keeps the caller's slot for its later segments
+                while seg is not None and not stopped():
+                    await fetch(seg, slot_held=first)
+                    seg = split()
+            except Exception as e:
+                failures.append(e)
+
+        head = _Segment(0, size)
+        segments.append(head)
+        tasks = [asyncio.create_task(worker(head, first=True))]
+        for _ in range(SEGMENT_CONNECTIONS - 1):
+            seg = split()
+            if seg is None:
+                break
+            tasks.append(asyncio.create_task(worker(seg)))
+        logger.info("Segmented download of %s: %d bytes over %d connections", url, size, len(tasks))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if failures:
+            if isinstance(failures[0], _SourceChanged):
+                raise failures[0]
+            # Every byte before the first gap is on disk: the earliest write position of an unfinished segment
+            prefix = min((seg.written for seg in segments if seg.written < seg.end), default=size)
+            raise _SegmentsFailed(prefix, failures[0]) from failures[0]
+        return written
+
     async def _download_with_retry(
         self,
         url: str,
@@ -178,76 +830,405 @@ class GigaFileClient:
         progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
         cancel_event: Optional[asyncio.Event] = None,
         session: Optional[aiohttp.ClientSession] = None,
-    ) -> tuple[str, int]:
-        """Stream-download file to disk. Returns (filename, bytes_written)."""
+        job: Optional[TransferJob] = None,
+    ) -> tuple[str, int, Optional[str]]:
+        """
+        Stream-download file to disk. Returns (filename, bytes_written, sha256),
+        the digest being None when the download did not complete.
+        A retry asks for `Range: bytes=<written>-` (with If-Range) and appends;
+        the file is only restarted from byte 0 when the source answers with a
+        full body or its validators no longer match.
+        """
         filename = _filename_from_url(url) or 'file'
+        session = session or self._session('download')
+        slot = (lambda: job.slot('download')) if job else nullcontext
+        retries = _RetryBudget()
+        downloaded = 0
+        total_size = 0
+        validator: Optional[str] = None
+        hasher = new_hasher()
+        rehash = False          # the file starts with bytes of a segmented attempt the hasher has not seen
 
-        for attempt in range(MAX_RETRIES):
+        while True:
             try:
                 timeout = aiohttp.ClientTimeout(
                     total=7200,
                     sock_connect=30,
                     sock_read=STALL_TIMEOUT,
                 )
-                own_session = session is None
-                if own_session:
-                    connector = aiohttp.TCPConnector(ssl=False, limit=0, force_close=False)
-                    session = aiohttp.ClientSession(connector=connector)
-
-                try:
-                    async with session.get(url, allow_redirects=True, timeout=timeout) as resp:
-                        if resp.status != 200:
-                            if attempt < MAX_RETRIES - 1:
-                                logger.warning("Download attempt %d: HTTP %d, retrying...", attempt + 1, resp.status)
-                                await asyncio.sleep(2 ** attempt)
-                                continue
-                            return filename, 0
+                headers = {}
+                if downloaded:
+                    headers['Range'] = f'bytes={downloaded}-'
+                    if validator:
+                        headers['If-Range'] = validator
+                async with slot(), session.get(url, allow_redirects=True, timeout=timeout, headers=headers) as resp:
+                    if resp.status not in (200, 206) or (resp.status == 206 and not downloaded):
+                        delay = retries.next_delay(None)
+                        if delay is None:
+                            return filename, 0, None
+                        logger.warning("Download %s: HTTP %d, retrying...", retries, resp.status)
+                        await asyncio.sleep(delay)
+                        continue
 
+                    if resp.status == 206:
+                        cr = _content_range(resp)
+                        if cr is None or cr[0] != downloaded or cr[2] not in (None, total_size or cr[2]) \
+                                or not _same_source(validator, resp):
+                            # Not the same file any more - next request fetches it whole
+                            logger.warning("Download resume rejected (%s) - restarting from 0",
+                                           resp.headers.get('Content-Range'))
+                            downloaded = 0
+                            raise aiohttp.ClientPayloadError("Source changed during download")
+                        logger.info("Resuming download at byte %d", downloaded)
+                        mode = 'r+b'
+                    else:
+                        if downloaded:
+                            logger.warning("Source sent the full body instead of a range - restarting from 0")
+                            downloaded = 0
                         cd = resp.headers.get('Content-Disposition', '')
                         fn = _extract_filename_from_cd(cd)
                         if fn:
                             filename = fn
-
                         total_size = int(resp.headers.get('Content-Length', 0))
-                        downloaded = 0
-
-                        # Stream to disk - never keeps more than DOWNLOAD_READ_CHUNK in RAM
-                        with open(tmp_path, 'wb') as f:
-                            async for chunk in resp.content.iter_chunked(DOWNLOAD_READ_CHUNK):
-                                if cancel_event and cancel_event.is_set():
-                                    return filename, downloaded
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                if progress_cb and total_size > 0:
-                                    pct = min(99, int(downloaded * 100 / total_size))
-                                    await progress_cb('download', pct)
-                                elif progress_cb and downloaded > 0:
-                                    mb = downloaded / (1024 * 1024)
-                                    pct = min(95, int(mb) % 96)
-                                    await progress_cb('download', pct)
-
-                        if progress_cb:
-                            await progress_cb('download', 100)
-                        return filename, downloaded
-                finally:
-                    if own_session and session:
-                        await session.close()
-                        session = None
-
-            except asyncio.TimeoutError:
-                logger.warning("Download attempt %d timed out (stall)", attempt + 1)
-                if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(2 ** attempt)
-                    continue
-                raise
-            except aiohttp.ClientError as e:
-                logger.warning("Download attempt %d failed: %s", attempt + 1, e)
-                if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(2 ** attempt)
-                    continue
-                raise
+                        validator = _validator(resp)
+                        hasher = new_hasher()
+                        rehash = False
+                        mode = 'wb'
+
+                        if resp.headers.get('Accept-Ranges', '').lower() == 'bytes' \
+                                and total_size >= 2 * SEGMENT_MIN_SIZE \
+                                and resp.headers.get('Content-Encoding', 'identity').lower() == 'identity':
+                            fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+                            try:
+                                _preallocate(fd, total_size)
+                                written = await self._download_segmented(
+                                    session, resp, fd, total_size, progress_cb, cancel_event, job
+                                )
+                            except _SegmentsFailed as e:
+                                # The retry continues on one connection after the complete prefix
+                                downloaded = e.prefix
+                                rehash = True
+                                raise
+                            finally:
+                                os.close(fd)
+                            if cancel_event and cancel_event.is_set():
+                                return filename, written, None
+                            if progress_cb:
+                                await progress_cb('download', 100)
+                            # Segments land out of order - hash the finished file instead
+                            return filename, written, await hash_file(tmp_path)
+
+                    # Stream to disk - never keeps more than DOWNLOAD_READ_CHUNK in RAM
+                    with open(tmp_path, mode) as f:
+                        f.seek(downloaded)
+                        f.truncate()
+                        async for chunk in resp.content.iter_chunked(DOWNLOAD_READ_CHUNK):
+                            if cancel_event and cancel_event.is_set():
+                                return filename, downloaded, None
+                            if job:
+                                await job.throttle('download', len(chunk))
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            downloaded += len(chunk)
+                            if progress_cb and total_size > 0:
+                                pct = min(99, int(downloaded * 100 / total_size))
+                                await progress_cb('download', pct)
+                            elif progress_cb and downloaded > 0:
+                                mb = downloaded / (1024 * 1024)
+                                pct = min(95, int(mb) % 96)
+                                await progress_cb('download', pct)
+
+                    if total_size and downloaded < total_size:
+                        raise aiohttp.ClientPayloadError(f"Body ended early ({downloaded} of {total_size} bytes)")
+                    if progress_cb:
+                        await progress_cb('download', 100)
+                    return filename, downloaded, await hash_file(tmp_path) if rehash else hasher.hexdigest()
+
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                delay = retries.next_delay(e)
+                if delay is None:
+                    raise
+                logger.warning("Download %s failed at byte %d: %s", retries, downloaded, e or type(e).__name__)
+                await asyncio.sleep(delay)
+
+    async def _upload_from_url_pipelined(
+        self,
+        session: aiohttp.ClientSession,
+        up_session: aiohttp.ClientSession,
+        url: str,
+        entry: Dict[str, Any],
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        job: Optional[TransferJob] = None,
+        cache_lease: Optional[SpoolLease] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Download -> upload pipeline.
+        Every chunk-sized piece of the source is spooled to its own temp file and
+        handed to the chunk uploader as soon as it is complete, so the transfer
+        takes ~max(download, upload) and at most PIPELINE_WINDOW chunks are on
+        disk at any time.
+
+        `entry` carries token/server/lifetime; a journal entry with
+        `total_chunks` set is a resume - its chunk size is reused and chunks in
+        `completed` are read past without being uploaded again.
+
+        With `cache_lease` (this request owns that spool cache download) the
+        source is written to a single cache file instead, chunks are uploaded
+        from windows of it, and the file is committed to the cache once the
+        download is complete - also when a chunk upload failed on the way, so
+        a retry uploads from disk.
+
+        GigaFile needs the `chunks` count up front, so sources without a usable
+        Content-Length return None and the caller falls back to a full spool.
+        """
+        server, token, lifetime = entry['server'], entry['token'], entry['lifetime']
+        resuming = 'total_chunks' in entry
+        filename = entry.get('filename') or _filename_from_url(url) or 'file'
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=STALL_TIMEOUT)
+
+        file_size: Optional[int] = None
+        total_chunks = 0
+        done = set(entry.get('completed', []))
+        chunk_no = 0                    # next chunk to spool (all before it are handed off)
+        skipped = 0                     # bytes of an already-uploaded chunk read past so far
+        result_url: Optional[str] = entry.get('url')
+        completed = len(done)
+        failures: list[BaseException] = []
+        tasks: list[asyncio.Task] = []
+        window = asyncio.Semaphore(PIPELINE_WINDOW)
+        controller: Optional[AdaptiveConcurrency] = None
+        chunk_size = CHUNK_SIZE
+        first_done = asyncio.Event()
+        if 0 in done:
+            first_done.set()
+        on_chunk = self._journal_hook(token)
+        spool_f = None
+        spool_path: Optional[str] = None
+        cache_f = None
+        cache_path: Optional[str] = None
+        # Content hash over the stream; lost (None) if a ranged resume leaves a gap
+        hasher = new_hasher()
+        hashed_to = 0
+
+        def chunk_len(no: int) -> int:
+            return min(chunk_size, file_size - no * chunk_size)
+
+        async def upload_spooled(no: int, path: str, offset: int, length: int):
+            nonlocal result_url, completed
+            try:
+                # GigaFile requires first chunk to be uploaded first (establishes session)
+                if no > 0:
+                    await first_done.wait()
+                if failures or (cancel_event and cancel_event.is_set()):
+                    return
+                async with controller:
+                    r = await self._upload_chunk(
+                        up_session, server, token, filename, path, offset, length, no, total_chunks, lifetime,
+                        controller, job,
+                    )
+                if 'url' in r:
+                    result_url = r['url']
+                completed += 1
+                await on_chunk(no, r.get('url'))
+                if progress_cb:
+                    await progress_cb('upload', min(99, int(completed * 100 / total_chunks)))
+            except Exception as e:
+                failures.append(e)
+            finally:
+                if no == 0:
+                    first_done.set()
+                if path != cache_path:
+                    _unlink_quiet(path)
+                window.release()
+
+        def drop_partial_spool():
+            nonlocal spool_f, spool_path
+            if spool_f is cache_f and cache_f is not None:
+                cache_f.seek(chunk_no * chunk_size)
+                cache_f.truncate()
+                window.release()
+            elif spool_f is not None:
+                spool_f.close()
+                _unlink_quiet(spool_path)
+                window.release()
+            spool_f, spool_path = None, None
+
+        self._active_tokens.add(token)
+        try:
+            retries = _RetryBudget()
+            validator = entry.get('source_validator')
+            if resuming:
+                chunk_size = entry['chunk_size']
+                total_chunks = entry['total_chunks']
+            while True:
+                # Ask only for what is not handed off yet (leading done chunks included)
+                while skipped == 0 and chunk_no < total_chunks and chunk_no in done:
+                    chunk_no += 1
+                offset = chunk_no * chunk_size
+                headers = {}
+                if offset:
+                    headers['Range'] = f'bytes={offset}-'
+                    if validator:
+                        headers['If-Range'] = validator
+                try:
+                    async with (job.slot('download') if job else nullcontext()), \
+                            session.get(url, allow_redirects=True, timeout=timeout, headers=headers) as resp:
+                        ranged = offset > 0 and resp.status == 206
+                        if resp.status != 200 and not ranged:
+                            delay = retries.next_delay(None)
+                            logger.warning("Download %s: HTTP %d", retries, resp.status)
+                            if delay is None:
+                                return {'success': False, 'error': f'Download failed - HTTP {resp.status}'}
+                            await asyncio.sleep(delay)
+                            continue
 
-        return filename, 0
+                        encoding = resp.headers.get('Content-Encoding', 'identity').lower()
+                        if ranged:
+                            cr = _content_range(resp)
+                            if cr is None or cr[0] != offset:
+                                raise RuntimeError(f"Unexpected Content-Range {resp.headers.get('Content-Range')}")
+                            size = cr[2] if cr[2] is not None else entry.get('file_size')
+                        else:
+                            size = resp.content_length
+                        if file_size is None:
+                            if not size or encoding != 'identity':
+                                return None
+                            if resuming and (size != entry['file_size'] or not _same_source(validator, resp)):
+                                await self._journal('finish', token)
+                                return {'success': False, 'error': 'Source changed since the upload started'}
+                            file_size = size
+                            if job:
+                                job.set_size(file_size)
+                            if not resuming:
+                                fn = _extract_filename_from_cd(resp.headers.get('Content-Disposition', ''))
+                                if fn:
+                                    filename = fn
+                                validator = _validator(resp)
+                                controller = self._new_controller(server, filename, file_size)
+                                entry.update(
+                                    filename=filename, chunk_size=controller.chunk_size, file_size=file_size,
+                                    total_chunks=max(1, math.ceil(file_size / controller.chunk_size)), completed=[],
+                                    source_validator=validator,
+                                )
+                                await self._journal('start', entry)
+                            else:
+                                controller = self._resume_controller(entry)
+                            chunk_size = entry['chunk_size']
+                            total_chunks = entry['total_chunks']
+                            if cache_lease and SpoolCache.key(url, resp.headers) == cache_lease.key:
+                                cache_path = self.spool_cache.path(cache_lease, file_size)
+                                cache_f = open(cache_path, 'wb')
+                            elif cache_lease:
+                                # GET validators differ from the HEAD probe - do not cache
+                                self.spool_cache.abort(cache_lease)
+                        elif size != file_size or encoding != 'identity' or not _same_source(validator, resp):
+                            raise RuntimeError("Source changed between download attempts")
+
+                        # A ranged reply starts at `offset`; a full body is read past up to it
+                        if ranged:
+                            logger.info("Resuming source download at byte %d (chunk %d)", offset, chunk_no)
+                        pos = offset if ranged else 0
+                        async for data in resp.content.iter_chunked(DOWNLOAD_READ_CHUNK):
+                            if cancel_event and cancel_event.is_set():
+                                await self._journal('finish', token)
+                                return {'success': False, 'error': 'cancelled'}
+                            if failures and cache_f is None:
+                                # (With a cache file the download goes on: the retry uploads from it)
+                                raise failures[0]
+                            if job:
+                                await job.throttle('download', len(data))
+                            if hasher is not None:
+                                if pos > hashed_to:
+                                    hasher = None
+                                elif pos + len(data) > hashed_to:
+                                    hasher.update(memoryview(data)[hashed_to - pos:])
+                                    hashed_to = pos + len(data)
+                            if pos + len(data) <= offset:
+                                pos += len(data)
+                                continue
+                            view = memoryview(data)[max(0, offset - pos):]
+                            pos += len(data)
+                            while view:
+                                if chunk_no in done:
+                                    # Accepted by GigaFile before a restart - read past it
+                                    take = min(len(view), chunk_len(chunk_no) - skipped)
+                                    skipped += take
+                                    view = view[take:]
+                                    if skipped == chunk_len(chunk_no):
+                                        chunk_no += 1
+                                        skipped = 0
+                                    continue
+                                if spool_f is None:
+                                    # Bounded window: wait here until the uploader frees a slot
+                                    await window.acquire()
+                                    if cache_f is not None:
+                                        spool_f, spool_path = cache_f, cache_path
+                                    else:
+                                        fd, spool_path = tempfile.mkstemp(prefix='gf_chunk_')
+                                        spool_f = os.fdopen(fd, 'wb')
+                                # Chunk spools start at 0, the cache file holds the whole source
+                                start = chunk_no * chunk_size if spool_f is cache_f else 0
+                                take = min(len(view), chunk_len(chunk_no) - (spool_f.tell() - start))
+                                spool_f.write(view[:take])
+                                view = view[take:]
+                                if spool_f.tell() - start == chunk_len(chunk_no):
+                                    if spool_f is cache_f:
+                                        spool_f.flush()
+                                    else:
+                                        spool_f.close()
+                                    tasks.append(asyncio.create_task(
+                                        upload_spooled(chunk_no, spool_path, start, chunk_len(chunk_no))
+                                    ))
+                                    spool_f, spool_path = None, None
+                                    chunk_no += 1
+
+                        if chunk_no != total_chunks:
+                            raise aiohttp.ClientPayloadError(f"Source ended early ({pos} of {file_size} bytes)")
+                        if cache_f is not None:
+                            cache_f.close()
+                            cache_f = None
+                            self.spool_cache.commit(
+                                cache_lease, filename,
+                                hasher.hexdigest() if hasher is not None and hashed_to == file_size else None,
+                            )
+                        break
+
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    if failures:
+                        raise failures[0]
+                    drop_partial_spool()
+                    skipped = 0
+                    delay = retries.next_delay(e)
+                    logger.warning("Pipelined download %s failed at chunk %d: %s", retries, chunk_no, e or type(e).__name__)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+
+            await asyncio.gather(*tasks)
+            if failures:
+                raise failures[0]
+            await self._journal('finish', token)
+            if cancel_event and cancel_event.is_set():
+                return {'success': False, 'error': 'cancelled'}
+            self._remember_link(server, controller)
+            if progress_cb:
+                await progress_cb('upload', 100)
+            result = self._build_result(result_url, server, filename)
+            if hasher is not None and hashed_to == file_size:
+                entry['content_hash'] = hasher.hexdigest()
+                await self._dedup_record(entry, result)
+            return result
+
+        finally:
+            self._active_tokens.discard(token)
+            self._upload_cookies.pop(token, None)
+            drop_partial_spool()
+            if cache_f is not None:
+                cache_f.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def upload_from_url(
         self,
@@ -255,100 +1236,583 @@ class GigaFileClient:
         lifetime: int = 100,
         progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
         cancel_event: Optional[asyncio.Event] = None,
+        pipelined: bool = True,
+        journal_meta: Optional[Dict[str, Any]] = None,
+        owner: Optional[str] = None,
     ) -> Dict[str, Any]:
+        """
+        Re-upload a remote file. With `pipelined` (default) chunks are uploaded
+        while the download is still running; sources without Content-Length
+        fall back to a full spool to a temp file.
+        `journal_meta` is stored in the upload journal and handed back when the
+        upload is resumed after a restart. `owner` (e.g. "tg:<chat_id>") is the
+        fair-share key in the transfer scheduler.
+        """
         if lifetime not in VALID_LIFETIMES:
             lifetime = 100
 
         server = await self.get_server()
-        token = uuid.uuid1().hex
+        entry = {
+            'token': uuid.uuid1().hex,
+            'server': server,
+            'lifetime': lifetime,
+            'source_url': url,
+            'owner': owner,
+            'meta': journal_meta or {},
+        }
+        return await self._upload_from_url(url, entry, progress_cb, cancel_event, pipelined)
+
+    async def upload_many_from_urls(
+        self,
+        items: List[Dict[str, Any]],
+        cancel_event: Optional[asyncio.Event] = None,
+        owner: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Re-upload many URLs: `items` are {'url': ..., 'lifetime': ...} dicts.
+        Results are yielded as the uploads finish (not in input order), each
+        with its 'index' and 'url'. A failing item yields its error and the
+        batch goes on. At most `batch_parallelism` uploads run at once over
+        all batches; sessions and the server lookup are shared as usual.
+        Closing the iterator early cancels what is left of the batch;
+        `cancel_event` is only read, never set.
+        """
+        if self._batch_slots is None:
+            self._batch_slots = asyncio.Semaphore(self.batch_parallelism)
+        # Own event: stopping the batch must not cancel other work that shares the caller's event
+        stop = asyncio.Event()
+        forward = asyncio.ensure_future(cancel_event.wait()) if cancel_event else None
+        if forward:
+            forward.add_done_callback(lambda f: f.cancelled() or stop.set())
+        pending = iter(enumerate(items))
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            for index, item in pending:
+                async with self._batch_slots:
+                    if stop.is_set():
+                        result = {'success': False, 'error': 'cancelled'}
+                    else:
+                        try:
+                            result = await self.upload_from_url(
+                                item['url'], lifetime=item.get('lifetime', 100), cancel_event=stop, owner=owner,
+                            )
+                        except Exception as e:
+                            logger.warning("Batch item %d (%s) failed: %s", index, item['url'], e)
+                            result = {'success': False, 'error': str(e) or type(e).__name__}
+                results.put_nowait(dict(result, index=index, url=item['url']))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(len(items), self.batch_parallelism))]
+        delivered = 0
+        try:
+            while delivered < len(items):
+                yield await results.get()
+                delivered += 1
+        finally:
+            if delivered < len(items):
+                # Abandoned: running uploads stop at their next chunk, items not started yet are skipped
+                stop.set()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if forward:
+                forward.cancel()
+
+    async def _upload_from_url(
+        self,
+        url: str,
+        entry: Dict[str, Any],
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        pipelined: bool = True,
+    ) -> Dict[str, Any]:
+        resuming = 'total_chunks' in entry
         tmp_path = None
+        cache_lease: Optional[SpoolLease] = None   # set while this request owns a spool cache download
+        job = transfer_scheduler.job(entry.get('owner'), entry.get('filename') or url, entry.get('file_size'))
 
         try:
             actual_download_url = url
             gigafile_match = re.search(r'https?://(\d+)\.gigafile\.nu/', url)
 
-            connector = aiohttp.TCPConnector(ssl=False, limit=0, force_close=False)
-            session = aiohttp.ClientSession(connector=connector)
+            session = self._session('download')
+            if gigafile_match:
+                if '/download.php' in url:
+                    m = re.search(r'file=([^&]+)', url)
+                    file_id = m.group(1) if m else None
+                    server_host = url.split('/')[2]
+                    page_url = f"https://{server_host}/{file_id}"
+                else:
+                    page_url = url.split('?')[0]
+                    file_id = page_url.rstrip('/').split('/')[-1]
+                    server_host = page_url.split('/')[2]
+                    actual_download_url = f"https://{server_host}/download.php?file={file_id}"
+                async with session.get(page_url, timeout=aiohttp.ClientTimeout(total=15)) as _:
+                    pass
 
-            try:
-                if gigafile_match:
-                    if '/download.php' in url:
-                        m = re.search(r'file=([^&]+)', url)
-                        file_id = m.group(1) if m else None
-                        server_host = url.split('/')[2]
-                        page_url = f"https://{server_host}/{file_id}"
-                    else:
-                        page_url = url.split('?')[0]
-                        file_id = page_url.rstrip('/').split('/')[-1]
-                        server_host = page_url.split('/')[2]
-                        actual_download_url = f"https://{server_host}/download.php?file={file_id}"
-                    async with session.get(page_url, timeout=aiohttp.ClientTimeout(total=15)) as _:
-                        pass
+            # Spool cache: reuse a kept download of the same source, or share one in flight
+            cache = self.spool_cache if not resuming else None
+            if cache:
+                key, size = await self._probe_source(session, actual_download_url)
+                if key and cache.fits(size):
+                    cached, lease = await cache.acquire(key)
+                    if cached:
+                        try:
+                            return await self._upload_local_source(
+                                entry, cached['path'], cached['filename'] or _filename_from_url(url),
+                                cached['digest'], job, progress_cb, cancel_event, spool=False,
+                            )
+                        finally:
+                            cache.release(lease)
+                    cache_lease = lease
 
+            if pipelined or resuming:
+                result = await self._upload_from_url_pipelined(
+                    session, self._session('upload'), actual_download_url, entry, progress_cb, cancel_event, job,
+                    cache_lease,
+                )
+                if result is not None:
+                    return result
+                if resuming:
+                    await self._journal('finish', entry['token'])
+                    return {'success': False, 'error': 'Source no longer sends Content-Length - cannot resume'}
+                logger.info("No Content-Length for %s - falling back to full spool", actual_download_url)
+
+            caching = cache_lease is not None and cache_lease.owner
+            if caching:
+                spool_path = self.spool_cache.path(cache_lease)
+            else:
                 with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                    tmp_path = tmp.name
+                    spool_path = tmp_path = tmp.name
 
-                # Stream download to disk (memory-safe)
-                filename, downloaded = await self._download_with_retry(
-                    actual_download_url, tmp_path, progress_cb, cancel_event, session
-                )
-            finally:
-                await session.close()
+            # Stream download to disk (memory-safe)
+            filename, downloaded, digest = await self._download_with_retry(
+                actual_download_url, spool_path, progress_cb, cancel_event, session, job
+            )
 
             if cancel_event and cancel_event.is_set():
                 return {'success': False, 'error': 'cancelled'}
 
-            if downloaded == 0 and os.path.getsize(tmp_path) == 0:
+            if downloaded == 0 and os.path.getsize(spool_path) == 0:
                 return {'success': False, 'error': 'Download failed - empty file'}
 
-            file_size = os.path.getsize(tmp_path)
-            total_chunks = max(1, math.ceil(file_size / CHUNK_SIZE))
-
-            upload_connector = aiohttp.TCPConnector(limit=UPLOAD_CONCURRENCY + 2, force_close=False)
-            async with aiohttp.ClientSession(connector=upload_connector) as up_session:
-                # MEMORY-SAFE: reads chunks from disk on demand
-                result_url = await self._upload_chunks_streaming(
-                    up_session, server, token, filename, tmp_path, total_chunks, lifetime,
-                    progress_cb, cancel_event
-                )
-
-            if progress_cb:
-                await progress_cb('upload', 100)
-
-            return self._build_result(result_url, server, filename)
+            if caching:
+                # Kept for retries and other lifetimes; pinned by us until the upload ends
+                self.spool_cache.commit(cache_lease, filename, digest)
+            return await self._upload_local_source(
+                entry, spool_path, filename, digest, job, progress_cb, cancel_event, spool=not caching,
+            )
 
         finally:
+            job.close()
+            if cache_lease:
+                # Aborts the download if it never completed, unpins it otherwise
+                self.spool_cache.release(cache_lease)
             if tmp_path and os.path.exists(tmp_path):
                 try:
                     os.unlink(tmp_path)
                 except Exception:
                     pass
 
+    async def _probe_source(self, session: aiohttp.ClientSession, url: str) -> tuple[Optional[str], Optional[int]]:
+        """HEAD the source -> (spool cache key, Content-Length); (None, None) if that fails."""
+        try:
+            async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                if resp.status != 200:
+                    return None, None
+                return SpoolCache.key(url, resp.headers), resp.content_length
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.info("HEAD %s failed (%s) - spool cache not used", url, e)
+            return None, None
+
+    async def _upload_local_source(
+        self,
+        entry: Dict[str, Any],
+        path: str,
+        filename: str,
+        digest: Optional[str],
+        job: TransferJob,
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        spool: bool = True,
+    ) -> Dict[str, Any]:
+        """Upload a fully downloaded source (temp spool or spool cache file) under `entry`."""
+        file_size = os.path.getsize(path)
+        job.set_size(file_size)
+        if digest:
+            hit = await self._dedup_lookup(digest, file_size, entry['lifetime'], filename)
+            if hit:
+                return hit
+        controller = self._new_controller(entry['server'], filename, file_size)
+        entry.update(
+            filename=filename,
+            chunk_size=controller.chunk_size,
+            total_chunks=max(1, math.ceil(file_size / controller.chunk_size)),
+            file_size=file_size,
+            completed=[],
+            source_path=path,
+            source_mtime=os.path.getmtime(path),
+            spool=spool,
+            content_hash=digest,
+        )
+        await self._journal('start', entry)
+        # MEMORY-SAFE: streams chunks from disk on demand
+        return await self._upload_journaled_file(entry, controller, progress_cb, cancel_event, job)
+
     async def upload_file_path(
         self,
         filepath: str,
         lifetime: int = 100,
         progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
         cancel_event: Optional[asyncio.Event] = None,
+        journal_meta: Optional[Dict[str, Any]] = None,
+        spool: bool = False,
+        owner: Optional[str] = None,
+        content_hash: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """Upload file from local path. MEMORY-SAFE - reads chunks on demand."""
-        server = await self.get_server()
-        token = uuid.uuid1().hex
+        """
+        Upload file from local path. MEMORY-SAFE - streams chunks on demand.
+        With a journal configured the upload can be resumed after a restart;
+        `spool=True` marks `filepath` as a temp file that a resumed upload
+        deletes once it is done. `content_hash` (sha256 taken while the file
+        was spooled) lets an identical earlier upload be reused.
+        """
         filename = os.path.basename(filepath)
         file_size = os.path.getsize(filepath)
-        total_chunks = max(1, math.ceil(file_size / CHUNK_SIZE))
+        if content_hash:
+            hit = await self._dedup_lookup(content_hash, file_size, lifetime, filename)
+            if hit:
+                return hit
+        server = await self.get_server()
+        controller = self._new_controller(server, filename, file_size)
+        entry = {
+            'token': uuid.uuid1().hex,
+            'server': server,
+            'filename': filename,
+            'lifetime': lifetime,
+            'chunk_size': controller.chunk_size,
+            'total_chunks': max(1, math.ceil(file_size / controller.chunk_size)),
+            'file_size': file_size,
+            'completed': [],
+            'source_path': os.path.abspath(filepath),
+            'source_mtime': os.path.getmtime(filepath),
+            'spool': spool,
+            'owner': owner,
+            'content_hash': content_hash,
+            'meta': journal_meta or {},
+        }
+        await self._journal('start', entry)
+        return await self._upload_journaled_file(entry, controller, progress_cb, cancel_event)
 
-        upload_connector = aiohttp.TCPConnector(limit=UPLOAD_CONCURRENCY + 2, force_close=False)
-        async with aiohttp.ClientSession(connector=upload_connector) as session:
+    async def _upload_journaled_file(
+        self,
+        entry: Dict[str, Any],
+        controller: AdaptiveConcurrency,
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        job: Optional[TransferJob] = None,
+    ) -> Dict[str, Any]:
+        """Send the chunks of entry['source_path'] that are not in entry['completed']."""
+        server, token, filename = entry['server'], entry['token'], entry['filename']
+        own_job = job is None
+        if own_job:
+            job = transfer_scheduler.job(entry.get('owner'), filename, entry['file_size'])
+        self._active_tokens.add(token)
+        try:
             result_url = await self._upload_chunks_streaming(
-                session, server, token, filename, filepath, total_chunks, lifetime,
-                progress_cb, cancel_event
+                self._session('upload'), server, token, filename, entry['source_path'], entry['total_chunks'],
+                entry['lifetime'], progress_cb, cancel_event, controller,
+                done=set(entry['completed']), on_chunk=self._journal_hook(token), job=job,
             )
+        finally:
+            self._active_tokens.discard(token)
+            self._upload_cookies.pop(token, None)
+            if own_job:
+                job.close()
+        await self._journal('finish', token)
+
+        if cancel_event and cancel_event.is_set():
+            return {'success': False, 'error': 'cancelled'}
+        self._remember_link(server, controller)
 
         if progress_cb:
             await progress_cb('upload', 100)
 
-        return self._build_result(result_url, server, filename)
+        result = self._build_result(result_url or entry.get('url'), server, filename)
+        await self._dedup_record(entry, result)
+        return result
+
+    # ── Content-hash dedup ──
+
+    async def _dedup_lookup(self, digest: str, size: int, lifetime: int, filename: str) -> Optional[Dict[str, Any]]:
+        """Result of an earlier upload of the same bytes that lives >= `lifetime` days, if any."""
+        if not self.dedup:
+            return None
+        try:
+            doc = await self.dedup.lookup(digest, size, lifetime)
+        except Exception as e:
+            logger.warning("Dedup lookup failed: %s", e)
+            return None
+        if not doc:
+            return None
+        return {
+            'success': True,
+            'page_url': doc['page_url'],
+            'direct_url': doc['direct_url'],
+            'file_id': doc.get('file_id'),
+            'server': doc.get('server'),
+            'filename': filename,
+            'expires_at': doc['expires_at'],
+            'deduplicated': True,
+        }
+
+    async def _dedup_record(self, entry: Dict[str, Any], result: Dict[str, Any]) -> None:
+        if not self.dedup or not entry.get('content_hash') or not result.get('success'):
+            return
+        try:
+            await self.dedup.record(entry['content_hash'], entry['file_size'], entry['lifetime'], result)
+        except Exception as e:
+            logger.warning("Dedup record failed: %s", e)
+
+    # ── Resumable uploads ──
+
+    async def _journal(self, op: str, *args) -> None:
+        """Journal writes must never break the upload itself."""
+        if not self.journal:
+            return
+        try:
+            await getattr(self.journal, op)(*args)
+        except Exception as e:
+            logger.warning("Upload journal %s failed: %s", op, e)
+
+    def _journal_hook(self, token: str) -> Callable[[int, Optional[str]], Awaitable[None]]:
+        async def on_chunk(chunk_no: int, url: Optional[str]):
+            await self._journal('mark_done', token, chunk_no, url)
+        return on_chunk
+
+    def _resume_controller(self, entry: Dict[str, Any]) -> AdaptiveConcurrency:
+        _, limit = self._link_stats.get(entry['server'], (None, UPLOAD_CONCURRENCY))
+        logger.info(
+            "[%s] resuming upload %s: %d/%d chunks already on %s",
+            entry['filename'], entry['token'], len(entry['completed']), entry['total_chunks'], entry['server'],
+        )
+        return AdaptiveConcurrency(entry['filename'], entry['chunk_size'], initial=limit)
+
+    async def resume_upload(
+        self,
+        token: str,
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Continue a journaled upload under its original token, sending only the
+        chunks GigaFile has not accepted yet. A local source (file or spool)
+        is used while it is unchanged; otherwise a URL upload re-downloads the
+        source and reads past the chunks that are already done.
+        """
+        if not self.journal:
+            return {'success': False, 'error': 'Upload journal is not configured'}
+        if token in self._active_tokens:
+            return {'success': False, 'error': 'Upload is already running'}
+        entry = await self.journal.get(token)
+        if not entry:
+            return {'success': False, 'error': 'Unknown upload token'}
+
+        path = entry.get('source_path')
+        if path and os.path.exists(path) and os.path.getsize(path) == entry['file_size'] \
+                and os.path.getmtime(path) == entry.get('source_mtime'):
+            result = await self._upload_journaled_file(
+                entry, self._resume_controller(entry), progress_cb, cancel_event
+            )
+            if entry.get('spool'):
+                _unlink_quiet(path)
+            return result
+
+        if entry.get('source_url'):
+            if path and entry.get('spool'):
+                _unlink_quiet(path)
+            return await self._upload_from_url(entry['source_url'], entry, progress_cb, cancel_event)
+
+        await self._journal('finish', token)
+        return {'success': False, 'error': 'Upload source is gone - cannot resume'}
+
+    async def resume_pending(
+        self,
+        on_done: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[None]]] = None,
+        include: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> None:
+        """
+        Resume every journaled upload left over from a previous run (call once
+        at startup). `on_done(entry, result)` is awaited for each finished one,
+        e.g. to deliver the links to whoever started the upload. Entries for
+        which `include(entry)` is false are left to someone else (stale ones
+        are still dropped).
+        """
+        if not self.journal:
+            return
+        try:
+            entries = await self.journal.pending()
+        except Exception as e:
+            logger.warning("Cannot read upload journal: %s", e)
+            return
+
+        async def resume_one(entry: Dict[str, Any]):
+            token = entry['token']
+            if token in self._active_tokens:
+                return
+            if time.time() - entry.get('updated_at', 0) > RESUME_MAX_AGE:
+                logger.info("Dropping stale upload %s (%s)", token, entry.get('filename'))
+                await self._journal('finish', token)
+                if entry.get('spool'):
+                    _unlink_quiet(entry.get('source_path'))
+                return
+            if include and not include(entry):
+                return
+            try:
+                result = await self.resume_upload(token)
+            except Exception:
+                logger.exception("Resuming upload %s failed", token)
+                return
+            logger.info("Resumed upload %s (%s): %s", token, entry.get('filename'), result.get('page_url') or result.get('error'))
+            if on_done:
+                try:
+                    await on_done(entry, result)
+                except Exception:
+                    logger.exception("Resume callback failed for %s", token)
+
+        await asyncio.gather(*(resume_one(e) for e in entries))
+
+    async def upload_stream(
+        self,
+        source: AsyncIterator[bytes],
+        filename: str,
+        file_size: int,
+        lifetime: int = 100,
+        progress_cb: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        cancel_event: Optional[asyncio.Event] = None,
+        owner: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Upload a byte stream of known size (e.g. a request body still arriving)
+        without spooling it to disk. Every chunk is collected in memory and
+        POSTed as soon as it is complete while the next one fills; at most
+        STREAM_UPLOAD_WINDOW chunks are held at once and `source` is not read
+        while the window is full. All streamed uploads together hold at most
+        `stream_memory` bytes: a new chunk buffer waits for others to be sent
+        when that is used up. The bytes are gone once sent, so these
+        uploads are not journaled (no resume after a restart); the content
+        hash taken on the way is still recorded for dedup.
+        """
+        if lifetime not in VALID_LIFETIMES:
+            lifetime = 100
+        if file_size <= 0:
+            return {'success': False, 'error': 'Empty file'}
+
+        if self._stream_buffers is None:
+            self._stream_buffers = _ByteBudget(self.stream_memory)
+        buffers = self._stream_buffers
+        server = await self.get_server()
+        controller = self._new_controller(server, filename, file_size)
+        chunk_size = controller.chunk_size
+        total_chunks = max(1, math.ceil(file_size / chunk_size))
+        token = uuid.uuid1().hex
+        session = self._session('upload')
+        job = transfer_scheduler.job(owner, filename, file_size)
+        window = asyncio.Semaphore(STREAM_UPLOAD_WINDOW)
+        first_done = asyncio.Event()
+        failures: list[BaseException] = []
+        tasks: list[asyncio.Task] = []
+        result_url: Optional[str] = None
+        completed = 0
+        hasher = new_hasher()
+
+        def chunk_len(no: int) -> int:
+            return min(chunk_size, file_size - no * chunk_size)
+
+        async def upload_buffered(no: int, buf: bytearray):
+            nonlocal result_url, completed
+            try:
+                # GigaFile requires first chunk to be uploaded first (establishes session)
+                if no > 0:
+                    await first_done.wait()
+                if failures or (cancel_event and cancel_event.is_set()):
+                    return
+                async with controller:
+                    r = await self._upload_chunk(
+                        session, server, token, filename, '', 0, len(buf), no, total_chunks, lifetime,
+                        controller, job, data=buf,
+                    )
+                if 'url' in r:
+                    result_url = r['url']
+                completed += 1
+                if progress_cb:
+                    await progress_cb('upload', min(99, int(completed * 100 / total_chunks)))
+            except Exception as e:
+                failures.append(e)
+            finally:
+                if no == 0:
+                    first_done.set()
+                window.release()
+
+        self._active_tokens.add(token)
+        buf: Optional[bytearray] = None     # the chunk being filled, counted in `buffers`
+        try:
+            chunk_no = 0
+            received = 0
+            filled = 0
+            async for data in source:
+                if cancel_event and cancel_event.is_set():
+                    return {'success': False, 'error': 'cancelled'}
+                if failures:
+                    raise failures[0]
+                if received + len(data) > file_size:
+                    return {'success': False, 'error': f'Body is longer than the declared {file_size} bytes'}
+                received += len(data)
+                hasher.update(data)
+                view = memoryview(data)
+                while view:
+                    if buf is None:
+                        # Bounded window: the body is not read on until an uploaded chunk frees a slot
+                        # (of this upload, then of the process-wide memory budget)
+                        await window.acquire()
+                        await buffers.acquire(chunk_len(chunk_no))
+                        buf = bytearray(chunk_len(chunk_no))
+                        filled = 0
+                    take = min(len(view), len(buf) - filled)
+                    buf[filled:filled + take] = view[:take]
+                    filled += take
+                    view = view[take:]
+                    if filled == len(buf):
+                        task = asyncio.create_task(upload_buffered(chunk_no, buf))
+                        # A callback, not a finally: it also runs for a task cancelled before it started
+                        task.add_done_callback(lambda _, n=len(buf): buffers.release(n))
+                        tasks.append(task)
+                        buf = None
+                        chunk_no += 1
+            if received != file_size:
+                return {'success': False, 'error': f'Body ended after {received} of the declared {file_size} bytes'}
+
+            await asyncio.gather(*tasks)
+            if failures:
+                raise failures[0]
+        finally:
+            self._active_tokens.discard(token)
+            self._upload_cookies.pop(token, None)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if buf is not None:
+                buffers.release(len(buf))
+            job.close()
+
+        if cancel_event and cancel_event.is_set():
+            return {'success': False, 'error': 'cancelled'}
+        self._remember_link(server, controller)
+        if progress_cb:
+            await progress_cb('upload', 100)
+        result = self._build_result(result_url, server, filename)
+        await self._dedup_record(
+            {'content_hash': hasher.hexdigest(), 'file_size': file_size, 'lifetime': lifetime}, result,
+        )
+        return result
 
     async def upload_bytes(
         self,
@@ -0,0 +1,938 @@
+"""
+Streaming proxy for GigaFile downloads (/api/proxy).
+
+Range support:
+- The client's `Range` / `If-Range` headers are forwarded to download.php.
+  A 206 or 416 from upstream is passed through as is (single range or
+  multipart/byteranges).
+- When upstream ignores the range and sends the whole body (200), the
+  requested ranges are cut out of the stream: bytes before a range are read
+  and dropped, several ranges become a multipart/byteranges body.
+- Every response advertises `Accept-Ranges: bytes`.
+
+Sharing one upstream download between clients:
+- With a ProxyCache attached (see proxy_cache.py) whole files are filled to
+  disk on the first request and later requests, ranges included, are served
+  from the cache file.
+- Files the cache does not take are fanned out from one upstream stream
+  through a ring buffer (see proxy_fanout.py).
+- Concurrent requests for a file wait while the first one opens upstream,
+  then share what it opened. Range requests far beyond the shared part
+  still go upstream on their own.
+
+Upstream requests go through one pooled session per NN.gigafile.nu host.
+The cookies from the page warm-up are cached per file_id for
+PROXY_COOKIE_TTL, so repeat downloads go straight to download.php; an HTML
+answer with cached cookies triggers one re-warm and retry.
+
+Link metadata (filename, size, liveness) for HEAD /api/proxy, /api/meta
+and the bot comes from one zero-length ranged request, cached in
+LinkMetadataCache (link_metadata.py).
+
+Bodies of PROXY_ACCEL_MIN_SIZE and more are fetched as several parallel
+ranges and reassembled in order (proxy_accel.py), for the cache fill, the
+fan-out leader and unshared streams alike.
+
+Several links can be downloaded as one ZIP64 archive built on the fly
+(GigaFileProxy.archive, zip_stream.py); members are read one after another
+through the same path as single downloads.
+
+Single entries of a ZIP stored on GigaFile are served without downloading
+the archive (zip_index.py): the central directory is read with ranged
+requests, its parsed index cached per file, and only the entry's bytes are
+fetched and inflated on the fly.
+
+Every stream is admitted by ProxyAdmission (proxy_admission.py): over the
+stream or buffer caps the request gets a fast 503, and streams of clients
+that stop reading are aborted.
+"""
+import asyncio
+import functools
+import logging
+import mimetypes
+import re
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple, Union
+
+import aiohttp
+from fastapi import HTTPException, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from gigafile_client import DNS_CACHE_TTL, KEEPALIVE_TIMEOUT, _extract_filename_from_cd
+from link_metadata import LinkMetadataCache
+from proxy_accel import PROXY_ACCEL_BUFFER, PROXY_ACCEL_MIN_SIZE, PROXY_ACCEL_SEGMENTS, ParallelRangeReader
+from proxy_admission import PROXY_RETRY_AFTER, ProxyAdmission
+from proxy_cache import ProxyCache, ProxyCacheEntry
+from proxy_fanout import FANOUT_RING_BYTES, FanoutStream
+from zip_index import METHOD_DEFLATED, METHOD_STORED, ZipEntry, ZipFormatError, ZipIndexCache, data_offset, \
+    entry_body, read_index
+from zip_stream import ZipMember, archive_size, stream_zip, unique_names
+
+logger = logging.getLogger(__name__)
+
+PROXY_READ_CHUNK = 256 * 1024       # upstream read size (bounded memory per stream)
+# No total limit: big files take hours; stuck clients are handled by idle detection
+PROXY_UPSTREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+PROXY_SHARE_SLACK = 64 * 1024 * 1024   # ranges starting further past the shared part go upstream
+PROXY_POOL_PER_HOST = 64             # pooled upstream connections per NN.gigafile.nu host
+PROXY_COOKIE_TTL = 30 * 60           # page warm-up cookies are reused this long per file_id
+PROXY_ZIP_MAX_FILES = 100            # links per archive
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_gigafile_url(url: str) -> Tuple[str, str, str, str]:
+    """Page or download.php URL -> (server_host, file_id, page_url, download_url)."""
+    if 'gigafile.nu' not in url:
+        raise HTTPException(status_code=400, detail="Only GigaFile.nu URLs are accepted")
+
+    if '/download.php' in url:
+        m = re.search(r'file=([^&]+)', url)
+        if not m:
+            raise HTTPException(status_code=400, detail="Cannot parse file ID from URL")
+        file_id = m.group(1)
+        server = url.split('/')[2]
+        page_url = f"https://{server}/{file_id}"
+    else:
+        page_url = url.split('?')[0]
+
+    file_id = page_url.rstrip('/').split('/')[-1]
+    server_host = page_url.split('/')[2]
+    download_url = f"https://{server_host}/download.php?file={file_id}"
+    return server_host, file_id, page_url, download_url
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    `Range: bytes=...` -> sorted inclusive (start, end) pairs with overlapping
+    or adjacent ranges merged. None when there is no usable Range header (the
+    whole body is served); RangeNotSatisfiable when no range overlaps the file.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+    ranges = []
+    for part in spec.split(','):
+        m = re.fullmatch(r'\s*(\d*)\s*-\s*(\d*)\s*', part)
+        if not m or not (m.group(1) or m.group(2)):
+            return None
+        if m.group(1):
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else size - 1
+            if m.group(2) and end < start:
+                return None
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(m.group(2)))
+            end = size - 1
+            if int(m.group(2)) == 0:
+                continue
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(if_range: Optional[str], headers: Mapping[str, str]) -> bool:
+    """RFC 7233 If-Range: the range applies only if the validator still matches."""
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return headers.get('ETag') == if_range and not if_range.startswith('W/')
+    return headers.get('Last-Modified') == if_range
+
+
+def _first_range_start(header: Optional[str]) -> Optional[int]:
+    """Start offset of the first range, 0 without a Range header, None for suffix ranges."""
+    if not header:
+        return 0
+    m = re.match(r'\s*bytes\s*=\s*(\d+)\s*-', header, re.I)
+    return int(m.group(1)) if m else None
+
+
+async def _cut_ranges(
+    resp: aiohttp.ClientResponse,
+    ranges: List[Tuple[int, int]],
+    boundary: Optional[str] = None,
+    part_headers: Optional[List[bytes]] = None,
+) -> AsyncIterator[bytes]:
+    """Yield the bytes of `ranges` from a full upstream body, dropping the rest."""
+    pos = 0
+    idx = 0
+    if boundary and part_headers:
+        yield part_headers[0]
+    async for chunk in resp.content.iter_chunked(PROXY_READ_CHUNK):
+        chunk_start = pos
+        pos += len(chunk)
+        while idx < len(ranges):
+            start, end = ranges[idx]
+            if start >= pos:
+                break
+            lo = max(start, chunk_start) - chunk_start
+            hi = min(end + 1, pos) - chunk_start
+            if hi > lo:
+                yield chunk[lo:hi]
+            if end + 1 > pos:
+                break
+            idx += 1
+            if boundary:
+                yield part_headers[idx] if idx < len(ranges) else f"\r\n--{boundary}--\r\n".encode()
+        if idx == len(ranges):
+            return
+    # A short upstream body must abort the response, not end it with ranges missing
+    raise IOError(f"Upstream body ended at byte {pos}, range {ranges[idx][0]}-{ranges[idx][1]} incomplete")
+
+
+def _is_file_response(resp: aiohttp.ClientResponse) -> bool:
+    """download.php answers with an HTML page instead of the file when the cookies are missing or stale."""
+    return resp.status in (200, 206, 416) and not (resp.content_type or '').startswith('text/html')
+
+
+def _meta_from_response(resp: aiohttp.ClientResponse) -> Dict[str, Any]:
+    """Link metadata from a download.php answer (full body, a range of it, or an HTML error page)."""
+    m = re.search(r'/(\d+)$', resp.headers.get('Content-Range', ''))
+    if not _is_file_response(resp) or resp.status == 416:
+        # 416 to bytes=0-0 is an empty file (`Content-Range: bytes */0`)
+        return {'alive': resp.status == 416, 'filename': None, 'size': int(m.group(1)) if m else None,
+                'content_type': None, 'etag': None, 'last_modified': None}
+    size = resp.content_length if resp.status == 200 else None
+    if m:
+        size = int(m.group(1))
+    return {
+        'alive': True,
+        'filename': _extract_filename_from_cd(resp.headers.get('Content-Disposition', '')),
+        'size': size,
+        'content_type': resp.headers.get('Content-Type'),
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+    }
+
+
+def _http_time(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+async def _no_bytes() -> AsyncIterator[bytes]:
+    return
+    yield
+
+
+def _range_not_satisfiable(size: int) -> Response:
+    return Response(status_code=416, headers={'Content-Range': f'bytes */{size}', 'Accept-Ranges': 'bytes'})
+
+
+def _multipart_headers(ranges: List[Tuple[int, int]], size: int, content_type: str, boundary: str) -> List[bytes]:
+    heads = []
+    for i, (start, end) in enumerate(ranges):
+        sep = '\r\n' if i else ''
+        heads.append((
+            f"{sep}--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode())
+    return heads
+
+
+class GigaFileProxy:
+    def __init__(self):
+        self.cache: Optional[ProxyCache] = None
+        self.admission = ProxyAdmission()
+        self.link_meta = LinkMetadataCache()
+        self.zip_indexes = ZipIndexCache()
+        self.accel_segments = PROXY_ACCEL_SEGMENTS
+        self.accel_buffer = PROXY_ACCEL_BUFFER
+        self.accel_downloads = 0
+        self.accel_fallbacks = 0
+        self._streams: Dict[Tuple[str, str], FanoutStream] = {}
+        self._opening: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.fanout_streams = 0
+        self.fanout_joined = 0
+        self.fanout_detached = 0
+        self.fanout_bytes = 0
+        self.coalesced = 0
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._cookies: Dict[Tuple[str, str], Tuple[Dict[str, str], float]] = {}   # key -> (cookies, expiry)
+        self._warming: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.warmups = 0
+        self.rewarms = 0
+        # 'cold' = page warm-up + download.php, 'warm' = cached cookies only
+        self._ttfb = {kind: {'count': 0, 'total': 0.0, 'max': 0.0} for kind in ('cold', 'warm')}
+
+    def _session(self, server_host: str) -> aiohttp.ClientSession:
+        """Long-lived pooled session per upstream host; cookies are passed per request, not kept in a jar."""
+        session = self._sessions.get(server_host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=PROXY_POOL_PER_HOST,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+            session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+            self._sessions[server_host] = session
+        return session
+
+    async def _warm(self, key: Tuple[str, str], page_url: str) -> Dict[str, str]:
+        """GET the file page for its cookies; concurrent warm-ups of one file share a request."""
+        pending = self._warming.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._warming[key] = future
+        try:
+            self.warmups += 1
+            cookies: Dict[str, str] = {}
+            async with self._session(key[0]).get(page_url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                for r in (*resp.history, resp):
+                    cookies.update((k, morsel.value) for k, morsel in r.cookies.items())
+            self._cookies[key] = (cookies, time.monotonic() + PROXY_COOKIE_TTL)
+            future.set_result(cookies)
+            return cookies
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()   # retrieved here so a future nobody waits on does not log
+            raise
+        finally:
+            del self._warming[key]
+
+    async def _request(
+        self,
+        key: Tuple[str, str],
+        page_url: str,
+        download_url: str,
+        headers: Dict[str, str],
+        timeout: aiohttp.ClientTimeout,
+    ) -> aiohttp.ClientResponse:
+        """GET download.php with the file's cached cookies, warming up (again) when needed."""
+        started = time.monotonic()
+        cached = self._cookies.get(key)
+        warm = cached is not None and cached[1] > started
+        cookies = cached[0] if warm else await self._warm(key, page_url)
+        session = self._session(key[0])
+        resp = await session.get(download_url, headers=headers, cookies=cookies, timeout=timeout)
+        if warm and not _is_file_response(resp):
+            # Cached cookies went stale - re-warm once before calling the link dead
+            resp.close()
+            self.rewarms += 1
+            warm = False
+            cookies = await self._warm(key, page_url)
+            resp = await session.get(download_url, headers=headers, cookies=cookies, timeout=timeout)
+        if not _is_file_response(resp):
+            self._cookies.pop(key, None)
+        ttfb = self._ttfb['warm' if warm else 'cold']
+        elapsed = time.monotonic() - started
+        ttfb['count'] += 1
+        ttfb['total'] += elapsed
+        ttfb['max'] = max(ttfb['max'], elapsed)
+        return resp
+
+    async def download(self, url: str, range_header: Optional[str] = None, if_range: Optional[str] = None) -> Response:
+        """Stream a GigaFile file to the client, honouring Range requests."""
+        server_host, file_id, page_url, download_url = parse_gigafile_url(url)
+        ticket = self.admission.admit()
+        if ticket is None:
+            raise HTTPException(
+                status_code=503, detail="Proxy is busy, retry later",
+                headers={'Retry-After': str(PROXY_RETRY_AFTER)},
+            )
+        try:
+            key = (server_host, file_id)
+            response = await self._download(key, page_url, download_url, range_header, if_range)
+        except BaseException:
+            ticket.release()
+            raise
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = ticket.wrap(response.body_iterator)
+        else:
+            ticket.release()   # 416 or a FileResponse: no buffers, no upstream connection
+        return response
+
+    async def _download(
+        self,
+        key: Tuple[str, str],
+        page_url: str,
+        download_url: str,
+        range_header: Optional[str],
+        if_range: Optional[str],
+    ) -> Response:
+
+        start = _first_range_start(range_header)
+        opening = self._opening.get(key)
+        if opening is not None and start is not None:
+            # Another request is opening this file upstream - share what it opens
+            self.coalesced += 1
+            await asyncio.shield(opening)
+
+        response = await self._serve_shared(key, page_url, download_url, range_header, if_range)
+        if response is not None:
+            return response
+
+        # Share only a full body, and only when the client's range starts
+        # close enough to the beginning to wait for it
+        shareable = start is not None and start <= PROXY_SHARE_SLACK
+        if not shareable:
+            return await self._open(key, page_url, download_url, range_header, if_range, False)
+        opening = asyncio.get_running_loop().create_future()
+        self._opening[key] = opening
+        try:
+            return await self._open(key, page_url, download_url, range_header, if_range, True)
+        finally:
+            del self._opening[key]
+            opening.set_result(None)
+
+    async def _serve_shared(
+        self,
+        key: Tuple[str, str],
+        page_url: str,
+        download_url: str,
+        range_header: Optional[str],
+        if_range: Optional[str],
+    ) -> Optional[Response]:
+        """Response from the disk cache or a running fan-out stream, None if neither can serve it."""
+        cache = self.cache
+        if cache is not None:
+            entry = cache.get(key)
+            if entry is not None and cache.needs_revalidation(entry):
+                alive = await self._link_alive(key, page_url, download_url)
+                if alive is False:
+                    cache.expired(key)
+                    raise HTTPException(status_code=404, detail="File not found or expired")
+                if alive:
+                    entry.validated = time.time()
+            if entry is not None:
+                response = self._serve(entry, range_header, if_range)
+                if response is not None:
+                    return response
+
+        stream = self._streams.get(key)
+        if stream is not None:
+            return self._serve(stream, range_header, if_range)
+        return None
+
+    async def _open(
+        self,
+        key: Tuple[str, str],
+        page_url: str,
+        download_url: str,
+        range_header: Optional[str],
+        if_range: Optional[str],
+        shareable: bool,
+    ) -> Response:
+        server_host, file_id = key
+        cache = self.cache
+
+        resp = None
+        try:
+            upstream_headers = {}
+            if range_header and not shareable:
+                upstream_headers['Range'] = range_header
+                if if_range:
+                    upstream_headers['If-Range'] = if_range
+            resp = await self._request(
+                key, page_url, download_url, upstream_headers, PROXY_UPSTREAM_TIMEOUT,
+            )
+
+            if resp.status == 416:
+                resp.close()
+                return Response(status_code=416, headers={
+                    'Content-Range': resp.headers.get('Content-Range', 'bytes */*'),
+                    'Accept-Ranges': 'bytes',
+                })
+
+            self.link_meta.put(key, _meta_from_response(resp))
+            if not _is_file_response(resp):
+                resp.close()
+                if cache is not None:
+                    cache.expired(key)
+                raise HTTPException(status_code=404, detail="File not found or expired")
+
+            cd = resp.headers.get('Content-Disposition', f'attachment; filename="{file_id}"')
+            content_type = resp.headers.get('Content-Type', 'application/octet-stream')
+
+            if shareable and resp.status == 200 and resp.content_length:
+                meta = {'Content-Disposition': cd, 'Content-Type': content_type}
+                for name in ('ETag', 'Last-Modified'):
+                    if name in resp.headers:
+                        meta[name] = resp.headers[name]
+                if cache is not None and cache.cacheable(resp.content_length):
+                    body = self._accelerated(key, page_url, download_url, resp, 0, resp.content_length - 1)
+                    entry = cache.fill(key, resp, meta, body)
+                    return self._serve(entry, range_header, if_range, wait=True)
+
+                # The ring counts against the proxy buffer budget; without room, stream unshared
+                ring = min(FANOUT_RING_BYTES, resp.content_length)
+                if self.admission.reserve(ring):
+
+                    async def _stream_done(stream: FanoutStream):
+                        if self._streams.get(key) is stream:
+                            del self._streams[key]
+                        self.admission.unreserve(stream.capacity)
+                        self.fanout_joined += stream.joined
+                        self.fanout_detached += stream.detached
+
+                    stream = FanoutStream(
+                        key, resp, meta,
+                        lambda pos, end: self._upstream_range(key, page_url, download_url, pos, end),
+                        _stream_done,
+                        capacity=ring,
+                        body=self._accelerated(key, page_url, download_url, resp, 0, resp.content_length - 1),
+                    )
+                    self._streams[key] = stream
+                    self.fanout_streams += 1
+                    return self._serve(stream, range_header, if_range, wait=True)
+
+            headers = {"Content-Disposition": cd, "Accept-Ranges": "bytes"}
+            status = resp.status
+            body = None
+
+            if resp.status == 206:
+                # Upstream honoured the range - pass it through
+                for name in ('Content-Range', 'Content-Length'):
+                    if name in resp.headers:
+                        headers[name] = resp.headers[name]
+                m = re.match(r'bytes (\d+)-(\d+)/', resp.headers.get('Content-Range', ''))
+                if m:
+                    body = self._accelerated(key, page_url, download_url, resp, int(m.group(1)), int(m.group(2)))
+            else:
+                size = resp.content_length
+                ranges = None
+                if range_header and size is not None and if_range_matches(if_range, resp.headers):
+                    try:
+                        ranges = parse_range(range_header, size)
+                    except RangeNotSatisfiable:
+                        resp.close()
+                        return _range_not_satisfiable(size)
+                if ranges and len(ranges) == 1:
+                    start, end = ranges[0]
+                    status = 206
+                    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+                    headers['Content-Length'] = str(end - start + 1)
+                    body = _cut_ranges(resp, ranges)
+                elif ranges:
+                    status = 206
+                    boundary = uuid.uuid4().hex
+                    parts = _multipart_headers(ranges, size, content_type, boundary)
+                    closing = f"\r\n--{boundary}--\r\n".encode()
+                    length = sum(len(p) for p in parts) + sum(e - s + 1 for s, e in ranges) + len(closing)
+                    headers['Content-Length'] = str(length)
+                    content_type = f'multipart/byteranges; boundary={boundary}'
+                    body = _cut_ranges(resp, ranges, boundary, parts)
+                elif size is not None:
+                    headers['Content-Length'] = str(size)
+                    body = self._accelerated(key, page_url, download_url, resp, 0, size - 1)
+
+            if body is None:
+                body = resp.content.iter_chunked(PROXY_READ_CHUNK)
+
+            async def _stream():
+                try:
+                    async for chunk in body:
+                        yield chunk
+                finally:
+                    resp.close()
+
+            return StreamingResponse(_stream(), status_code=status, media_type=content_type, headers=headers)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            if resp is not None:
+                resp.close()
+            logger.exception("Proxy error for %s", page_url)
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def _accelerated(
+        self,
+        key: Tuple[str, str],
+        page_url: str,
+        download_url: str,
+        resp: aiohttp.ClientResponse,
+        start: int,
+        end: int,
+    ) -> Optional[AsyncIterator[bytes]]:
+        """
+        Body of `resp` (bytes start..end) fetched as parallel ranges, or None
+        when the body is too small, acceleration is off or upstream does not
+        advertise range support.
+        """
+        if self.accel_segments < 2 or end - start + 1 < PROXY_ACCEL_MIN_SIZE:
+            return None
+        if resp.status != 206 and resp.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            return None
+        reader = ParallelRangeReader(
+            resp, start, end,
+            lambda s, e: self._request(
+                key, page_url, download_url, {'Range': f'bytes={s}-{e}'}, PROXY_UPSTREAM_TIMEOUT,
+            ),
+            lambda pos, e: self._upstream_range(key, page_url, download_url, pos, e),
+            self.accel_segments, self.accel_buffer,
+        )
+
+        async def _body():
+            # The reassembly buffer counts against the proxy budget; without room, read one stream
+            if not self.admission.reserve(self.accel_buffer):
+                async for chunk in resp.content.iter_chunked(PROXY_READ_CHUNK):
+                    yield chunk
+                return
+            self.accel_downloads += 1
+            try:
+                async for chunk in reader.stream():
+                    yield chunk
+            finally:
+                self.admission.unreserve(self.accel_buffer)
+                if reader.fell_back:
+                    self.accel_fallbacks += 1
+
+        return _body()
+
+    def _serve(
+        self,
+        source: Union[ProxyCacheEntry, FanoutStream],
+        range_header: Optional[str],
+        if_range: Optional[str],
+        wait: bool = False,
+    ) -> Optional[Response]:
+        """
+        Response from a cache entry (complete or still filling) or a fan-out
+        stream. None when the requested range is out of the source's reach
+        (unless `wait`).
+        """
+        cache = self.cache
+        cached = isinstance(source, ProxyCacheEntry)
+        size = source.size
+        content_type = source.headers['Content-Type']
+        headers = {'Content-Disposition': source.headers['Content-Disposition'], 'Accept-Ranges': 'bytes'}
+        for name in ('ETag', 'Last-Modified'):
+            if name in source.headers:
+                headers[name] = source.headers[name]
+
+        ranges = None
+        if range_header and if_range_matches(if_range, source.headers):
+            try:
+                ranges = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                return _range_not_satisfiable(size)
+        if not wait and not source.reachable(ranges[0][0] if ranges else 0, PROXY_SHARE_SLACK):
+            return None
+
+        if source.complete and not ranges:
+            # Whole file from disk: FileResponse lets the server use sendfile / pathsend;
+            # pinned until the response is sent so the file cannot be removed before it is opened
+            cache.bytes_served += size
+            cache.pin(source)
+            return FileResponse(source.path, media_type=content_type, headers=headers,
+                                background=BackgroundTask(cache.release, source))
+
+        status = 200
+        boundary = None
+        parts: List[bytes] = []
+        if ranges is None:
+            ranges = [(0, size - 1)]
+            headers['Content-Length'] = str(size)
+        elif len(ranges) == 1:
+            status = 206
+            start, end = ranges[0]
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            headers['Content-Length'] = str(end - start + 1)
+        else:
+            status = 206
+            boundary = uuid.uuid4().hex
+            parts = _multipart_headers(ranges, size, content_type, boundary)
+            closing = f"\r\n--{boundary}--\r\n".encode()
+            length = sum(len(p) for p in parts) + sum(e - s + 1 for s, e in ranges) + len(closing)
+            headers['Content-Length'] = str(length)
+            content_type = f'multipart/byteranges; boundary={boundary}'
+
+        if cached:
+            cache.pin(source)
+
+        async def _stream():
+            try:
+                for i, (start, end) in enumerate(ranges):
+                    if boundary:
+                        yield parts[i]
+                    async for chunk in source.read(start, end):
+                        if cached:
+                            cache.bytes_served += len(chunk)
+                        else:
+                            self.fanout_bytes += len(chunk)
+                        yield chunk
+                if boundary:
+                    yield f"\r\n--{boundary}--\r\n".encode()
+            finally:
+                if cached:
+                    cache.release(source)
+
+        return StreamingResponse(_stream(), status_code=status, media_type=content_type, headers=headers)
+
+    async def _upstream_range(
+        self, key: Tuple[str, str], page_url: str, download_url: str, start: int, end: int,
+    ) -> AsyncIterator[bytes]:
+        """Bytes start..end on an own upstream connection (fan-out readers that fell behind)."""
+        resp = await self._request(
+            key, page_url, download_url, {'Range': f'bytes={start}-{end}'}, PROXY_UPSTREAM_TIMEOUT,
+        )
+        try:
+            if resp.status == 206 and _is_file_response(resp):
+                async for chunk in resp.content.iter_chunked(PROXY_READ_CHUNK):
+                    yield chunk
+            elif resp.status == 200 and _is_file_response(resp):
+                async for chunk in _cut_ranges(resp, [(start, end)]):
+                    yield chunk
+            else:
+                raise IOError(f"Upstream answered {resp.status} to a range request")
+        finally:
+            resp.close()
+
+    async def _fetch_metadata(self, key: Tuple[str, str], page_url: str, download_url: str) -> Dict[str, Any]:
+        resp = await self._request(
+            key, page_url, download_url, {'Range': 'bytes=0-0'}, aiohttp.ClientTimeout(total=15),
+        )
+        resp.close()   # at most one byte of body; not worth reading
+        return _meta_from_response(resp)
+
+    async def _metadata(self, key: Tuple[str, str], page_url: str, download_url: str) -> Dict[str, Any]:
+        return await self.link_meta.get(key, lambda: self._fetch_metadata(key, page_url, download_url))
+
+    async def metadata(self, url: str) -> Dict[str, Any]:
+        """Filename, size, content type and liveness of a GigaFile link (cached, see link_metadata.py)."""
+        server_host, file_id, page_url, download_url = parse_gigafile_url(url)
+        try:
+            meta = await self._metadata((server_host, file_id), page_url, download_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HTTPException(status_code=502, detail=f"GigaFile did not answer: {e}")
+        return dict(meta, page_url=page_url, direct_url=download_url, server=server_host, file_id=file_id)
+
+    async def head(self, url: str) -> Response:
+        """HEAD /api/proxy: the headers a download would get, without a body."""
+        meta = await self.metadata(url)
+        if not meta['alive']:
+            raise HTTPException(status_code=404, detail="File not found or expired")
+        filename = meta['filename'] or meta['file_id']
+        headers = {
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}",
+            'Accept-Ranges': 'bytes',
+        }
+        if meta['size'] is not None:
+            headers['Content-Length'] = str(meta['size'])
+        if meta['etag']:
+            headers['ETag'] = meta['etag']
+        if meta['last_modified']:
+            headers['Last-Modified'] = meta['last_modified']
+        return Response(media_type=meta['content_type'] or 'application/octet-stream', headers=headers)
+
+    async def archive(self, urls: List[str], name: Optional[str] = None) -> StreamingResponse:
+        """Stream several GigaFile files as one ZIP64 archive (store mode, see zip_stream.py)."""
+        if not urls:
+            raise HTTPException(status_code=400, detail="No URLs given")
+        if len(urls) > PROXY_ZIP_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {PROXY_ZIP_MAX_FILES} files per archive")
+        for url in urls:
+            parse_gigafile_url(url)   # 400 before any upstream request
+        metas = await asyncio.gather(*(self.metadata(url) for url in urls))
+        dead = [url for url, meta in zip(urls, metas) if not meta['alive']]
+        if dead:
+            raise HTTPException(status_code=404, detail=f"File not found or expired: {', '.join(dead)}")
+
+        names = unique_names(meta['filename'] or meta['file_id'] for meta in metas)
+        members = [
+            ZipMember(
+                member_name,
+                meta['size'],
+                functools.partial(
+                    self._member_body, (meta['server'], meta['file_id']), meta['page_url'], meta['direct_url'],
+                ),
+                _http_time(meta['last_modified']),
+            )
+            for member_name, meta in zip(names, metas)
+        ]
+        ticket = self.admission.admit()
+        if ticket is None:
+            raise HTTPException(
+                status_code=503, detail="Proxy is busy, retry later",
+                headers={'Retry-After': str(PROXY_RETRY_AFTER)},
+            )
+        name = name or 'gigafile.zip'
+        if not name.lower().endswith('.zip'):
+            name += '.zip'
+        headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(name)}"}
+        size = archive_size(members)
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return StreamingResponse(ticket.wrap(stream_zip(members)), media_type='application/zip', headers=headers)
+
+    async def _member_body(self, key: Tuple[str, str], page_url: str, download_url: str) -> AsyncIterator[bytes]:
+        """One archive member: the whole file through the cache / fan-out / upstream path."""
+        response = await self._download(key, page_url, download_url, 'bytes=0-', None)
+        if response.status_code == 416:
+            return   # empty file
+        body = response.body_iterator
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await body.aclose()
+
+    async def _range_body(
+        self, key: Tuple[str, str], page_url: str, download_url: str, start: int, end: int,
+    ) -> AsyncIterator[bytes]:
+        """Bytes start..end from the cache / a fan-out stream when they hold them, else a ranged upstream read."""
+        range_header = f'bytes={start}-{end}'
+        response = await self._serve_shared(key, page_url, download_url, range_header, None)
+        if response is None:
+            response = await self._open(key, page_url, download_url, range_header, None, False)
+        if response.status_code != 206:
+            raise IOError(f"Upstream answered {response.status_code} to a range request")
+        return response.body_iterator
+
+    async def _read_range(self, key: Tuple[str, str], page_url: str, download_url: str, start: int, end: int) -> bytes:
+        body = await self._range_body(key, page_url, download_url, start, end)
+        data = bytearray()
+        try:
+            async for chunk in body:
+                data += chunk
+        finally:
+            await body.aclose()
+        return bytes(data)
+
+    async def _zip_index(self, url: str) -> Tuple[Dict[str, Any], Dict[str, ZipEntry]]:
+        meta = await self.metadata(url)
+        if not meta['alive']:
+            raise HTTPException(status_code=404, detail="File not found or expired")
+        if not meta['size']:
+            raise HTTPException(status_code=415, detail="Not a ZIP archive")
+        key = (meta['server'], meta['file_id'])
+        read = functools.partial(self._read_range, key, meta['page_url'], meta['direct_url'])
+        try:
+            index = await self.zip_indexes.get(key, lambda: read_index(read, meta['size']))
+        except ZipFormatError as e:
+            raise HTTPException(status_code=415, detail=f"Cannot read the archive: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+            raise HTTPException(status_code=502, detail=f"GigaFile did not answer: {e}")
+        return meta, index
+
+    async def zip_list(self, url: str) -> Dict[str, Any]:
+        """Contents of a ZIP stored on GigaFile, read from its central directory."""
+        meta, index = await self._zip_index(url)
+        return {
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'entries': [entry.to_dict() for entry in index.values()],
+        }
+
+    async def zip_entry(self, url: str, path: str) -> StreamingResponse:
+        """Stream one file out of a ZIP stored on GigaFile, inflating it on the fly."""
+        meta, index = await self._zip_index(url)
+        entry = index.get(path)
+        if entry is None or entry.is_dir:
+            raise HTTPException(status_code=404, detail="No such file in the archive")
+        if entry.encrypted or entry.method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise HTTPException(status_code=415, detail="Only unencrypted stored or deflated entries are supported")
+        ticket = self.admission.admit()
+        if ticket is None:
+            raise HTTPException(
+                status_code=503, detail="Proxy is busy, retry later",
+                headers={'Retry-After': str(PROXY_RETRY_AFTER)},
+            )
+        key = (meta['server'], meta['file_id'])
+        try:
+            read = functools.partial(self._read_range, key, meta['page_url'], meta['direct_url'])
+            start = await data_offset(read, entry, meta['size'])
+            if entry.compressed_size:
+                compressed = await self._range_body(
+                    key, meta['page_url'], meta['direct_url'], start, start + entry.compressed_size - 1,
+                )
+            else:
+                compressed = _no_bytes()
+        except BaseException as e:
+            ticket.release()
+            if isinstance(e, ZipFormatError):
+                raise HTTPException(status_code=415, detail=f"Cannot read the archive: {e}")
+            if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError, IOError)):
+                raise HTTPException(status_code=502, detail=f"GigaFile did not answer: {e}")
+            raise
+
+        filename = entry.name.rstrip('/').rsplit('/', 1)[-1]
+        headers = {
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}",
+            'Content-Length': str(entry.size),
+        }
+        media_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return StreamingResponse(ticket.wrap(entry_body(entry, compressed)), media_type=media_type, headers=headers)
+
+    async def _link_alive(self, key: Tuple[str, str], page_url: str, download_url: str) -> Optional[bool]:
+        """False when GigaFile no longer serves the file, None when it could not be checked."""
+        try:
+            return (await self._metadata(key, page_url, download_url))['alive']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Proxy cache: could not revalidate %s: %s", page_url, e)
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        streams = list(self._streams.values())
+        return {
+            'cache': self.cache.stats() if self.cache else None,
+            'fanout': {
+                'streams': len(streams),
+                'readers': sum(s.readers for s in streams),
+                'streams_total': self.fanout_streams,
+                'joined': self.fanout_joined + sum(s.joined for s in streams),
+                'detached': self.fanout_detached + sum(s.detached for s in streams),
+                'bytes_served': self.fanout_bytes,
+            },
+            'coalesced': self.coalesced,
+            'admission': self.admission.stats(),
+            'link_metadata': self.link_meta.stats(),
+            'zip_indexes': self.zip_indexes.stats(),
+            'accel': {
+                'segments': self.accel_segments,
+                'downloads': self.accel_downloads,
+                'fallbacks': self.accel_fallbacks,
+            },
+            'sessions': len(self._sessions),
+            'cookie_cache': {'entries': len(self._cookies), 'warmups': self.warmups, 'rewarms': self.rewarms},
+            'ttfb': {
+                kind: {
+                    'count': t['count'],
+                    'avg': round(t['total'] / t['count'], 3) if t['count'] else None,
+                    'max': round(t['max'], 3),
+                }
+                for kind, t in self._ttfb.items()
+            },
+        }
+
+    async def close(self) -> None:
+        for stream in list(self._streams.values()):
+            await stream.close()
+        if self.cache is not None:
+            await self.cache.close()
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+
+gigafile_proxy = GigaFileProxy()
@@ -43,6 +43,7 @@ TRANSLATIONS = {
         "file_not_found": "File not found. Send again.",
         "send_link_or_file": "Send an HTTP link or a file.",
         "gigafile_bad_link": "This is a GigaFile.nu link, but I couldn't parse the file ID.\nCheck the link format.",
+        "link_expired": "This GigaFile link has expired or the file was deleted.",
         "btn_open_page": "Open page",
         "btn_download_proxy": "Download (proxy)",
         "btn_new_upload": "New upload",
@@ -89,6 +90,7 @@ TRANSLATIONS = {
         "file_not_found": "Файл не найден. Отправь заново.",
         "send_link_or_file": "Отправь HTTP-ссылку или файл.",
         "gigafile_bad_link": "Это ссылка GigaFile.nu, но не удалось распознать ID файла.\nПроверь формат ссылки.",
+        "link_expired": "Срок действия ссылки GigaFile истёк или файл удалён.",
         "btn_open_page": "Открыть страницу",
         "btn_download_proxy": "Скачать (прокси)",
         "btn_new_upload": "Новая загрузка",
@@ -135,6 +137,7 @@ TRANSLATIONS = {
         "file_not_found": "Archivo no encontrado. Envia de nuevo.",
         "send_link_or_file": "Envia un enlace HTTP o un archivo.",
         "gigafile_bad_link": "Este es un enlace GigaFile.nu, pero no pude reconocer el ID.\nVerifica el formato.",
+        "link_expired": "Este enlace de GigaFile ha caducado o el archivo fue eliminado.",
         "btn_open_page": "Abrir pagina",
         "btn_download_proxy": "Descargar (proxy)",
         "btn_new_upload": "Nueva subida",
@@ -181,6 +184,7 @@ TRANSLATIONS = {
         "file_not_found": "Datei nicht gefunden. Erneut senden.",
         "send_link_or_file": "Sende einen HTTP-Link oder eine Datei.",
         "gigafile_bad_link": "Dies ist ein GigaFile.nu-Link, aber die Datei-ID konnte nicht erkannt werden.",
+        "link_expired": "Dieser GigaFile-Link ist abgelaufen oder die Datei wurde geloscht.",
         "btn_open_page": "Seite offnen",
         "btn_download_proxy": "Download (Proxy)",
         "btn_new_upload": "Neuer Upload",
@@ -227,6 +231,7 @@ TRANSLATIONS = {
         "file_not_found": "Fichier non trouve. Renvoyez.",
         "send_link_or_file": "Envoyez un lien HTTP ou un fichier.",
         "gigafile_bad_link": "C'est un lien GigaFile.nu, mais l'ID n'a pas pu etre reconnu.",
+        "link_expired": "Ce lien GigaFile a expire ou le fichier a ete supprime.",
         "btn_open_page": "Ouvrir la page",
         "btn_download_proxy": "Telecharger (proxy)",
         "btn_new_upload": "Nouveau telechargement",
@@ -273,6 +278,7 @@ TRANSLATIONS = {
         "file_not_found": "File not found. Send again.",
         "send_link_or_file": "Send an HTTP link or file.",
         "gigafile_bad_link": "GigaFile.nu link detected but couldn't parse file ID.",
+        "link_expired": "This GigaFile link has expired or the file was deleted.",
         "btn_open_page": "Open page",
         "btn_download_proxy": "Download (proxy)",
         "btn_new_upload": "New upload",
@@ -319,6 +325,7 @@ TRANSLATIONS = {
         "file_not_found": "File not found.",
         "send_link_or_file": "Send an HTTP link or file.",
         "gigafile_bad_link": "GigaFile link found but couldn't parse ID.",
+        "link_expired": "This GigaFile link has expired or the file was deleted.",
         "btn_open_page": "Open page",
         "btn_download_proxy": "Download (proxy)",
         "btn_new_upload": "New upload",
@@ -365,6 +372,7 @@ TRANSLATIONS = {
         "file_not_found": "Arquivo nao encontrado.",
         "send_link_or_file": "Envie um link HTTP ou arquivo.",
         "gigafile_bad_link": "Link GigaFile detectado mas nao foi possivel reconhecer o ID.",
+        "link_expired": "Este link do GigaFile expirou ou o arquivo foi excluido.",
         "btn_open_page": "Abrir pagina",
         "btn_download_proxy": "Download (proxy)",
         "btn_new_upload": "Novo upload",
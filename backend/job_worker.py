@@ -0,0 +1,191 @@
+"""
+Transfer worker process: runs jobs from the Mongo job queue (jobs.py).
+
+The server starts JOB_WORKER_PROCESSES of these (WorkerProcesses) and
+starts again any that exits; more can be run by hand, on other hosts too,
+as long as they share the database:
+
+    python job_worker.py
+
+Worker processes started by the server take the jobs routed to their index
+first (jobs.py); one started by hand takes any job.
+
+Every process has its own event loop, connection pools and transfer
+scheduler, so transfers use more than one core and their disk writes and
+hashing cannot hold up the webhook or API requests of the server. It reads
+the same .env as server.py.
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from gigafile_client import gigafile_client
+from jobs import JOB_WORKERS, JobManager
+from spool_cache import SpoolCache
+from upload_dedup import UploadDedupIndex
+from upload_journal import FileUploadJournal, MongoUploadJournal
+
+ROOT_DIR = Path(__file__).parent
+logger = logging.getLogger(__name__)
+
+WORKER_RESTART_DELAY = 5     # seconds before a worker process that exited is started again
+WORKER_STOP_TIMEOUT = 30     # seconds a worker gets to hand its jobs back on shutdown
+
+
+def spool_cache_share(quota: int, processes: int) -> int:
+    """Spool cache bytes of the server and of each of its `processes` worker processes: one quota for all."""
+    return quota // (processes + 1)
+
+
+async def _journaled_token(job_id: str) -> Optional[str]:
+    """Token of the upload an earlier attempt of the job left in the journal, if any."""
+    try:
+        entries = await gigafile_client.journal.pending()
+    except Exception as e:
+        logger.warning("Cannot read upload journal: %s", e)
+        return None
+    for entry in entries:
+        if entry.get('meta', {}).get('job_id') == job_id:
+            return entry['token']
+    return None
+
+
+async def run_transfer_job(
+    job: Dict[str, Any],
+    progress_cb: Callable[[str, int], Awaitable[None]],
+    cancel_event: asyncio.Event,
+) -> Dict[str, Any]:
+    """
+    JobManager runner: re-upload the job's URL to GigaFile. If an earlier
+    attempt died mid-upload, its journaled upload is continued (same token,
+    missing chunks only) instead of starting over.
+    """
+    result = None
+    if gigafile_client.journal:
+        token = await _journaled_token(job['id'])
+        if token:
+            logger.info("Job %s: continuing upload %s of an earlier attempt", job['id'], token)
+            result = await gigafile_client.resume_upload(token, progress_cb=progress_cb, cancel_event=cancel_event)
+    if result is None:
+        result = await gigafile_client.upload_from_url(
+            job['url'], lifetime=job['duration'], progress_cb=progress_cb, cancel_event=cancel_event,
+            journal_meta={'job_id': job['id']}, owner=job.get('owner'),
+        )
+    if result.get('success') and not result.get('expires_at'):
+        result['expires_at'] = time.time() + job['duration'] * 86400
+    return result
+
+
+class WorkerProcesses:
+    """`count` worker processes running next to the server, each started again when it exits."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._tasks: list = []
+        self._procs: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts = 0
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._supervise(i)) for i in range(self.count)]
+
+    async def _supervise(self, index: int) -> None:
+        while True:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, str(ROOT_DIR / 'job_worker.py'),
+                env=dict(os.environ, JOB_WORKER_INDEX=str(index)),
+            )
+            self._procs[index] = proc
+            logger.info("Worker process %d started (pid %d)", index, proc.pid)
+            try:
+                code = await proc.wait()
+            except asyncio.CancelledError:
+                await self._stop(proc)
+                raise
+            self.restarts += 1
+            logger.warning("Worker process %d exited with %s, starting it again in %ds",
+                           index, code, WORKER_RESTART_DELAY)
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+
+    @staticmethod
+    async def _stop(proc: asyncio.subprocess.Process) -> None:
+        if proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'processes': self.count,
+            'alive': sum(1 for p in self._procs.values() if p.returncode is None),
+            'restarts': self.restarts,
+        }
+
+
+async def main() -> None:
+    load_dotenv(ROOT_DIR / '.env')
+    index = os.environ.get('JOB_WORKER_INDEX')
+    processes = int(os.environ.get('JOB_WORKER_PROCESSES', '2'))
+    mongo_client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = mongo_client[os.environ['DB_NAME']]
+
+    journal = os.environ.get('UPLOAD_JOURNAL', 'mongo')
+    if journal == 'mongo':
+        gigafile_client.journal = MongoUploadJournal(db.upload_journal)
+    elif journal == 'file':
+        gigafile_client.journal = FileUploadJournal(
+            os.environ.get('UPLOAD_JOURNAL_DIR', str(ROOT_DIR / 'upload_journal'))
+        )
+    if os.environ.get('UPLOAD_DEDUP', 'on') == 'on':
+        gigafile_client.dedup = UploadDedupIndex(db.upload_hashes)
+    spool_gb = float(os.environ.get('SPOOL_CACHE_GB', '20'))
+    if spool_gb > 0:
+        # A SpoolCache clears its directory on start, so every process has its own. The server and its
+        # worker processes split SPOOL_CACHE_GB (spool_cache_share); a worker started by hand adds its share
+        directory = os.environ.get('SPOOL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gigafile_spool_cache'))
+        name = f'worker{index}' if index is not None else f'worker-{os.getpid()}'
+        gigafile_client.spool_cache = SpoolCache(
+            os.path.join(directory, name), spool_cache_share(int(spool_gb * 1024 ** 3), processes)
+        )
+
+    manager = JobManager(
+        db.jobs, run_transfer_job, workers=int(os.environ.get('JOB_WORKERS', str(JOB_WORKERS))),
+        shards=processes, shard=int(index) if index is not None else None,
+    )
+    await manager.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("Job worker %s ready (%d workers)", manager.worker_id, manager.workers)
+    await stop.wait()
+
+    # Running jobs go back to the queue
+    await manager.close()
+    await gigafile_client.close()
+    mongo_client.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())
@@ -0,0 +1,341 @@
+"""
+Persistent transfer job queue (/api/jobs, bot URL re-uploads).
+
+submit() stores a job document and returns at once; whichever process has
+free workers runs it - the worker processes of job_worker.py, or worker
+tasks in the server itself when JOB_WORKER_PROCESSES=0. The queue is the
+Motor collection itself (job id as `_id`), so any number of processes can
+share it.
+
+- Leases: a worker claims the oldest queued job (or one whose lease has run
+  out) with one atomic update that records its id and `lease_until`. While
+  the job runs the lease is renewed every JOB_HEARTBEAT seconds, together
+  with the progress. A crashed worker stops renewing and its job is claimed
+  again after JOB_LEASE seconds, up to JOB_MAX_ATTEMPTS times; the runner
+  sees `attempts` and can pick up where the last attempt stopped.
+- A worker that is shut down cleanly hands its running jobs back to the
+  queue instead of waiting for the lease to run out.
+- Routing: with `shards` (the number of worker processes) a job gets the
+  shard of its normalized source URL, and the worker process of that index
+  takes it first, so repeats of a URL meet the same spool cache and its
+  single-flight download. Any worker takes a job left queued for
+  JOB_SHARD_GRACE seconds (its worker is busy or gone).
+- Progress: bytes downloaded / uploaded, rate and ETA, sampled every
+  JOB_TICK seconds from the job's TransferProgress (transfer_scheduler.py).
+  Watchers (the SSE stream, the bot) poll get(), which is live for jobs
+  running in this process and at most JOB_HEARTBEAT old otherwise.
+- DELETE cancels: a queued job is dropped, a running one gets
+  `cancel_requested` and its worker sets the cancel_event at the next
+  heartbeat (at once when the job runs in this process).
+
+Job documents: url, duration, owner, meta, status (queued | running | done |
+failed | cancelled), attempts, worker, lease_until, progress, result, error,
+created_at / started_at / finished_at (unix time).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from spool_cache import normalize_url
+from transfer_scheduler import TransferProgress, transfer_progress
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = 4                # jobs run at once by one JobManager
+JOB_TICK = 1.0                 # seconds between progress samples (and watcher polls)
+JOB_HEARTBEAT = 2.0            # seconds between lease renewals / progress writes
+JOB_LEASE = 20.0               # a job whose lease is older than this is claimed again
+JOB_POLL = 2.0                 # idle workers look for new jobs this often
+JOB_MAX_ATTEMPTS = 3           # claims of one job before it is failed
+JOB_SHARD_GRACE = 30.0         # seconds a job waits for the worker of its shard before any worker takes it
+JOB_FINAL = ('done', 'failed', 'cancelled')
+
+JobRunner = Callable[
+    [Dict[str, Any], Callable[[str, int], Awaitable[None]], asyncio.Event],
+    Awaitable[Dict[str, Any]],
+]
+
+
+def _public(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc = dict(doc)
+    doc['id'] = doc.pop('_id')
+    return doc
+
+
+class _Job:
+    """A job running in this process, with its live progress."""
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.doc = doc
+        self.cancel_event = asyncio.Event()
+        self.progress = TransferProgress()
+        self.stage: Optional[str] = None
+        self.percent = 0
+        self.rate: Optional[float] = None
+        self._sample = (time.monotonic(), 0)
+
+    async def on_progress(self, stage: str, pct: int) -> None:
+        """progress_cb for GigaFileClient."""
+        self.stage = stage
+        self.percent = pct
+
+    def sample(self) -> Dict[str, Any]:
+        """Progress now; the rate is an EWMA over ticks, of uploaded bytes once the upload has begun."""
+        size = self.progress.size
+        moved = self.progress.bytes['upload'] or self.progress.bytes['download']
+        now = time.monotonic()
+        then, before = self._sample
+        if now > then and moved >= before:
+            current = (moved - before) / (now - then)
+            self.rate = current if self.rate is None else 0.7 * self.rate + 0.3 * current
+        self._sample = (now, moved)
+        eta = None
+        if size and self.rate:
+            eta = max(0.0, size - moved) / self.rate
+        return {
+            'stage': self.stage,
+            'percent': self.percent,
+            'size': size,
+            'downloaded': self.progress.bytes['download'],
+            'uploaded': min(self.progress.bytes['upload'], size) if size else self.progress.bytes['upload'],
+            'rate': round(self.rate) if self.rate is not None else None,
+            'eta': round(eta) if eta is not None else None,
+        }
+
+
+class JobManager:
+    def __init__(
+        self,
+        collection,
+        runner: Optional[JobRunner] = None,
+        workers: int = JOB_WORKERS,
+        shards: int = 0,
+        shard: Optional[int] = None,
+    ):
+        """
+        `workers=0` (or no runner): only submit and watch jobs, other processes
+        run them. `shards`: worker processes that jobs are routed to by URL;
+        `shard`: the index of this one (None: take any job).
+        """
+        self.collection = collection
+        self.runner = runner
+        self.workers = workers if runner is not None else 0
+        self.shards = shards
+        self.shard = shard
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._jobs: Dict[str, _Job] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self.completed = 0
+        self.failed = 0
+        self.reclaimed = 0
+
+    async def start(self) -> None:
+        await self.collection.create_index([('status', 1), ('created_at', 1)])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _shard_of(self, url: Optional[str]) -> Optional[int]:
+        if not self.shards or not url:
+            return None
+        digest = hashlib.sha1(normalize_url(url).encode()).digest()
+        return int.from_bytes(digest[:8], 'big') % self.shards
+
+    async def submit(self, params: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
+        doc = dict(params, _id=uuid.uuid4().hex, owner=owner, shard=self._shard_of(params.get('url')),
+                   status='queued', attempts=0, worker=None,
+                   lease_until=None, progress=None, result=None, error=None,
+                   created_at=time.time(), started_at=None, finished_at=None)
+        await self.collection.insert_one(doc)
+        self._wakeup.set()
+        return _public(doc)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return _public(job.doc)
+        doc = await self.collection.find_one({'_id': job_id})
+        return _public(doc) if doc else None
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        doc = await self.collection.find_one_and_update(
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'finished_at': time.time()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            doc = await self.collection.find_one_and_update(
+                {'_id': job_id, 'status': 'running'},
+                {'$set': {'cancel_requested': True}},
+                return_document=ReturnDocument.AFTER,
+            )
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.cancel_event.set()
+        return _public(doc) if doc else await self.get(job_id)
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """The job now, then again whenever its status or progress changes, until it is finished."""
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            state = (job['status'], job.get('progress'))
+            if state != last:
+                last = state
+                yield job
+            if job['status'] in JOB_FINAL:
+                return
+            await asyncio.sleep(JOB_TICK)
+
+    async def wait(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job once it is finished."""
+        job = None
+        async for job in self.events(job_id):
+            pass
+        return job
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        if self.shard is None:
+            queued = [{'status': 'queued'}]
+        else:
+            queued = [
+                {'status': 'queued', 'shard': {'$in': [self.shard, None]}},
+                {'status': 'queued', 'created_at': {'$lt': now - JOB_SHARD_GRACE}},
+            ]
+        return await self.collection.find_one_and_update(
+            {'$or': queued + [
+                {'status': 'running', 'lease_until': {'$lt': now}},
+            ]},
+            {'$set': {'status': 'running', 'worker': self.worker_id, 'lease_until': now + JOB_LEASE,
+                      'started_at': now},
+             '$inc': {'attempts': 1}},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                doc = await self._claim()
+            except Exception as e:
+                logger.warning("Jobs: claim failed: %s", e)
+                doc = None
+            if doc is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if doc['attempts'] > JOB_MAX_ATTEMPTS:
+                await self._complete(_Job(doc), 'failed', None, f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+                continue
+            if doc['attempts'] > 1:
+                self.reclaimed += 1
+                logger.info("Job %s: attempt %d, the previous worker's lease ran out", doc['_id'], doc['attempts'])
+            try:
+                await self._run(_Job(doc))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job %s: worker failed", doc['_id'])
+
+    async def _run(self, job: _Job) -> None:
+        job_id = job.doc['_id']
+        self._jobs[job_id] = job
+        if job.doc.get('cancel_requested'):
+            job.cancel_event.set()
+        ticker = asyncio.create_task(self._tick(job))
+        token = transfer_progress.set(job.progress)
+        status, result, error = 'failed', None, None
+        try:
+            result = await self.runner(_public(job.doc), job.on_progress, job.cancel_event)
+            if result.get('success'):
+                status = 'done'
+            elif job.cancel_event.is_set() or result.get('error') == 'cancelled':
+                status = 'cancelled'
+            error = result.get('error')
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back so another worker (or the next start) runs it at once
+            ticker.cancel()
+            self._jobs.pop(job_id, None)
+            await self.collection.update_one(
+                {'_id': job_id, 'worker': self.worker_id},
+                {'$set': {'status': 'queued', 'worker': None, 'lease_until': None}, '$inc': {'attempts': -1}},
+            )
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            error = str(e)
+        finally:
+            transfer_progress.reset(token)
+        ticker.cancel()
+        await self._complete(job, status, result, error)
+
+    async def _complete(self, job: _Job, status: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        job_id = job.doc['_id']
+        progress = job.sample() if job_id in self._jobs else job.doc.get('progress')
+        update = {'status': status, 'result': result, 'error': error, 'progress': progress,
+                  'lease_until': None, 'finished_at': time.time()}
+        job.doc.update(update)
+        # Filtered on the worker: a job whose lease was lost belongs to whoever claimed it since
+        written = await self.collection.update_one({'_id': job_id, 'worker': self.worker_id}, {'$set': update})
+        self._jobs.pop(job_id, None)
+        if not written.modified_count:
+            logger.warning("Job %s: lease lost, result %s discarded", job_id, status)
+            return
+        if status == 'done':
+            self.completed += 1
+        elif status == 'failed':
+            self.failed += 1
+        logger.info("Job %s %s: %s", job_id, status, error or (result or {}).get('page_url'))
+
+    async def _tick(self, job: _Job) -> None:
+        job._sample = (time.monotonic(), 0)   # the rate counts from the start, not from submission
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(JOB_TICK)
+            job.doc['progress'] = job.sample()
+            if time.monotonic() - renewed < JOB_HEARTBEAT:
+                continue
+            renewed = time.monotonic()
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {'_id': job.doc['_id'], 'worker': self.worker_id},
+                    {'$set': {'progress': job.doc['progress'], 'lease_until': time.time() + JOB_LEASE}},
+                    return_document=ReturnDocument.AFTER,
+                )
+            except Exception as e:
+                logger.warning("Job %s: heartbeat failed: %s", job.doc['_id'], e)
+                continue
+            if doc is None:
+                logger.warning("Job %s: lease taken over by another worker, stopping", job.doc['_id'])
+                job.cancel_event.set()
+                return
+            if doc.get('cancel_requested'):
+                job.cancel_event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'worker_id': self.worker_id,
+            'workers': self.workers,
+            'running': len(self._jobs),
+            'completed': self.completed,
+            'failed': self.failed,
+            'reclaimed': self.reclaimed,
+        }
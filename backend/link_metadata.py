@@ -0,0 +1,97 @@
+"""
+GigaFile link metadata with a TTL cache.
+
+Filename, size, content type and liveness of a link come from one
+zero-length ranged request (`Range: bytes=0-0`, see
+GigaFileProxy._fetch_metadata) instead of a full download. Results are
+cached per (server, file_id); dead links are kept longer than live ones,
+since an expired link never comes back. Concurrent lookups of one link
+share a single request. The proxy also stores what it learns from its own
+downloads here, so a link that was just downloaded costs no extra request.
+
+Metadata dicts: alive, filename, size, content_type, etag, last_modified,
+checked_at (unix time).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LINK_META_TTL = 600          # seconds a live link's metadata is reused
+LINK_META_DEAD_TTL = 3600    # seconds an expired link is remembered as dead
+LINK_META_MAX_ENTRIES = 10000
+
+
+class LinkMetadataCache:
+    def __init__(self, ttl: float = LINK_META_TTL, dead_ttl: float = LINK_META_DEAD_TTL):
+        self.ttl = ttl
+        self.dead_ttl = dead_ttl
+        self._entries: 'OrderedDict[Tuple[str, str], Dict[str, Any]]' = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _fresh(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        meta = self._entries.get(key)
+        if meta is None:
+            return None
+        ttl = self.ttl if meta['alive'] else self.dead_ttl
+        if time.time() - meta['checked_at'] > ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return meta
+
+    async def get(
+        self,
+        key: Tuple[str, str],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Cached metadata for `key`, or the result of `fetch()` (shared by concurrent callers)."""
+        meta = self._fresh(key)
+        if meta is not None:
+            self.hits += 1
+            return meta
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            meta = await fetch()
+            self.put(key, meta)
+            future.set_result(meta)
+            return meta
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()   # retrieved here so a future nobody waits on does not log
+            raise
+        finally:
+            del self._pending[key]
+
+    def put(self, key: Tuple[str, str], meta: Dict[str, Any]) -> None:
+        meta.setdefault('checked_at', time.time())
+        self._entries[key] = meta
+        self._entries.move_to_end(key)
+        while len(self._entries) > LINK_META_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+        }
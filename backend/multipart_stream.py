@@ -0,0 +1,138 @@
+"""
+Incremental multipart/form-data parsing for streamed uploads.
+
+request.form() spools every file part to a temporary file before the
+endpoint sees a byte. MultipartStream feeds request.stream() into
+python-multipart's push parser instead and hands out the parts one at a
+time, in body order: plain fields are read whole with value(), file parts
+are iterated with chunks() while they are still arriving. Nothing is read
+from the client faster than the consumer takes it.
+"""
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:   # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+MULTIPART_FIELD_LIMIT = 64 * 1024   # largest plain (non-file) field value
+
+
+class MultipartError(Exception):
+    pass
+
+
+class MultipartPart:
+    def __init__(self, stream: 'MultipartStream', headers: Dict[str, str]):
+        self._stream = stream
+        self.headers = headers
+        _, options = parse_options_header(headers.get('content-disposition', ''))
+        self.name = options.get(b'name', b'').decode('utf-8', errors='replace')
+        filename = options.get(b'filename')
+        self.filename: Optional[str] = filename.decode('utf-8', errors='replace') if filename is not None else None
+        self.content_type = headers.get('content-type')
+        self.done = False
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """The part's bytes as they arrive; each part can be read once."""
+        while not self.done:
+            event, data = await self._stream._next_event()
+            if event == 'data':
+                yield data
+            elif event == 'end':
+                self.done = True
+            else:
+                raise MultipartError("multipart body ended inside a part")
+
+    async def value(self, limit: int = MULTIPART_FIELD_LIMIT) -> str:
+        data = bytearray()
+        async for chunk in self.chunks():
+            data += chunk
+            if len(data) > limit:
+                raise MultipartError(f"form field {self.name!r} is longer than {limit} bytes")
+        return data.decode('utf-8', errors='replace')
+
+
+class MultipartStream:
+    def __init__(self, content_type: str, body: AsyncIterator[bytes]):
+        _, options = parse_options_header(content_type)
+        boundary = options.get(b'boundary')
+        if not boundary:
+            raise MultipartError("multipart/form-data without a boundary")
+        self._body = body.__aiter__()
+        self._events: Deque[Tuple[str, Any]] = deque()
+        self._headers: Dict[str, str] = {}
+        self._field = b''
+        self._value = b''
+        self._ended = False
+        self._parser = MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': lambda: self._events.append(('end', b'')),
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            # One write() can hold several parts: each 'headers' event carries its own copy
+            'on_headers_finished': lambda: self._events.append(('headers', dict(self._headers))),
+        })
+
+    # Parser callbacks: they run inside parser.write() and only queue events
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._events.append(('data', data[start:end]))
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        # latin-1 keeps the raw bytes; parse_options_header() re-encodes them, names are decoded as UTF-8 there
+        self._headers[self._field.decode('latin-1').lower()] = self._value.decode('latin-1')
+        self._field = b''
+        self._value = b''
+
+    async def _next_event(self) -> Tuple[str, Any]:
+        """Next parser event, reading more of the body only when none is queued; ('eof', b'') at the end."""
+        while not self._events:
+            if self._ended:
+                return 'eof', b''
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                self._ended = True
+                try:
+                    self._parser.finalize()
+                except FormParserError as e:
+                    raise MultipartError(str(e))
+                continue
+            try:
+                self._parser.write(chunk)
+            except FormParserError as e:
+                raise MultipartError(str(e))
+        return self._events.popleft()
+
+    async def parts(self) -> AsyncIterator[MultipartPart]:
+        """Parts in body order; a part not read to the end is skipped when the next one is requested."""
+        part: Optional[MultipartPart] = None
+        while True:
+            if part is not None and not part.done:
+                async for _ in part.chunks():
+                    pass
+            event, headers = await self._next_event()
+            if event == 'eof':
+                return
+            if event != 'headers':
+                raise MultipartError(f"unexpected multipart event {event!r}")
+            part = MultipartPart(self, headers)
+            yield part
@@ -0,0 +1,163 @@
+"""
+Accelerated upstream reads for /api/proxy: several byte ranges in parallel.
+
+One TCP flow from NN.gigafile.nu is often much slower than our link to the
+client. ParallelRangeReader splits the requested byte range into blocks,
+fetches up to `segments` blocks at once with Range requests and yields them
+in order through a reassembly buffer bounded by `budget` bytes. Data of the
+block at the head is yielded as it arrives, so time to first byte stays
+that of a single stream.
+
+If upstream answers a ranged request with anything but 206 (ranges refused)
+or a block fails, the reader stops the workers and continues from the
+current position with one ordinary stream.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+PROXY_ACCEL_SEGMENTS = 4                 # parallel upstream connections per download, 1 = off
+PROXY_ACCEL_BUFFER = 64 * 1024 * 1024    # reassembly buffer budget per download
+PROXY_ACCEL_MIN_SIZE = 32 * 1024 * 1024  # smaller bodies are not worth splitting
+PROXY_ACCEL_BLOCK = 8 * 1024 * 1024      # largest block fetched by one request
+ACCEL_READ = 256 * 1024
+
+
+class RangesRefused(Exception):
+    pass
+
+
+class _Block:
+    __slots__ = ('start', 'end', 'data', 'done')
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.data = bytearray()
+        self.done = False
+
+
+class ParallelRangeReader:
+    def __init__(
+        self,
+        first: aiohttp.ClientResponse,
+        start: int,
+        end: int,
+        fetch: Callable[[int, int], Awaitable[aiohttp.ClientResponse]],
+        fallback: Callable[[int, int], AsyncIterator[bytes]],
+        segments: int = PROXY_ACCEL_SEGMENTS,
+        budget: int = PROXY_ACCEL_BUFFER,
+    ):
+        """
+        `first` is the already open upstream response whose body starts at
+        `start`; it serves the first block. `fetch(s, e)` opens a ranged
+        request, `fallback(pos, end)` streams the rest on one connection.
+        """
+        self.first = first
+        self.fetch = fetch
+        self.fallback = fallback
+        self.segments = segments
+        self.end = end
+        block = max(ACCEL_READ, min(PROXY_ACCEL_BLOCK, budget // segments))
+        self.window = max(segments, budget // block)   # blocks fetched or buffered at once
+        self.blocks: List[Tuple[int, int]] = [(s, min(s + block - 1, end)) for s in range(start, end + 1, block)]
+        self.fell_back = False
+        self._buffers: Dict[int, _Block] = {}
+        self._next_fetch = 0
+        self._next_yield = 0
+        self._error: Optional[BaseException] = None
+        self._cond = asyncio.Condition()
+
+    async def _read_block(self, resp: aiohttp.ClientResponse, block: _Block) -> None:
+        remaining = block.end - block.start + 1
+        while remaining > 0:
+            data = await resp.content.read(min(ACCEL_READ, remaining))
+            if not data:
+                raise IOError(f"upstream closed {remaining} bytes before the end of block {block.start}")
+            block.data += data
+            remaining -= len(data)
+            async with self._cond:
+                self._cond.notify_all()
+
+    def _can_fetch(self) -> bool:
+        """A block may be fetched only while it fits the reassembly window."""
+        return (
+            self._error is not None
+            or self._next_fetch >= len(self.blocks)
+            or self._next_fetch < self._next_yield + self.window
+        )
+
+    async def _worker(self, first: Optional[aiohttp.ClientResponse]) -> None:
+        while self._error is None:
+            async with self._cond:
+                await self._cond.wait_for(self._can_fetch)
+            if self._error is not None or self._next_fetch >= len(self.blocks):
+                return
+            idx = self._next_fetch
+            self._next_fetch += 1
+            block = _Block(*self.blocks[idx])
+            self._buffers[idx] = block
+            try:
+                if first is not None:
+                    resp, first = first, None
+                else:
+                    resp = await self.fetch(block.start, block.end)
+                    if resp.status != 206:
+                        resp.close()
+                        raise RangesRefused(f"upstream answered {resp.status} to a range request")
+                try:
+                    await self._read_block(resp, block)
+                finally:
+                    resp.close()
+                block.done = True
+            except Exception as e:
+                self._error = e
+            async with self._cond:
+                self._cond.notify_all()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        workers = [asyncio.create_task(self._worker(self.first))]
+        workers += [asyncio.create_task(self._worker(None)) for _ in range(min(self.segments, len(self.blocks)) - 1)]
+        pos = self.blocks[0][0]
+        try:
+            for idx in range(len(self.blocks)):
+                offset = 0
+                while True:
+                    async with self._cond:
+                        await self._cond.wait_for(
+                            lambda: self._error is not None or (
+                                idx in self._buffers
+                                and (len(self._buffers[idx].data) > offset or self._buffers[idx].done)
+                            )
+                        )
+                    block = self._buffers.get(idx)
+                    if block is not None and len(block.data) > offset:
+                        data = bytes(block.data[offset:offset + ACCEL_READ])
+                        offset += len(data)
+                        pos += len(data)
+                        yield data
+                        continue
+                    if block is not None and block.done:
+                        break
+                    raise self._error
+                del self._buffers[idx]
+                self._next_yield = idx + 1
+                async with self._cond:
+                    self._cond.notify_all()
+        except (RangesRefused, aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+            logger.info("Parallel proxy read fell back to one stream at byte %d: %s", pos, e)
+            self.fell_back = True
+            for task in workers:
+                task.cancel()
+            self._buffers.clear()
+            async for chunk in self.fallback(pos, self.end):
+                yield chunk
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.first.close()
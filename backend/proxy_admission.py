@@ -0,0 +1,158 @@
+"""
+Admission control and backpressure for /api/proxy streams.
+
+- Caps on concurrent streams and on the bytes they may hold in memory
+  (per-stream read buffers plus fan-out rings). A request over either cap
+  gets an immediate 503 with Retry-After instead of queueing.
+- Optional token buckets per connection and for all proxy traffic.
+- Idle-client detection: a stream whose client has not taken a chunk for
+  PROXY_IDLE_TIMEOUT seconds is aborted - its body generator is closed
+  (which closes the upstream response, leaves the fan-out ring or unpins
+  the cache entry) and its admission released without waiting for the client.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from transfer_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+PROXY_MAX_STREAMS = 256
+PROXY_MAX_BUFFER_BYTES = 512 * 1024 * 1024
+PROXY_STREAM_BUFFER = 512 * 1024    # charged per stream: one read chunk plus one in the transport
+PROXY_RETRY_AFTER = 5               # seconds, sent with 503
+PROXY_IDLE_TIMEOUT = 60             # seconds a client may leave a chunk untaken
+
+
+class ProxyTicket:
+    """One admitted proxy stream."""
+
+    def __init__(self, admission: 'ProxyAdmission', rate: float):
+        self.admission = admission
+        self.bucket = TokenBucket(rate) if rate else None
+        self.started = time.monotonic()
+        self.waiting_since: Optional[float] = None   # set while the client holds a chunk
+        self.bytes = 0
+        self.released = False
+        self._body = None
+
+    def idle(self, now: float, timeout: float) -> bool:
+        return self.waiting_since is not None and now - self.waiting_since > timeout
+
+    def abort(self) -> None:
+        self.release()
+        if self._body is not None:
+            asyncio.create_task(self._close(self._body))
+
+    @staticmethod
+    async def _close(body) -> None:
+        try:
+            # The generator is parked at `yield` while the server waits on the client
+            await body.aclose()
+        except RuntimeError:
+            pass   # the client resumed meanwhile; the released flag ends the stream
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.admission._release(self)
+
+    def wrap(self, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Throttle `body` and track when the client stops taking chunks."""
+        self._body = self._wrap(body)
+        return self._body
+
+    async def _wrap(self, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                if self.bucket:
+                    await self.bucket.consume(len(chunk))
+                if self.admission.bucket:
+                    await self.admission.bucket.consume(len(chunk))
+                if self.released:
+                    return
+                self.waiting_since = time.monotonic()
+                yield chunk
+                self.waiting_since = None
+                self.bytes += len(chunk)
+        finally:
+            self.release()
+            aclose = getattr(body, 'aclose', None)
+            if aclose:
+                await aclose()
+
+
+class ProxyAdmission:
+    def __init__(
+        self,
+        max_streams: int = PROXY_MAX_STREAMS,
+        max_buffer: int = PROXY_MAX_BUFFER_BYTES,
+        stream_rate: float = 0,
+        total_rate: float = 0,
+        idle_timeout: float = PROXY_IDLE_TIMEOUT,
+    ):
+        self.max_streams = max_streams
+        self.max_buffer = max_buffer
+        self.stream_rate = stream_rate
+        self.bucket = TokenBucket(total_rate) if total_rate else None
+        self.idle_timeout = idle_timeout
+        self.tickets: set = set()
+        self.reserved = 0       # bytes held by shared buffers (fan-out rings)
+        self.admitted = 0
+        self.rejected = 0
+        self.idle_aborts = 0
+        self._watchdog: Optional[asyncio.Task] = None
+
+    @property
+    def buffered(self) -> int:
+        return len(self.tickets) * PROXY_STREAM_BUFFER + self.reserved
+
+    def admit(self) -> Optional[ProxyTicket]:
+        """A ticket for one more stream, or None when the proxy is saturated."""
+        if len(self.tickets) >= self.max_streams or self.buffered + PROXY_STREAM_BUFFER > self.max_buffer:
+            self.rejected += 1
+            return None
+        ticket = ProxyTicket(self, self.stream_rate)
+        self.tickets.add(ticket)
+        self.admitted += 1
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch())
+        return ticket
+
+    def reserve(self, nbytes: int) -> bool:
+        """Take `nbytes` of the buffer budget for a shared buffer; False if it does not fit."""
+        if self.buffered + nbytes > self.max_buffer:
+            return False
+        self.reserved += nbytes
+        return True
+
+    def unreserve(self, nbytes: int) -> None:
+        self.reserved -= nbytes
+
+    def _release(self, ticket: ProxyTicket) -> None:
+        self.tickets.discard(ticket)
+
+    async def _watch(self) -> None:
+        """Abort streams whose client stopped reading; runs while streams are open."""
+        while self.tickets:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            now = time.monotonic()
+            for ticket in [t for t in self.tickets if t.idle(now, self.idle_timeout)]:
+                logger.info(
+                    "Proxy: client idle for %ds after %d bytes - aborting stream", self.idle_timeout, ticket.bytes,
+                )
+                self.idle_aborts += 1
+                ticket.abort()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'streams': len(self.tickets),
+            'max_streams': self.max_streams,
+            'buffered': self.buffered,
+            'max_buffer': self.max_buffer,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'idle_aborts': self.idle_aborts,
+        }
@@ -0,0 +1,238 @@
+"""
+Disk cache for /api/proxy downloads, keyed by GigaFile server + file_id.
+
+- A miss starts a background fill that writes the upstream body to disk;
+  every reader (the first client included) streams from the file and
+  follows the fill, so a partially filled entry can already be served.
+- Complete entries are served with FileResponse (zero-copy where the ASGI
+  server supports the pathsend extension), range requests with pread.
+- Byte quota with LRU eviction; entries past their TTL or whose link is
+  reported expired go first and are never served. Filling and in-use
+  entries are pinned: a pinned entry that has to go leaves the index at
+  once, but its file is only removed when the last reader releases it.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+PROXY_CACHE_BYTES = 50 * 1024 ** 3    # default byte quota (50 GB)
+PROXY_CACHE_TTL = 24 * 3600           # an entry is never served after this age
+PROXY_CACHE_REVALIDATE = 3600         # re-check that the link is alive after this long
+PROXY_CACHE_READ = 256 * 1024         # pread size for readers
+PROXY_CACHE_FILL_READ = 2 * 1024 * 1024
+
+
+class ProxyCacheEntry:
+    def __init__(self, key: Tuple[str, str], path: str, size: int, headers: Dict[str, str]):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.headers = headers          # Content-Type, Content-Disposition, ETag, Last-Modified
+        self.written = 0
+        self.complete = False
+        self.failed = False
+        self.created = time.time()
+        self.validated = self.created
+        self.refs = 0
+        self.dropped = False            # out of the index; the file goes with the last release
+        self._progress = asyncio.Condition()
+
+    def reachable(self, offset: int, slack: int) -> bool:
+        return self.complete or offset <= self.written + slack
+
+    async def _notify(self) -> None:
+        async with self._progress:
+            self._progress.notify_all()
+
+    async def wait_for(self, offset: int) -> None:
+        """Wait until byte `offset` is on disk (or the fill has ended)."""
+        async with self._progress:
+            await self._progress.wait_for(lambda: self.written > offset or self.complete or self.failed)
+
+    async def read(self, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive), following the fill if it is still running."""
+        loop = asyncio.get_running_loop()
+        fd = os.open(self.path, os.O_RDONLY)   # stays readable even if the entry is evicted meanwhile
+        try:
+            pos = start
+            while pos <= end:
+                if self.written <= pos:
+                    await self.wait_for(pos)
+                    if self.failed or self.written <= pos:
+                        raise IOError(f"Proxy cache fill of {self.key[1]} failed at byte {self.written}")
+                n = min(PROXY_CACHE_READ, end + 1 - pos, self.written - pos)
+                data = await loop.run_in_executor(None, os.pread, fd, n, pos)
+                if not data:
+                    raise IOError(f"Proxy cache file of {self.key[1]} is short at byte {pos}")
+                pos += len(data)
+                yield data
+        finally:
+            os.close(fd)
+
+
+class ProxyCache:
+    def __init__(self, directory: str, max_bytes: int = PROXY_CACHE_BYTES, ttl: float = PROXY_CACHE_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry = max_bytes // 4      # bigger files are proxied without caching
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        # Entries do not survive a restart; remove files left by the previous run
+        for name in os.listdir(directory):
+            if name.endswith('.cache'):
+                self._unlink(os.path.join(directory, name))
+        self._entries: 'OrderedDict[Tuple[str, str], ProxyCacheEntry]' = OrderedDict()
+        self._fills: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_filled = 0
+
+    @property
+    def used(self) -> int:
+        return sum(e.size for e in self._entries.values())
+
+    def cacheable(self, size: Optional[int]) -> bool:
+        return size is not None and 0 < size <= self.max_entry
+
+    def get(self, key: Tuple[str, str]) -> Optional[ProxyCacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.time() - entry.created > self.ttl and entry.complete:
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def needs_revalidation(self, entry: ProxyCacheEntry) -> bool:
+        return entry.complete and time.time() - entry.validated > PROXY_CACHE_REVALIDATE
+
+    def expired(self, key: Tuple[str, str]) -> None:
+        """GigaFile reports the link gone - never serve it again."""
+        if key in self._entries:
+            logger.info("Proxy cache: link %s/%s expired", *key)
+            self._drop(key)
+
+    def fill(
+        self,
+        key: Tuple[str, str],
+        resp: aiohttp.ClientResponse,
+        headers: Dict[str, str],
+        body: Optional[AsyncIterator[bytes]] = None,
+    ) -> ProxyCacheEntry:
+        """
+        Start writing the 200 response `resp` (or `body`, an iterator over
+        its bytes) to disk in the background and return the entry. If another
+        request started the same fill meanwhile, its entry is returned and
+        `resp` is dropped.
+        """
+        existing = self._entries.get(key)
+        if existing is not None and not existing.failed:
+            resp.close()
+            return existing
+        # Unique per fill: a dropped entry may still be read from while the next fill of the key runs
+        name = f"{key[0]}_{re.sub(r'[^0-9A-Za-z-]', '_', key[1])}_{uuid.uuid4().hex[:8]}.cache"
+        path = os.path.join(self.directory, name)
+        entry = ProxyCacheEntry(key, path, resp.content_length, headers)
+        # Created here so readers can open the file before the fill task runs
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self._entries[key] = entry
+        self._evict()
+        task = asyncio.create_task(self._fill(entry, fd, resp, body))
+        self._fills.add(task)
+        task.add_done_callback(self._fills.discard)
+        return entry
+
+    async def _fill(
+        self, entry: ProxyCacheEntry, fd: int, resp: aiohttp.ClientResponse, body: Optional[AsyncIterator[bytes]],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        source = body if body is not None else resp.content.iter_chunked(PROXY_CACHE_FILL_READ)
+        try:
+            async for chunk in source:
+                await loop.run_in_executor(None, os.pwrite, fd, chunk, entry.written)
+                entry.written += len(chunk)
+                self.bytes_filled += len(chunk)
+                await entry._notify()
+            if entry.written != entry.size:
+                raise IOError(f"upstream sent {entry.written} of {entry.size} bytes")
+            entry.complete = True
+            logger.info("Proxy cache filled %s/%s (%d bytes)", *entry.key, entry.size)
+        except Exception as e:
+            logger.warning("Proxy cache fill of %s/%s failed: %s", *entry.key, e)
+            entry.failed = True
+            if self._entries.get(entry.key) is entry:
+                self._drop(entry.key)
+        finally:
+            os.close(fd)
+            if body is not None:
+                await body.aclose()
+            resp.close()
+            await entry._notify()
+            self._evict()
+
+    def pin(self, entry: ProxyCacheEntry) -> None:
+        entry.refs += 1
+
+    def release(self, entry: ProxyCacheEntry) -> None:
+        entry.refs -= 1
+        if entry.dropped and entry.refs == 0:
+            self._unlink(entry.path)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Stale entries first, then least recently used ones, until the quota holds."""
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if entry.complete and entry.refs == 0 and now - entry.created > self.ttl:
+                self._drop(key)
+        for key, entry in list(self._entries.items()):
+            if self.used <= self.max_bytes:
+                break
+            if entry.complete and entry.refs == 0:
+                self._drop(key)
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        entry.dropped = True
+        if entry.refs == 0:
+            self._unlink(entry.path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    async def close(self) -> None:
+        for task in list(self._fills):
+            task.cancel()
+        await asyncio.gather(*self._fills, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'filling': sum(1 for e in self._entries.values() if not e.complete),
+            'bytes': self.used,
+            'quota': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'bytes_served': self.bytes_served,
+            'bytes_filled': self.bytes_filled,
+        }
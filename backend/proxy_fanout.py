@@ -0,0 +1,160 @@
+"""
+Single-flight fan-out of one upstream /api/proxy stream to many clients.
+
+When a link is shared in a big chat, dozens of clients request the same
+file within seconds. The first request opens the upstream stream; later
+ones join it and read from a bounded in-memory ring buffer instead of
+opening their own connection.
+
+- The leader (upstream reader) is paced by the fastest reader: it stops
+  when it would overwrite bytes the fastest reader has not consumed yet.
+- A reader whose position falls out of the ring (too far behind) is
+  detached and continues from its own upstream connection with Range.
+- The upstream stream is closed when its last reader leaves.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+FANOUT_RING_BYTES = 32 * 1024 * 1024   # ring buffer per shared stream
+FANOUT_READ = 256 * 1024               # upstream read / reader copy size
+
+
+class FanoutStream:
+    complete = False   # never the whole file on disk; see ProxyCacheEntry
+
+    def __init__(
+        self,
+        key: Tuple[str, str],
+        resp: aiohttp.ClientResponse,
+        headers: Dict[str, str],
+        reopen: Callable[[int, int], AsyncIterator[bytes]],
+        on_done,
+        capacity: int = FANOUT_RING_BYTES,
+        body: Optional[AsyncIterator[bytes]] = None,
+    ):
+        self.key = key
+        self.size = resp.content_length
+        self.headers = headers
+        self.capacity = min(capacity, self.size)   # small files do not need the whole ring
+        self.head = 0          # absolute offset of the next byte from upstream
+        self.ended = False
+        self.failed = False
+        self.joined = 0
+        self.detached = 0
+        self._ring = bytearray(self.capacity)
+        self._readers: Dict[int, int] = {}   # reader id -> absolute position
+        self._next_id = 0
+        self._reopen = reopen
+        self._on_done = on_done
+        self._cond = asyncio.Condition()
+        self._task = asyncio.create_task(self._pump(resp, body))
+
+    @property
+    def tail(self) -> int:
+        """Oldest byte still in the ring."""
+        return max(0, self.head - self.capacity)
+
+    @property
+    def readers(self) -> int:
+        return len(self._readers)
+
+    def reachable(self, offset: int, slack: int) -> bool:
+        return not self.ended and self.tail <= offset <= self.head + slack
+
+    def _has_space(self) -> bool:
+        fastest = max(self._readers.values(), default=0)
+        return self.head + self._next_read() - fastest <= self.capacity
+
+    def _next_read(self) -> int:
+        return min(FANOUT_READ, self.size - self.head)
+
+    async def _pump(self, resp: aiohttp.ClientResponse, body: Optional[AsyncIterator[bytes]]) -> None:
+        source = body if body is not None else resp.content.iter_chunked(FANOUT_READ)
+        try:
+            async for chunk in source:
+                view = memoryview(chunk)
+                while view:
+                    if self.head >= self.size:
+                        raise IOError(f"upstream sent more than {self.size} bytes")
+                    async with self._cond:
+                        await self._cond.wait_for(self._has_space)
+                    n = min(len(view), self._next_read())
+                    pos = self.head % self.capacity
+                    first = min(n, self.capacity - pos)
+                    self._ring[pos:pos + first] = view[:first]
+                    if first < n:
+                        self._ring[:n - first] = view[first:n]
+                    self.head += n
+                    view = view[n:]
+                    async with self._cond:
+                        self._cond.notify_all()
+            if self.head < self.size:
+                raise IOError(f"upstream sent {self.head} of {self.size} bytes")
+        except asyncio.CancelledError:
+            self.failed = self.head < self.size
+        except Exception as e:
+            logger.warning("Proxy fan-out of %s/%s failed at byte %d: %s", *self.key, self.head, e)
+            self.failed = True
+        finally:
+            self.ended = True
+            if body is not None:
+                await body.aclose()
+            resp.close()
+            async with self._cond:
+                self._cond.notify_all()
+            await self._on_done(self)
+
+    def _copy(self, pos: int, n: int) -> bytes:
+        start = pos % self.capacity
+        first = min(n, self.capacity - start)
+        data = bytes(self._ring[start:start + first])
+        if first < n:
+            data += bytes(self._ring[:n - first])
+        return data
+
+    async def read(self, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) from the ring, or from an own connection once too far behind."""
+        rid = self._next_id
+        self._next_id += 1
+        self._readers[rid] = start
+        self.joined += 1
+        pos = start
+        try:
+            while pos <= end:
+                if pos < self.tail or (pos >= self.head and self.ended):
+                    # Fell out of the ring (or the shared stream broke off) - continue
+                    # on an own connection instead of holding the leader back
+                    self.detached += 1
+                    del self._readers[rid]
+                    logger.info("Proxy fan-out %s/%s: reader detached at byte %d", *self.key, pos)
+                    async for chunk in self._reopen(pos, end):
+                        yield chunk
+                    return
+                if pos >= self.head:
+                    async with self._cond:
+                        await self._cond.wait_for(lambda: self.head > pos or self.ended)
+                    continue
+                n = min(FANOUT_READ, end + 1 - pos, self.head - pos)
+                data = self._copy(pos, n)
+                pos += n
+                self._readers[rid] = pos
+                async with self._cond:
+                    self._cond.notify_all()
+                yield data
+        finally:
+            self._readers.pop(rid, None)
+            if not self._readers and not self.ended:
+                # Last reader gone - nobody to share the upstream stream with
+                self._task.cancel()
+            else:
+                async with self._cond:
+                    self._cond.notify_all()
+
+    async def close(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
@@ -1,23 +1,34 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 import asyncio
-import aiohttp
-import re
 import tempfile
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 
 from aiogram.types import Update
 from gigafile_client import gigafile_client
+from gigafile_proxy import gigafile_proxy
+from job_worker import WorkerProcesses, run_transfer_job, spool_cache_share
+from jobs import JobManager
+from multipart_stream import MultipartError, MultipartPart, MultipartStream
+from transfer_scheduler import transfer_scheduler
+from proxy_admission import ProxyAdmission
+from proxy_cache import ProxyCache
+from spool_cache import SpoolCache
+from upload_dedup import UploadDedupIndex, new_hasher
+from upload_journal import FileUploadJournal, MongoUploadJournal
+from upload_sessions import UploadSessionManager
+from webhook_pipeline import WebhookPipeline, chat_key
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -32,23 +43,136 @@ MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ['DB_NAME']
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
 BACKEND_URL = os.environ.get('BACKEND_URL', '')
+UPLOAD_JOURNAL = os.environ.get('UPLOAD_JOURNAL', 'mongo')  # mongo | file | off
+UPLOAD_JOURNAL_DIR = os.environ.get('UPLOAD_JOURNAL_DIR', str(ROOT_DIR / 'upload_journal'))
+UPLOAD_DEDUP = os.environ.get('UPLOAD_DEDUP', 'on')  # on | off
+SPOOL_CACHE_GB = float(os.environ.get('SPOOL_CACHE_GB', '20'))  # 0 = no spool cache
+SPOOL_CACHE_DIR = os.environ.get('SPOOL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gigafile_spool_cache'))
+PROXY_CACHE_GB = float(os.environ.get('PROXY_CACHE_GB', '50'))  # 0 = no proxy cache
+PROXY_CACHE_DIR = os.environ.get('PROXY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gigafile_proxy_cache'))
+PROXY_MAX_STREAMS = int(os.environ.get('PROXY_MAX_STREAMS', '256'))
+PROXY_MAX_BUFFER_MB = int(os.environ.get('PROXY_MAX_BUFFER_MB', '512'))
+PROXY_CLIENT_RATE_MBPS = float(os.environ.get('PROXY_CLIENT_RATE_MBPS', '0'))  # per connection, 0 = unlimited
+PROXY_TOTAL_RATE_MBPS = float(os.environ.get('PROXY_TOTAL_RATE_MBPS', '0'))    # all proxy traffic, 0 = unlimited
+PROXY_IDLE_TIMEOUT = int(os.environ.get('PROXY_IDLE_TIMEOUT', '60'))
+PROXY_ACCEL_SEGMENTS = int(os.environ.get('PROXY_ACCEL_SEGMENTS', '4'))     # parallel ranges per download, 1 = off
+PROXY_ACCEL_BUFFER_MB = int(os.environ.get('PROXY_ACCEL_BUFFER_MB', '64'))  # reassembly buffer per download
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', '2'))  # 0 = run jobs inside the server
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))  # concurrent jobs per worker process (or in the server)
+UPLOAD_BATCH_PARALLELISM = int(os.environ.get('UPLOAD_BATCH_PARALLELISM', '4'))  # /api/upload/batch, all batches
+UPLOAD_SESSIONS_MAX = int(os.environ.get('UPLOAD_SESSIONS_MAX', '16'))  # open resumable browser uploads
+STREAM_UPLOAD_MEMORY_MB = int(os.environ.get('STREAM_UPLOAD_MEMORY_MB', '512'))  # chunk buffers of streamed uploads
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '8'))  # bot updates handled at once
+WEBHOOK_QUEUE = int(os.environ.get('WEBHOOK_QUEUE', '1000'))  # bot updates waiting; more are refused with 503
+WEBHOOK_MAX_RUNNING = int(os.environ.get('WEBHOOK_MAX_RUNNING', '256'))  # bot handlers running, uploads included
 
 mongo_client = AsyncIOMotorClient(MONGO_URL)
 db = mongo_client[DB_NAME]
 
 
+async def _on_upload_resumed(entry: dict, result: dict):
+    """Record an upload finished after a restart and tell the bot user, if any."""
+    if result.get('success'):
+        await db.uploads.insert_one({
+            'page_url': result['page_url'],
+            'direct_url': result['direct_url'],
+            'filename': result.get('filename'),
+            'resumed': True,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+        })
+    if BOT_TOKEN and entry.get('meta', {}).get('chat_id'):
+        from bot import notify_resumed_upload
+        await notify_resumed_upload(entry['meta'], result)
+
+
+async def _notify_bot_job(job_id: str, meta: dict):
+    """Deliver the links of a bot job whose chat stopped waiting for it when the server restarted."""
+    job = await job_manager.wait(job_id)
+    if job is not None:
+        from bot import notify_resumed_upload
+        await notify_resumed_upload(meta, job.get('result') or {'success': False, 'error': job.get('error')})
+
+
+# Transfers run in worker processes (job_worker.py); with JOB_WORKER_PROCESSES=0 in this process
+job_manager = JobManager(
+    db.jobs, run_transfer_job, workers=0 if JOB_WORKER_PROCESSES else JOB_WORKERS, shards=JOB_WORKER_PROCESSES,
+)
+worker_processes = WorkerProcesses(JOB_WORKER_PROCESSES)
+upload_sessions = UploadSessionManager(gigafile_client, max_sessions=UPLOAD_SESSIONS_MAX)
+
+
+async def _feed_update(update: Update):
+    from bot import bot, dp
+    await dp.feed_update(bot, update)
+
+
+webhook_pipeline = WebhookPipeline(
+    _feed_update, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE, max_running=WEBHOOK_MAX_RUNNING,
+)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if UPLOAD_JOURNAL == 'mongo':
+        gigafile_client.journal = MongoUploadJournal(db.upload_journal)
+    elif UPLOAD_JOURNAL == 'file':
+        gigafile_client.journal = FileUploadJournal(UPLOAD_JOURNAL_DIR)
+    gigafile_client.batch_parallelism = UPLOAD_BATCH_PARALLELISM
+    gigafile_client.stream_memory = STREAM_UPLOAD_MEMORY_MB * 1024 * 1024
+    if UPLOAD_DEDUP == 'on':
+        gigafile_client.dedup = UploadDedupIndex(db.upload_hashes)
+    if SPOOL_CACHE_GB > 0:
+        # Shared with the worker processes (job_worker.py): every process caches in its own directory
+        gigafile_client.spool_cache = SpoolCache(
+            os.path.join(SPOOL_CACHE_DIR, 'server') if JOB_WORKER_PROCESSES else SPOOL_CACHE_DIR,
+            spool_cache_share(int(SPOOL_CACHE_GB * 1024 ** 3), JOB_WORKER_PROCESSES),
+        )
+    if PROXY_CACHE_GB > 0:
+        gigafile_proxy.cache = ProxyCache(PROXY_CACHE_DIR, int(PROXY_CACHE_GB * 1024 ** 3))
+    gigafile_proxy.admission = ProxyAdmission(
+        max_streams=PROXY_MAX_STREAMS,
+        max_buffer=PROXY_MAX_BUFFER_MB * 1024 * 1024,
+        stream_rate=PROXY_CLIENT_RATE_MBPS * 1024 * 1024,
+        total_rate=PROXY_TOTAL_RATE_MBPS * 1024 * 1024,
+        idle_timeout=PROXY_IDLE_TIMEOUT,
+    )
+    gigafile_proxy.accel_segments = PROXY_ACCEL_SEGMENTS
+    gigafile_proxy.accel_buffer = PROXY_ACCEL_BUFFER_MB * 1024 * 1024
+    await job_manager.start()
+    worker_processes.start()
+
+    bot_jobs = []
     if BOT_TOKEN:
+        webhook_pipeline.start()
         from bot import setup_webhook
         webhook_url = f"{BACKEND_URL}/api/webhook"
-        await setup_webhook(BOT_TOKEN, webhook_url, BACKEND_URL)
+        await setup_webhook(BOT_TOKEN, webhook_url, BACKEND_URL, jobs=job_manager)
+        unfinished = db.jobs.find({'status': {'$in': ['queued', 'running']}, 'meta.chat_id': {'$exists': True}})
+        async for job in unfinished:
+            bot_jobs.append(asyncio.create_task(_notify_bot_job(job['_id'], job['meta'])))
     else:
         logger.warning("TELEGRAM_BOT_TOKEN not set - bot disabled")
+
+    # Continue uploads interrupted by the previous shutdown (same token, missing chunks only);
+    # uploads of jobs are continued by the worker that claims the job again
+    resume_task = asyncio.create_task(gigafile_client.resume_pending(
+        on_done=_on_upload_resumed, include=lambda entry: 'job_id' not in entry.get('meta', {}),
+    ))
     yield
+    resume_task.cancel()
+    await asyncio.gather(resume_task, return_exceptions=True)
+    await webhook_pipeline.close()
+    for task in bot_jobs:
+        task.cancel()
+    await asyncio.gather(*bot_jobs, return_exceptions=True)
+    await worker_processes.close()
+    await job_manager.close()
+    await upload_sessions.close()
     if BOT_TOKEN:
         from bot import teardown_webhook
         await teardown_webhook()
+    await gigafile_client.close()
+    await gigafile_proxy.close()
     mongo_client.close()
 
 
@@ -77,9 +201,89 @@ class UploadResponse(BaseModel):
     error: Optional[str] = None
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    duration: int = 100
+
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int                  # bytes received; the next PUT starts here
+    complete: bool
+    result: Optional[UploadResponse] = None
+
+
+class BatchUploadItem(BaseModel):
+    url: str
+    duration: Optional[int] = None
+
+
+class BatchUploadRequest(BaseModel):
+    items: List[BatchUploadItem]
+    duration: int = 100          # for items without their own
+
+
+class BatchUploadResult(UploadResponse):
+    index: int                   # position in `items`
+    source_url: str
+
+
+class LinkMetadata(BaseModel):
+    alive: bool
+    page_url: str
+    direct_url: str
+    proxy_url: Optional[str] = None
+    filename: Optional[str] = None
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    checked_at: float
+
+
+class ZipRequest(BaseModel):
+    urls: List[str]
+    name: Optional[str] = None
+
+
+class JobRequest(BaseModel):
+    url: str
+    duration: int = 100
+
+
+class JobProgress(BaseModel):
+    stage: Optional[str] = None
+    percent: int = 0
+    size: Optional[int] = None
+    downloaded: int = 0
+    uploaded: int = 0
+    rate: Optional[int] = None   # bytes/s
+    eta: Optional[int] = None    # seconds
+
+
+class JobStatus(BaseModel):
+    id: str
+    status: str                  # queued | running | done | failed | cancelled
+    attempts: int = 0
+    url: str
+    duration: int
+    progress: Optional[JobProgress] = None
+    result: Optional[UploadResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
 @api_router.get("/")
 async def root():
-    return {"message": "GigaFile Proxy API", "endpoints": ["/api/upload", "/api/proxy"]}
+    return {
+        "message": "GigaFile Proxy API",
+        "endpoints": ["/api/upload", "/api/proxy", "/api/meta", "/api/zip", "/api/jobs"],
+    }
 
 
 @api_router.post("/status", response_model=StatusCheck)
@@ -102,79 +306,148 @@ async def get_status_checks():
 
 
 # Telegram Webhook
-_seen_updates: set = set()
-
 @api_router.post("/webhook", include_in_schema=False)
 async def telegram_webhook(request: Request):
-    from bot import bot, dp
+    from bot import bot
     if not bot:
         return Response(status_code=200)
     try:
         data = await request.json()
-        update_id = data.get("update_id")
-        if update_id in _seen_updates:
-            return Response(status_code=200)
-        _seen_updates.add(update_id)
-        if len(_seen_updates) > 5000:
-            _seen_updates.clear()
-
         update = Update.model_validate(data)
-        asyncio.create_task(dp.feed_update(bot, update))
+        # Deduplicated, queued per chat and handled by a fixed pool of workers
+        if webhook_pipeline.submit(data.get("update_id"), chat_key(data), update) == 'shed':
+            # Telegram keeps the update and sends it again later
+            return Response(status_code=503, headers={'Retry-After': '5'})
     except Exception as e:
         logger.exception("Webhook processing error: %s", e)
     return Response(status_code=200)
 
 
 # GigaFile Upload API
-UPLOAD_READ_CHUNK = 1 * 1024 * 1024  # 1MB streaming read for file uploads
+UPLOAD_READ_CHUNK = 1 * 1024 * 1024  # 1MB writes when a file part has to be spooled
+UPLOAD_BATCH_MAX_ITEMS = 1000
 
-@api_router.post("/upload", response_model=UploadResponse, summary="Upload file to GigaFile.nu")
-async def upload_to_gigafile(
-    file: Optional[UploadFile] = File(None),
-    url: Optional[str] = Form(None),
-    duration: int = Form(100),
-):
-    if duration not in {3, 5, 7, 14, 30, 60, 100}:
-        duration = 100
 
+def _duration(value: Optional[str]) -> int:
+    try:
+        duration = int(value)
+    except (TypeError, ValueError):
+        return 100
+    return duration if duration in {3, 5, 7, 14, 30, 60, 100} else 100
+
+
+def _declared_size(value: Optional[str]) -> Optional[int]:
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+
+def _upload_response(result: dict, duration: int) -> UploadResponse:
+    if not result.get('success'):
+        return UploadResponse(success=False, error=result.get('error'))
+
+    proxy_url = f"{BACKEND_URL}/api/proxy?url={result['page_url']}"
+    if result.get('expires_at'):
+        # Reused link from an identical earlier upload - report its real expiry
+        expires = datetime.fromtimestamp(result['expires_at'], timezone.utc).isoformat()
+    else:
+        expires = (datetime.now(timezone.utc) + timedelta(days=duration)).isoformat()
+
+    return UploadResponse(
+        success=True,
+        url=result['page_url'],
+        raw_url=result['direct_url'],
+        proxy_url=proxy_url,
+        expires=expires,
+        filename=result.get('filename'),
+    )
+
+
+async def _spool_part(part: MultipartPart) -> Tuple[str, str]:
+    """Write a file part to a temp file off the event loop -> (path, sha256 for dedup)."""
+    loop = asyncio.get_running_loop()
+    hasher = new_hasher()
+    fd, path = tempfile.mkstemp(suffix=f'_{os.path.basename(part.filename or "upload")}')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            buf = bytearray()
+            async for chunk in part.chunks():
+                buf += chunk
+                hasher.update(chunk)
+                if len(buf) >= UPLOAD_READ_CHUNK:
+                    await loop.run_in_executor(None, f.write, buf)
+                    buf = bytearray()
+            if buf:
+                await loop.run_in_executor(None, f.write, buf)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, hasher.hexdigest()
+
+
+@api_router.post("/upload", response_model=UploadResponse, summary="Upload file to GigaFile.nu")
+async def upload_to_gigafile(request: Request):
+    """
+    multipart/form-data with `file` or `url`, and `duration` (days).
+
+    The body is parsed as it arrives. When the file size is declared before
+    the file part (`X-File-Size` header or a `size` field) and so is the
+    duration (`duration` field or query parameter), every chunk goes to
+    GigaFile while the rest of the body is still arriving, with no temp file.
+    Otherwise the file part is spooled to disk first.
+    """
     tmp_path = None
+    owner = f"api:{request.client.host}" if request.client else None
+    fields = {
+        'duration': request.query_params.get('duration'),
+        'size': request.headers.get('x-file-size'),
+    }
+    filename = None
+    result = None
+    content_hash = None
     try:
-        if url:
-            result = await gigafile_client.upload_from_url(url, lifetime=duration)
-        elif file:
-            # Stream uploaded file to disk before processing (memory-safe for large files)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f'_{file.filename or "upload"}') as tmp:
-                tmp_path = tmp.name
-                while True:
-                    chunk = await file.read(UPLOAD_READ_CHUNK)
-                    if not chunk:
-                        break
-                    tmp.write(chunk)
+        content_type = request.headers.get('content-type', '')
+        if content_type.startswith('multipart/form-data'):
+            async for part in MultipartStream(content_type, request.stream()).parts():
+                if part.filename is None:
+                    fields[part.name] = await part.value()
+                elif part.name == 'file' and filename is None:
+                    filename = os.path.basename(part.filename) or 'upload'
+                    size = _declared_size(fields['size'])
+                    if size is not None and fields['duration'] is not None:
+                        result = await gigafile_client.upload_stream(
+                            part.chunks(), filename, size, lifetime=_duration(fields['duration']), owner=owner,
+                        )
+                    else:
+                        # Size or duration may still follow the file - spool it and decide at the end
+                        tmp_path, content_hash = await _spool_part(part)
+        else:
+            form = await request.form()
+            fields.update((k, v) for k, v in form.items() if isinstance(v, str))
+        duration = _duration(fields['duration'])
+
+        if result is None and tmp_path:
             result = await gigafile_client.upload_file_path(
-                tmp_path, lifetime=duration
+                tmp_path, lifetime=duration, spool=True, owner=owner, content_hash=content_hash
             )
-            # Override filename with original
-            if result.get('success') and file.filename:
-                result['filename'] = file.filename
-        else:
+        elif result is None and fields.get('url'):
+            # Runs in a worker process like any job; this request only waits for it
+            job = await job_manager.submit({'url': fields['url'], 'duration': duration}, owner=owner)
+            job = await job_manager.wait(job['id'])
+            result = (job or {}).get('result') or {'success': False, 'error': (job or {}).get('error')}
+        elif result is None:
             raise HTTPException(status_code=400, detail="Provide 'file' or 'url'")
+        # Override filename with original
+        if result.get('success') and filename:
+            result['filename'] = filename
 
-        if not result.get('success'):
-            return UploadResponse(success=False, error=result.get('error'))
-
-        proxy_url = f"{BACKEND_URL}/api/proxy?url={result['page_url']}"
-        expires = (datetime.now(timezone.utc) + timedelta(days=duration)).isoformat()
-
-        return UploadResponse(
-            success=True,
-            url=result['page_url'],
-            raw_url=result['direct_url'],
-            proxy_url=proxy_url,
-            expires=expires,
-            filename=result.get('filename'),
-        )
+        return _upload_response(result, duration)
     except HTTPException:
         raise
+    except MultipartError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
     except Exception as e:
         logger.exception("Upload error")
         raise HTTPException(status_code=500, detail=str(e))
@@ -186,62 +459,205 @@ async def upload_to_gigafile(
                 pass
 
 
+def _session_status(session) -> UploadSessionStatus:
+    result = session.result
+    return UploadSessionStatus(
+        id=session.id,
+        filename=session.filename,
+        size=session.size,
+        offset=session.offset,
+        complete=result is not None,
+        result=_upload_response(result, session.lifetime) if result is not None else None,
+    )
+
+
+@api_router.post("/upload/sessions", response_model=UploadSessionStatus, status_code=201,
+                 summary="Start a resumable upload")
+async def create_upload_session(body: UploadSessionCreate, request: Request):
+    owner = f"api:{request.client.host}" if request.client else None
+    filename = os.path.basename(body.filename) or 'upload'
+    return _session_status(upload_sessions.create(filename, body.size, _duration(body.duration), owner=owner))
+
+
+@api_router.head("/upload/sessions/{session_id}", summary="Offset of a resumable upload")
+async def upload_session_offset(session_id: str):
+    session = upload_sessions.get(session_id)
+    return Response(headers={
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.size),
+        "Cache-Control": "no-store",
+    })
+
+
+@api_router.get("/upload/sessions/{session_id}", response_model=UploadSessionStatus,
+                summary="Offset and result of a resumable upload")
+async def upload_session_status(session_id: str):
+    return _session_status(upload_sessions.get(session_id))
+
+
+@api_router.put("/upload/sessions/{session_id}", response_model=UploadSessionStatus,
+                summary="Send the next piece of a resumable upload")
+async def upload_session_put(session_id: str, request: Request):
+    """
+    Raw bytes starting at the `Upload-Offset` header, which must equal the
+    session's offset (409 otherwise, with the right one in `Upload-Offset`).
+    The PUT that brings the last byte (or an empty PUT at the end) returns
+    once GigaFile has every chunk, with the result.
+    """
+    session = upload_sessions.get(session_id)
+    try:
+        offset = int(request.headers['upload-offset'])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Upload-Offset header required")
+    try:
+        await session.write(offset, request.stream())
+    except ClientDisconnect:
+        # Whatever arrived is kept; the client asks for the offset and resumes
+        return Response(status_code=400)
+    if session.offset == session.size or session.done:
+        await session.finish()
+    return _session_status(session)
+
+
+@api_router.delete("/upload/sessions/{session_id}", status_code=204, summary="Abort a resumable upload")
+async def upload_session_delete(session_id: str):
+    upload_sessions.cancel(session_id)
+    return Response(status_code=204)
+
+
+@api_router.post("/upload/batch", summary="Re-upload many URLs to GigaFile, results as NDJSON")
+async def upload_batch(batch: BatchUploadRequest, request: Request):
+    """
+    One JSON line per item, written as soon as that item finishes (in
+    completion order; `index` points back into `items`). A failed item is a
+    line with success=false, the rest of the batch carries on.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="No items")
+    if len(batch.items) > UPLOAD_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {UPLOAD_BATCH_MAX_ITEMS} items per batch")
+    owner = f"api:{request.client.host}" if request.client else None
+    items = [
+        {'url': item.url, 'lifetime': _duration(item.duration if item.duration is not None else batch.duration)}
+        for item in batch.items
+    ]
+
+    async def stream():
+        async for result in gigafile_client.upload_many_from_urls(items, owner=owner):
+            item = items[result['index']]
+            response = _upload_response(result, item['lifetime'])
+            line = BatchUploadResult(**response.model_dump(), index=result['index'], source_url=item['url'])
+            yield line.model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+@api_router.post("/upload/resume/{token}", response_model=UploadResponse, summary="Resume an interrupted upload")
+async def resume_upload(token: str):
+    entry = await gigafile_client.journal.get(token) if gigafile_client.journal else None
+    result = await gigafile_client.resume_upload(token)
+    return _upload_response(result, entry['lifetime'] if entry else 100)
+
+
+# Background jobs
+def _job_status(job: dict) -> JobStatus:
+    # Workers store the client's raw result; links and expiry are formatted here
+    result = _upload_response(job['result'], job['duration']) if job.get('result') else None
+    return JobStatus(**dict(job, result=result))
+
+
+@api_router.post("/jobs", response_model=JobStatus, status_code=202, summary="Re-upload a URL in the background")
+async def create_job(job: JobRequest, request: Request):
+    if not job.url.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="'url' must be an http(s) URL")
+    owner = f"api:{request.client.host}" if request.client else None
+    return _job_status(await job_manager.submit({'url': job.url, 'duration': _duration(job.duration)}, owner=owner))
+
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus, summary="Status and progress of a job")
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+
+@api_router.get("/jobs/{job_id}/events", summary="Job progress as server-sent events")
+async def job_events(job_id: str):
+    # One `data:` event per second while the job runs (bytes, rate, ETA); the stream ends with the final status
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        async for job in job_manager.events(job_id):
+            yield f"data: {_job_status(job).model_dump_json()}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api_router.delete("/jobs/{job_id}", response_model=JobStatus, summary="Cancel a job")
+async def cancel_job(job_id: str):
+    # A running job stops at its next chunk and ends as 'cancelled'
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+
 # GigaFile Proxy Download
 @api_router.get("/proxy", summary="Proxy-download from GigaFile")
-async def proxy_gigafile(url: str):
-    if 'gigafile.nu' not in url:
-        raise HTTPException(status_code=400, detail="Only GigaFile.nu URLs are accepted")
-
-    if '/download.php' in url:
-        m = re.search(r'file=([^&]+)', url)
-        if not m:
-            raise HTTPException(status_code=400, detail="Cannot parse file ID from URL")
-        file_id = m.group(1)
-        server = url.split('/')[2]
-        page_url = f"https://{server}/{file_id}"
-    else:
-        page_url = url.split('?')[0]
+async def proxy_gigafile(url: str, request: Request):
+    # Range / If-Range are honoured (206, multipart/byteranges, 416); served from the disk cache when enabled
+    return await gigafile_proxy.download(url, request.headers.get('range'), request.headers.get('if-range'))
 
-    file_id = page_url.rstrip('/').split('/')[-1]
-    server_host = page_url.split('/')[2]
-    download_url = f"https://{server_host}/download.php?file={file_id}"
 
-    connector = aiohttp.TCPConnector(limit=0, force_close=False)
-    session = aiohttp.ClientSession(connector=connector)
-    try:
-        async with session.get(page_url, timeout=aiohttp.ClientTimeout(total=15)) as _:
-            pass
+@api_router.head("/proxy", summary="Size and filename of a GigaFile file, without downloading it")
+async def proxy_gigafile_head(url: str):
+    return await gigafile_proxy.head(url)
 
-        resp = await session.get(download_url, timeout=aiohttp.ClientTimeout(total=7200))
 
-        if resp.status != 200 or (resp.content_type or '').startswith('text/html'):
-            await resp.read()
-            await session.close()
-            raise HTTPException(status_code=404, detail="File not found or expired")
+@api_router.get("/meta", response_model=LinkMetadata, summary="Metadata and liveness of a GigaFile link")
+async def link_metadata(url: str):
+    meta = await gigafile_proxy.metadata(url)
+    return LinkMetadata(**meta, proxy_url=f"{BACKEND_URL}/api/proxy?url={meta['page_url']}")
 
-        cd = resp.headers.get('Content-Disposition', f'attachment; filename="{file_id}"')
-        content_type = resp.headers.get('Content-Type', 'application/octet-stream')
-        headers = {"Content-Disposition": cd}
-        if 'Content-Length' in resp.headers:
-            headers['Content-Length'] = resp.headers['Content-Length']
 
-        async def _stream():
-            try:
-                async for chunk in resp.content.iter_chunked(2 * 1024 * 1024):
-                    yield chunk
-            finally:
-                await resp.release()
-                await session.close()
+@api_router.get("/zip", summary="Several GigaFile files as one ZIP archive")
+async def zip_gigafile(url: List[str] = Query(...), name: Optional[str] = None):
+    # Streamed on the fly (ZIP64, no compression); Content-Length is set when all sizes are known
+    return await gigafile_proxy.archive(url, name)
 
-        return StreamingResponse(_stream(), media_type=content_type, headers=headers)
 
-    except HTTPException:
-        await session.close()
-        raise
-    except Exception as e:
-        await session.close()
-        logger.exception("Proxy error for %s", url)
-        raise HTTPException(status_code=500, detail=str(e))
+@api_router.post("/zip", summary="Several GigaFile files as one ZIP archive (long URL lists)")
+async def zip_gigafile_post(request: ZipRequest):
+    return await gigafile_proxy.archive(request.urls, request.name)
+
+
+@api_router.get("/zip/list", summary="Contents of a ZIP stored on GigaFile")
+async def zip_list(url: str):
+    # Only the central directory is fetched (ranged reads); the parsed index is cached per file
+    return await gigafile_proxy.zip_list(url)
+
+
+@api_router.get("/zip/entry", summary="One file out of a ZIP stored on GigaFile")
+async def zip_entry(url: str, path: str):
+    return await gigafile_proxy.zip_entry(url, path)
+
+
+@api_router.get("/metrics", summary="Transfer and connection-pool metrics")
+async def get_metrics():
+    return {
+        "connections": gigafile_client.connection_stats(),
+        "stream_buffers": gigafile_client.stream_stats(),
+        "scheduler": transfer_scheduler.stats(),
+        "dedup": gigafile_client.dedup.stats() if gigafile_client.dedup else None,
+        "spool_cache": gigafile_client.spool_cache.stats() if gigafile_client.spool_cache else None,
+        "proxy": gigafile_proxy.stats(),
+        "jobs": dict(job_manager.stats(), processes=worker_processes.stats()),
+        "upload_sessions": upload_sessions.stats(),
+        "webhook": webhook_pipeline.stats(),
+    }
 
 
 @api_router.get("/uploads")
@@ -0,0 +1,219 @@
+"""
+Disk cache of downloaded sources for URL re-uploads.
+
+A URL upload spools its source to disk anyway; with the cache the file is
+kept after the upload, so a failed upload retried by the user or the same
+URL sent again with another lifetime is uploaded from disk instead of being
+downloaded again.
+
+- Key: normalized source URL + validators (ETag, Last-Modified,
+  Content-Length). A changed source gets a new key and the old entry ages out.
+- Byte quota with LRU eviction, plus a TTL per entry.
+- Single-flight: the first request for a key downloads it, concurrent
+  requests for the same key wait for that download and reuse the file.
+- Entries being uploaded from are pinned and never evicted underneath.
+- acquire() hands out a SpoolLease; commit/abort/release act only on the
+  entry the lease was issued for, so a late call from a request that lost
+  its entry cannot touch the download of whoever owns the key now.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CACHE_BYTES = 20 * 1024 ** 3    # default byte quota (20 GB)
+SPOOL_CACHE_TTL = 6 * 3600            # seconds an entry may be reused
+
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme/host, drop default ports and fragment, sort query parameters."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not (scheme == 'http' and port == 80 or scheme == 'https' and port == 443):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class _Entry:
+    __slots__ = ('path', 'size', 'ready', 'created', 'refs', 'filename', 'digest', 'done')
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.ready = False
+        self.created = time.time()
+        self.refs = 0
+        self.filename: Optional[str] = None
+        self.digest: Optional[str] = None
+        self.done = asyncio.Event()   # set when the download finished or was abandoned
+
+
+class SpoolLease:
+    """A request's hold on one entry: ownership of its download (`owner`) or a pin on the finished file."""
+
+    __slots__ = ('key', 'entry', 'owner', 'pinned')
+
+    def __init__(self, key: str, entry: _Entry, owner: bool):
+        self.key = key
+        self.entry = entry
+        self.owner = owner
+        self.pinned = not owner
+
+
+class SpoolCache:
+    def __init__(self, directory: str, max_bytes: int = SPOOL_CACHE_BYTES, ttl: float = SPOOL_CACHE_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        # Entries do not survive a restart; remove files left by the previous run
+        for name in os.listdir(directory):
+            if re.fullmatch(r'[0-9a-f]{64}', name):
+                self._unlink(os.path.join(directory, name))
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()   # LRU order, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.shared_waits = 0
+        self.bytes_served = 0
+
+    @staticmethod
+    def key(url: str, headers: Mapping[str, str]) -> Optional[str]:
+        """Cache key for a source, or None when it has no validators at all."""
+        validators = [headers.get(h, '') for h in ('ETag', 'Last-Modified', 'Content-Length')]
+        if not any(validators):
+            return None
+        raw = '\n'.join([normalize_url(url)] + validators)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @property
+    def used(self) -> int:
+        return sum(e.size for e in self._entries.values())
+
+    def fits(self, size: Optional[int]) -> bool:
+        return size is None or size <= self.max_bytes
+
+    async def acquire(self, key: str) -> tuple[Optional[Dict[str, Any]], SpoolLease]:
+        """
+        -> (entry info, lease) for a cached file, pinned until release(lease);
+        -> (None, lease) with `lease.owner` when the caller now owns the
+           download of `key` and must end it with commit() or abort().
+        Waits while another request is downloading the same key.
+        """
+        waited = False
+        while True:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(os.path.join(self.directory, key), 0)
+                self.misses += 1
+                return None, SpoolLease(key, entry, owner=True)
+            if entry.ready:
+                self._entries.move_to_end(key)
+                entry.refs += 1
+                self.hits += 1
+                self.bytes_served += entry.size
+                logger.info("Spool cache hit %s (%d bytes%s)", key[:12], entry.size, ', shared' if waited else '')
+                info = {'path': entry.path, 'filename': entry.filename, 'digest': entry.digest}
+                return info, SpoolLease(key, entry, owner=False)
+            if not waited:
+                self.shared_waits += 1
+                waited = True
+            await entry.done.wait()
+
+    def _owned(self, lease: SpoolLease) -> bool:
+        """The lease still owns the unfinished download of its key."""
+        return lease.owner and self._entries.get(lease.key) is lease.entry and not lease.entry.ready
+
+    def path(self, lease: SpoolLease, size: Optional[int] = None) -> str:
+        """Where the owner writes the entry; reserves `size` bytes of the quota."""
+        entry = lease.entry
+        if size and self._owned(lease):
+            entry.size = size
+            self._evict()
+        return entry.path
+
+    def commit(self, lease: SpoolLease, filename: Optional[str] = None, digest: Optional[str] = None) -> None:
+        """Mark the owner's download complete; the owner keeps one pin until release(lease)."""
+        if not self._owned(lease):
+            return
+        entry = lease.entry
+        try:
+            entry.size = os.path.getsize(entry.path)
+        except OSError:
+            self.abort(lease)
+            return
+        entry.ready = True
+        entry.refs += 1
+        lease.pinned = True
+        entry.filename = filename
+        entry.digest = digest
+        entry.created = time.time()
+        entry.done.set()
+        self._evict()
+
+    def abort(self, lease: SpoolLease) -> None:
+        """Drop the owner's unfinished download; waiters retry (one of them becomes the owner)."""
+        if not self._owned(lease):
+            return
+        lease.owner = False
+        del self._entries[lease.key]
+        self._unlink(lease.entry.path)
+        lease.entry.done.set()
+
+    def release(self, lease: SpoolLease) -> None:
+        """Drop the lease's pin, once; an unfinished download is aborted."""
+        self.abort(lease)
+        if lease.pinned and lease.entry.refs > 0:
+            lease.pinned = False
+            lease.entry.refs -= 1
+            self._evict()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if entry.ready and entry.refs == 0 and now - entry.created > self.ttl:
+                self._drop(key)
+
+    def _evict(self) -> None:
+        """Least recently used, unpinned entries go first until the quota holds."""
+        for key, entry in list(self._entries.items()):
+            if self.used <= self.max_bytes:
+                break
+            if entry.ready and entry.refs == 0:
+                self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._unlink(entry.path)
+        logger.info("Spool cache evicted %s (%d bytes)", key[:12], entry.size)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': sum(1 for e in self._entries.values() if e.ready),
+            'downloading': sum(1 for e in self._entries.values() if not e.ready),
+            'bytes': self.used,
+            'quota': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'shared_waits': self.shared_waits,
+            'bytes_served': self.bytes_served,
+        }
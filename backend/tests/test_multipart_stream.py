@@ -0,0 +1,60 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from multipart_stream import MultipartStream  # noqa: E402
+
+BOUNDARY = 'testboundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+FILE_DATA = b'\x00file body\r\n--not-the-boundary\r\n' * 50
+
+
+def _body() -> bytes:
+    return (
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="duration"\r\n'
+        '\r\n'
+        '100\r\n'
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="url"\r\n'
+        'Content-Type: text/plain\r\n'
+        '\r\n'
+        'https://example.com/a\r\n'
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+        'Content-Type: application/octet-stream\r\n'
+        '\r\n'
+    ).encode() + FILE_DATA + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+async def _collect(chunks):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    parts = []
+    async for part in MultipartStream(CONTENT_TYPE, body()).parts():
+        if part.filename is None:
+            parts.append((part.name, None, part.content_type, await part.value()))
+        else:
+            data = b''.join([chunk async for chunk in part.chunks()])
+            parts.append((part.name, part.filename, part.content_type, data))
+    return parts
+
+
+EXPECTED = [
+    ('duration', None, None, '100'),
+    ('url', None, 'text/plain', 'https://example.com/a'),
+    ('file', 'a.bin', 'application/octet-stream', FILE_DATA),
+]
+
+
+def test_parts_in_one_chunk():
+    assert asyncio.run(_collect([_body()])) == EXPECTED
+
+
+def test_parts_byte_by_byte():
+    body = _body()
+    assert asyncio.run(_collect([body[i:i + 1] for i in range(len(body))])) == EXPECTED
@@ -0,0 +1,255 @@
+"""
+Process-wide scheduler for transfer slots.
+
+Every chunk POST ('upload') and every source download stream ('download') in
+the process takes a slot from here, so 50 simultaneous bot/API uploads share
+GLOBAL_SLOTS instead of each opening its own set of connections.
+
+- Global caps: GLOBAL_SLOTS concurrent transfers per kind, optional
+  GLOBAL_BANDWIDTH (bytes/s) per kind enforced with a token bucket.
+- Fair sharing: waiters are queued per owner (bot chat, API client) and slots
+  are handed out round-robin across owners, one grant at a time.
+- Priority classes: jobs up to FAST_LANE_MAX_BYTES are 'fast'; they are served
+  first and FAST_LANE_RESERVED slots of each kind are kept for them, so small
+  files are never stuck behind 300 GB ones.
+- Every job records its queue waits; stats() reports them per job.
+- Byte accounting: jobs created while `transfer_progress` holds a
+  TransferProgress (set by the jobs API around one transfer) add the size
+  and every byte they throttle to it.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SLOTS = {'upload': 32, 'download': 16}
+GLOBAL_BANDWIDTH = {'upload': 0, 'download': 0}    # bytes/s per kind, 0 = unlimited
+FAST_LANE_MAX_BYTES = 256 * 1024 * 1024            # jobs up to this size use the fast lane
+FAST_LANE_RESERVED = {'upload': 4, 'download': 2}  # slots only fast jobs may take
+PRIORITIES = ('fast', 'normal')
+
+
+class TokenBucket:
+    """Byte-rate limiter. Callers take what they need and sleep off any debt."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+
+    async def consume(self, nbytes: int) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+        self._tokens -= nbytes
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class TransferProgress:
+    """Bytes moved by the transfers of one API job (see jobs.py)."""
+
+    def __init__(self):
+        self.size: Optional[int] = None
+        self.bytes = {'upload': 0, 'download': 0}
+
+
+# Tasks inherit the context, so chunk uploads spawned by a transfer count too
+transfer_progress: ContextVar[Optional[TransferProgress]] = ContextVar('transfer_progress', default=None)
+
+
+class TransferJob:
+    """One upload or download as seen by the scheduler; collects its queue stats."""
+
+    def __init__(self, scheduler: 'TransferScheduler', owner: str, label: str, size: Optional[int]):
+        self.scheduler = scheduler
+        self.owner = owner
+        self.label = label
+        self.size = size
+        self.started = time.monotonic()
+        self.grants = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.queue_depth_max = 0
+        self.holding = 0
+        self._normal_held: Dict[str, int] = {}   # slots granted while the job was 'normal'
+        self.progress = transfer_progress.get()
+        if self.progress is not None and size is not None:
+            self.progress.size = size
+
+    @property
+    def priority(self) -> str:
+        return 'fast' if self.size is not None and self.size <= FAST_LANE_MAX_BYTES else 'normal'
+
+    def set_size(self, size: int) -> None:
+        self.size = size
+        if self.progress is not None:
+            self.progress.size = size
+
+    @asynccontextmanager
+    async def slot(self, kind: str):
+        """Hold one global `kind` slot for the duration of the block."""
+        await self.scheduler.acquire(self, kind)
+        try:
+            yield
+        finally:
+            self.scheduler.release(self, kind)
+
+    async def throttle(self, kind: str, nbytes: int) -> None:
+        if self.progress is not None:
+            self.progress.bytes[kind] += nbytes
+        bucket = self.scheduler.buckets.get(kind)
+        if bucket:
+            await bucket.consume(nbytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'owner': self.owner,
+            'priority': self.priority,
+            'size': self.size,
+            'holding': self.holding,
+            'grants': self.grants,
+            'waits': self.waits,
+            'wait_total': round(self.wait_total, 3),
+            'wait_max': round(self.wait_max, 3),
+            'queue_depth_max': self.queue_depth_max,
+            'age': round(time.monotonic() - self.started, 1),
+        }
+
+    def close(self) -> None:
+        self.scheduler.jobs.discard(self)
+        logger.info(
+            "[%s] scheduler: owner=%s %s lane, %d slot grants, waited %.1fs total (max %.1fs, max queue depth %d)",
+            self.label, self.owner, self.priority, self.grants, self.wait_total, self.wait_max, self.queue_depth_max,
+        )
+
+
+class _Waiter:
+    __slots__ = ('job', 'future', 'enqueued')
+
+    def __init__(self, job: TransferJob, future: asyncio.Future):
+        self.job = job
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class TransferScheduler:
+    def __init__(self):
+        self.capacity = dict(GLOBAL_SLOTS)
+        self.reserved = dict(FAST_LANE_RESERVED)
+        self.buckets = {kind: TokenBucket(rate) for kind, rate in GLOBAL_BANDWIDTH.items() if rate}
+        self.active = {kind: 0 for kind in self.capacity}
+        self.active_normal = {kind: 0 for kind in self.capacity}
+        # kind -> priority -> owner -> FIFO of waiters (OrderedDict order = round-robin order)
+        self._queues: Dict[str, Dict[str, 'OrderedDict[str, Deque[_Waiter]]']] = {
+            kind: {p: OrderedDict() for p in PRIORITIES} for kind in self.capacity
+        }
+        self.jobs: set = set()
+
+    def job(self, owner: Optional[str], label: str, size: Optional[int] = None) -> TransferJob:
+        job = TransferJob(self, owner or 'anonymous', label, size)
+        self.jobs.add(job)
+        return job
+
+    def queued(self, kind: str) -> int:
+        return sum(len(q) for owners in self._queues[kind].values() for q in owners.values())
+
+    def _has_room(self, kind: str, priority: str) -> bool:
+        if self.active[kind] >= self.capacity[kind]:
+            return False
+        if priority == 'normal':
+            return self.active_normal[kind] < max(1, self.capacity[kind] - self.reserved.get(kind, 0))
+        return True
+
+    def _grant(self, job: TransferJob, kind: str) -> None:
+        self.active[kind] += 1
+        if job.priority == 'normal':
+            self.active_normal[kind] += 1
+            job._normal_held[kind] = job._normal_held.get(kind, 0) + 1
+        job.holding += 1
+        job.grants += 1
+
+    async def acquire(self, job: TransferJob, kind: str) -> None:
+        queues = self._queues[kind]
+        priority = job.priority
+        ahead = sum(len(q) for q in queues[priority].values())
+        if priority == 'normal':
+            ahead += sum(len(q) for q in queues['fast'].values())
+        if ahead == 0 and self._has_room(kind, priority):
+            self._grant(job, kind)
+            return
+
+        waiter = _Waiter(job, asyncio.get_running_loop().create_future())
+        queues[priority].setdefault(job.owner, deque()).append(waiter)
+        job.queue_depth_max = max(job.queue_depth_max, ahead + 1)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(job, kind)   # granted just before the cancel landed
+            else:
+                self._remove(kind, priority, waiter)
+            raise
+        waited = time.monotonic() - waiter.enqueued
+        job.waits += 1
+        job.wait_total += waited
+        job.wait_max = max(job.wait_max, waited)
+
+    def _remove(self, kind: str, priority: str, waiter: _Waiter) -> None:
+        owners = self._queues[kind][priority]
+        q = owners.get(waiter.job.owner)
+        if q and waiter in q:
+            q.remove(waiter)
+            if not q:
+                del owners[waiter.job.owner]
+
+    def release(self, job: TransferJob, kind: str) -> None:
+        self.active[kind] -= 1
+        if job._normal_held.get(kind):
+            self.active_normal[kind] -= 1
+            job._normal_held[kind] -= 1
+        job.holding -= 1
+        self._dispatch(kind)
+
+    def _dispatch(self, kind: str) -> None:
+        for priority in PRIORITIES:
+            owners = self._queues[kind][priority]
+            while owners and self._has_room(kind, priority):
+                owner, q = next(iter(owners.items()))
+                waiter = q.popleft()
+                # Round-robin: this owner goes to the back of the line
+                del owners[owner]
+                if q:
+                    owners[owner] = q
+                if waiter.future.done():
+                    continue
+                self._grant(waiter.job, kind)
+                waiter.future.set_result(None)
+            if owners:
+                return   # higher class still waiting - lower classes must not overtake it
+
+    def stats(self) -> Dict[str, Any]:
+        jobs: List[Dict[str, Any]] = [j.stats() for j in self.jobs]
+        return {
+            'slots': {
+                kind: {
+                    'active': self.active[kind],
+                    'capacity': self.capacity[kind],
+                    'fast_reserved': self.reserved.get(kind, 0),
+                    'queued': self.queued(kind),
+                }
+                for kind in self.capacity
+            },
+            'jobs': sorted(jobs, key=lambda j: -j['age']),
+        }
+
+
+transfer_scheduler = TransferScheduler()
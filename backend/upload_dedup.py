@@ -0,0 +1,92 @@
+"""
+Content-hash deduplication of uploads.
+
+The SHA-256 of every file is computed while it is spooled to disk (/api/upload
+temp file, URL downloads) or right after (bot temp files) and looked up here
+before the chunk upload starts. A link from an earlier upload of the same
+bytes that is still valid for at least the requested lifetime is returned at
+once.
+
+Index documents (Motor collection, digest as `_id`):
+    size, page_url, direct_url, file_id, server, filename, lifetime,
+    uploaded_at / expires_at (unix time)
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_READ_CHUNK = 4 * 1024 * 1024   # read size when a file has to be hashed after the fact
+DAY = 24 * 3600
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def _hash_file_sync(path: str) -> str:
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(HASH_READ_CHUNK)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+async def hash_file(path: str) -> str:
+    """Hash a file that was not written sequentially (e.g. a segmented download)."""
+    return await asyncio.get_running_loop().run_in_executor(None, _hash_file_sync, path)
+
+
+class UploadDedupIndex:
+    """digest -> earlier GigaFile upload, plus hit/miss counters for /api/metrics."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+        self.recorded = 0
+
+    async def lookup(self, digest: str, size: int, lifetime: int) -> Optional[Dict[str, Any]]:
+        """Return the indexed upload if its link outlives `lifetime` days from now."""
+        self.lookups += 1
+        doc = await self.collection.find_one({'_id': digest})
+        if not doc or doc.get('size') != size:
+            return None
+        if doc['expires_at'] < time.time() + lifetime * DAY:
+            logger.info("Dedup: %s known but expires too soon for %d days", digest[:12], lifetime)
+            return None
+        self.hits += 1
+        self.bytes_saved += size
+        logger.info("Dedup hit %s -> %s (%d bytes not uploaded)", digest[:12], doc['page_url'], size)
+        return doc
+
+    async def record(self, digest: str, size: int, lifetime: int, result: Dict[str, Any]) -> None:
+        now = time.time()
+        await self.collection.replace_one({'_id': digest}, {
+            'size': size,
+            'page_url': result['page_url'],
+            'direct_url': result['direct_url'],
+            'file_id': result.get('file_id'),
+            'server': result.get('server'),
+            'filename': result.get('filename'),
+            'lifetime': lifetime,
+            'uploaded_at': now,
+            'expires_at': now + lifetime * DAY,
+        }, upsert=True)
+        self.recorded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else None,
+            'bytes_saved': self.bytes_saved,
+            'recorded': self.recorded,
+        }
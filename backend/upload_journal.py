@@ -0,0 +1,148 @@
+"""
+Persistent journal of in-flight GigaFile uploads.
+
+One entry per upload token:
+    token, server, filename, lifetime, chunk_size, total_chunks, file_size,
+    completed (chunk numbers already accepted by GigaFile), url (once returned),
+    source_path / source_mtime (local file or spool), source_url, spool, meta,
+    created_at / updated_at (unix time)
+
+GigaFileClient writes the entry when an upload starts, marks every chunk as it
+is accepted and drops the entry on success, so after a restart the same token
+can be continued and only the missing chunks are sent.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJournal(ABC):
+    """Backend interface. Entries are plain dicts keyed by `token`."""
+
+    @abstractmethod
+    async def start(self, entry: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def mark_done(self, token: str, chunk_no: int, url: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def finish(self, token: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def pending(self) -> List[Dict[str, Any]]:
+        ...
+
+
+class FileUploadJournal(UploadJournal):
+    """One JSON file per token in `directory`, replaced atomically on every update."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = asyncio.Lock()
+
+    def _path(self, token: str) -> str:
+        return os.path.join(self.directory, f"{token}.json")
+
+    def _read_sync(self, token: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(token), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable journal entry %s: %s", token, e)
+            return None
+
+    def _write_sync(self, entry: Dict[str, Any]) -> None:
+        path = self._path(entry['token'])
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def start(self, entry: Dict[str, Any]) -> None:
+        entry = dict(entry, completed=sorted(entry.get('completed', [])))
+        entry.setdefault('created_at', time.time())
+        entry['updated_at'] = time.time()
+        async with self._lock:
+            await self._run(self._write_sync, entry)
+
+    async def mark_done(self, token: str, chunk_no: int, url: Optional[str] = None) -> None:
+        async with self._lock:
+            entry = await self._run(self._read_sync, token)
+            if entry is None:
+                return
+            if chunk_no not in entry['completed']:
+                entry['completed'].append(chunk_no)
+            if url:
+                entry['url'] = url
+            entry['updated_at'] = time.time()
+            await self._run(self._write_sync, entry)
+
+    async def finish(self, token: str) -> None:
+        async with self._lock:
+            try:
+                await self._run(os.unlink, self._path(token))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._read_sync, token)
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        names = await self._run(os.listdir, self.directory)
+        entries = []
+        for name in names:
+            if name.endswith('.json'):
+                entry = await self.get(name[:-len('.json')])
+                if entry:
+                    entries.append(entry)
+        return entries
+
+
+class MongoUploadJournal(UploadJournal):
+    """Entries stored in a Motor collection with the token as `_id`."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def start(self, entry: Dict[str, Any]) -> None:
+        doc = dict(entry, completed=sorted(entry.get('completed', [])))
+        doc.setdefault('created_at', time.time())
+        doc['updated_at'] = time.time()
+        await self.collection.replace_one({'_id': entry['token']}, doc, upsert=True)
+
+    async def mark_done(self, token: str, chunk_no: int, url: Optional[str] = None) -> None:
+        fields: Dict[str, Any] = {'updated_at': time.time()}
+        if url:
+            fields['url'] = url
+        await self.collection.update_one(
+            {'_id': token},
+            {'$addToSet': {'completed': chunk_no}, '$set': fields},
+        )
+
+    async def finish(self, token: str) -> None:
+        await self.collection.delete_one({'_id': token})
+
+    async def get(self, token: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({'_id': token}, {'_id': 0})
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        return await self.collection.find({}, {'_id': 0}).to_list(None)
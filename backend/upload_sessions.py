@@ -0,0 +1,189 @@
+"""
+Resumable browser uploads (/api/upload/sessions), tus-like.
+
+POST creates a session for a file of known size. The browser then PUTs the
+file in pieces, each with an `Upload-Offset` header, and after a broken
+connection asks for the offset (HEAD or GET) and goes on from there: the
+bytes of a broken PUT that did arrive are kept. Everything received is fed
+straight into GigaFileClient.upload_stream(), so each GigaFile chunk is
+POSTed to upload_chunk.php as soon as it is complete, while the browser is
+still sending the rest, and nothing is spooled to disk.
+
+Sessions live in memory: after a restart the browser has to start over.
+A session idle for UPLOAD_SESSION_TTL is cancelled; a finished one is kept
+that long so a client that missed the final answer can still fetch it.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSION_TTL = 3600
+UPLOAD_SESSION_MAX = 16         # open sessions; each can hold STREAM_UPLOAD_WINDOW chunks in memory
+UPLOAD_SESSION_QUEUE = 64       # body pieces buffered between a PUT and the uploader
+
+
+class UploadSession:
+    def __init__(self, session_id: str, filename: str, size: int, lifetime: int, owner: Optional[str]):
+        self.id = session_id
+        self.filename = filename
+        self.size = size
+        self.lifetime = lifetime
+        self.owner = owner
+        self.offset = 0
+        self.updated = time.time()
+        self.cancel_event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self._queue: asyncio.Queue = asyncio.Queue(UPLOAD_SESSION_QUEUE)
+        self._lock = asyncio.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    @property
+    def result(self) -> Optional[Dict[str, Any]]:
+        if not self.done:
+            return None
+        if self.task.cancelled():
+            return {'success': False, 'error': 'cancelled'}
+        return self.task.result()
+
+    def start(self, client) -> None:
+        self.task = asyncio.create_task(self._upload(client))
+
+    async def _upload(self, client) -> Dict[str, Any]:
+        try:
+            return await client.upload_stream(
+                self._source(), self.filename, self.size, lifetime=self.lifetime,
+                cancel_event=self.cancel_event, owner=self.owner,
+            )
+        except Exception as e:
+            logger.warning("Upload session %s (%s) failed: %s", self.id, self.filename, e)
+            return {'success': False, 'error': str(e) or type(e).__name__}
+
+    async def _source(self) -> AsyncIterator[bytes]:
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                return
+            yield data
+
+    async def _feed(self, data: Optional[bytes]) -> bool:
+        """Hand `data` (None: end of file) to the uploader; False if the upload has already ended."""
+        if not self._queue.full():
+            self._queue.put_nowait(data)
+            return True
+        put = asyncio.ensure_future(self._queue.put(data))
+        await asyncio.wait({put, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            return False
+        return True
+
+    async def write(self, offset: int, body: AsyncIterator[bytes]) -> None:
+        """Append a PUT body at `offset`; stops early when the upload has ended (see result)."""
+        if self._lock.locked():
+            raise HTTPException(status_code=409, detail="Another request is writing to this upload",
+                                headers={'Upload-Offset': str(self.offset)})
+        async with self._lock:
+            if offset != self.offset:
+                raise HTTPException(status_code=409, detail=f"Upload-Offset must be {self.offset}",
+                                    headers={'Upload-Offset': str(self.offset)})
+            try:
+                async for data in body:
+                    if self.done:
+                        return
+                    if not data:
+                        continue
+                    if self.offset + len(data) > self.size:
+                        raise HTTPException(status_code=400, detail=f"Data goes past the declared {self.size} bytes")
+                    if not await self._feed(data):
+                        return
+                    # Counted as soon as the uploader has it: a broken PUT resumes after the last piece received
+                    self.offset += len(data)
+                    self.updated = time.time()
+            finally:
+                self.updated = time.time()
+
+    async def finish(self) -> Dict[str, Any]:
+        """Wait for the last chunks to reach GigaFile (all bytes received) -> upload result."""
+        if not self.done and self.offset == self.size:
+            await self._feed(None)
+        await asyncio.wait({self.task})
+        return self.result
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        # Wake the uploader if it is waiting for data
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class UploadSessionManager:
+    def __init__(self, client, max_sessions: int = UPLOAD_SESSION_MAX, ttl: float = UPLOAD_SESSION_TTL):
+        self.client = client
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self.created = 0
+        self.completed = 0
+
+    def create(self, filename: str, size: int, lifetime: int, owner: Optional[str] = None) -> UploadSession:
+        self._sweep()
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+        if sum(1 for s in self._sessions.values() if not s.done) >= self.max_sessions:
+            raise HTTPException(status_code=503, detail="Too many uploads in progress", headers={'Retry-After': '30'})
+        session = UploadSession(uuid.uuid4().hex, filename, size, lifetime, owner)
+        session.start(self.client)
+        session.task.add_done_callback(lambda t: self._on_done(session))
+        self._sessions[session.id] = session
+        self.created += 1
+        logger.info("Upload session %s: %s (%d bytes)", session.id, filename, size)
+        return session
+
+    def _on_done(self, session: UploadSession) -> None:
+        session.updated = time.time()
+        if not session.task.cancelled() and session.task.result().get('success'):
+            self.completed += 1
+
+    def get(self, session_id: str) -> UploadSession:
+        self._sweep()
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found or expired")
+        return session
+
+    def cancel(self, session_id: str) -> None:
+        session = self.get(session_id)
+        session.cancel()
+        del self._sessions[session_id]
+
+    def _sweep(self) -> None:
+        now = time.time()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.updated > self.ttl:
+                if not session.done:
+                    logger.info("Upload session %s idle at %d/%d bytes, cancelled",
+                                session_id, session.offset, session.size)
+                    session.cancel()
+                del self._sessions[session_id]
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            session.cancel()
+        await asyncio.gather(*(s.task for s in self._sessions.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active': sum(1 for s in self._sessions.values() if not s.done),
+            'created': self.created,
+            'completed': self.completed,
+        }
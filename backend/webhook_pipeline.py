@@ -0,0 +1,196 @@
+"""
+Bounded ingestion of Telegram webhook updates (/api/webhook).
+
+- Dedup: UpdateDeduplicator remembers update ids for WEBHOOK_DEDUP_WINDOW
+  seconds (at most WEBHOOK_DEDUP_CAPACITY of them) in a ring buffer plus a
+  dict, so a check is O(1) and an id is forgotten only once it is old - a
+  Telegram retry is never let through because the set happened to be
+  cleared.
+- Queue: updates wait in bounded queues, one per worker; a fixed pool of
+  WEBHOOK_WORKERS tasks runs the handlers, however many updates arrive.
+- Per-chat order: a chat is always served by the same worker (chat id
+  modulo the number of workers), so its updates reach the handlers in the
+  order Telegram sent them. Bot handlers can run for the whole of an
+  upload, so a worker waits for one at most WEBHOOK_ORDER_TIMEOUT seconds
+  and then leaves it running in the background - otherwise /cancel would
+  queue up behind the upload it is meant to stop. Order is therefore only
+  guaranteed for handlers that finish within the timeout: the chat's next
+  update can start while a slower one is still running.
+- Running handlers: at most WEBHOOK_MAX_RUNNING at once, those left in the
+  background included. When all are taken, workers wait for one to end
+  before starting the next update, their queues fill up and new updates are
+  shed.
+- Load shedding: when the chat's queue is full the update is refused and
+  its id forgotten; the endpoint answers 503 and Telegram delivers it again
+  later instead of it piling up in memory.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = 8
+WEBHOOK_QUEUE = 1000             # updates waiting, all workers together
+WEBHOOK_DEDUP_WINDOW = 600       # seconds an update id is remembered
+WEBHOOK_DEDUP_CAPACITY = 100000  # update ids remembered at most
+WEBHOOK_ORDER_TIMEOUT = 5.0      # seconds a worker waits for a handler before moving on
+WEBHOOK_MAX_RUNNING = 256        # handlers running at once, background ones included
+WEBHOOK_LATENCY_SAMPLES = 1024   # recent handler timings kept for the percentiles
+
+
+class UpdateDeduplicator:
+    def __init__(self, window: float = WEBHOOK_DEDUP_WINDOW, capacity: int = WEBHOOK_DEDUP_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self._order: Deque[Tuple[float, int]] = deque()
+        self._seen: Dict[int, float] = {}
+        self.duplicates = 0
+
+    def _expire(self, now: float) -> None:
+        while self._order and (now - self._order[0][0] > self.window or len(self._order) >= self.capacity):
+            seen_at, update_id = self._order.popleft()
+            # A forgotten and re-added id has a newer entry further on
+            if self._seen.get(update_id) == seen_at:
+                del self._seen[update_id]
+
+    def seen(self, update_id: int) -> bool:
+        """True if `update_id` came within the window; otherwise it is remembered from now on."""
+        now = time.monotonic()
+        self._expire(now)
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen[update_id] = now
+        self._order.append((now, update_id))
+        return False
+
+    def forget(self, update_id: int) -> None:
+        """Let `update_id` through again (it was not processed)."""
+        self._seen.pop(update_id, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+def chat_key(data: Dict[str, Any]) -> int:
+    """The chat (or user) an update belongs to, for ordering; the update id if it has neither."""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+        if 'id' in (value.get('from') or {}):
+            return value['from']['id']
+    return data.get('update_id') or 0
+
+
+class WebhookPipeline:
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = WEBHOOK_WORKERS,
+        queue_size: int = WEBHOOK_QUEUE,
+        order_timeout: float = WEBHOOK_ORDER_TIMEOUT,
+        max_running: int = WEBHOOK_MAX_RUNNING,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.order_timeout = order_timeout
+        self.max_running = max(self.workers, max_running)
+        self._running = asyncio.Semaphore(self.max_running)
+        self.dedup = UpdateDeduplicator()
+        self._queues: List[asyncio.Queue] = [
+            asyncio.Queue(max(1, queue_size // self.workers)) for _ in range(self.workers)
+        ]
+        self._tasks: List[asyncio.Task] = []
+        self._detached: Set[asyncio.Task] = set()
+        self._latency: Deque[float] = deque(maxlen=WEBHOOK_LATENCY_SAMPLES)
+        self._wait: Deque[float] = deque(maxlen=WEBHOOK_LATENCY_SAMPLES)
+        self.accepted = 0
+        self.shed = 0
+        self.handled = 0
+        self.errors = 0
+        self.saturated = 0              # updates that waited for a free handler slot
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def close(self) -> None:
+        for task in self._tasks + list(self._detached):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._detached, return_exceptions=True)
+
+    def submit(self, update_id: Optional[int], key: int, update: Any) -> str:
+        """Queue `update` -> 'queued', 'duplicate' or 'shed' (queue full: have it sent again later)."""
+        if update_id is not None and self.dedup.seen(update_id):
+            return 'duplicate'
+        try:
+            self._queues[key % self.workers].put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            if update_id is not None:
+                self.dedup.forget(update_id)
+            self.shed += 1
+            if self.shed % 100 == 1:
+                logger.warning("Webhook queue full, %d updates refused so far", self.shed)
+            return 'shed'
+        self.accepted += 1
+        return 'queued'
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            queued_at, update = await queue.get()
+            if self._running.locked():
+                # Every handler slot is taken: hold this worker (and so its queue) until one ends
+                self.saturated += 1
+            await self._running.acquire()
+            started = time.monotonic()
+            self._wait.append(started - queued_at)
+            task = asyncio.create_task(self.handler(update))
+            task.add_done_callback(lambda t, started=started: self._on_done(t, started))
+            # A callback, not a finally: it also runs for a handler cancelled before it started
+            task.add_done_callback(lambda _: self._running.release())
+            done, _ = await asyncio.wait({task}, timeout=self.order_timeout)
+            if not done:
+                # A long handler (an upload): the chat's next updates must not wait for it
+                self._detached.add(task)
+                task.add_done_callback(self._detached.discard)
+
+    def _on_done(self, task: asyncio.Task, started: float) -> None:
+        self._latency.append(time.monotonic() - started)
+        self.handled += 1
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.error("Webhook handler failed", exc_info=task.exception())
+
+    @staticmethod
+    def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+        if not samples:
+            return {'p50': None, 'p95': None, 'max': None}
+        ordered = sorted(samples)
+        return {
+            'p50': round(ordered[len(ordered) // 2], 4),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+            'max': round(ordered[-1], 4),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'queued': sum(q.qsize() for q in self._queues),
+            'capacity': sum(q.maxsize for q in self._queues),
+            'running_long': len(self._detached),
+            'max_running': self.max_running,
+            'saturated': self.saturated,
+            'accepted': self.accepted,
+            'duplicates': self.dedup.duplicates,
+            'shed': self.shed,
+            'handled': self.handled,
+            'errors': self.errors,
+            'remembered_ids': len(self.dedup),
+            'queue_wait': self._percentiles(self._wait),
+            'handler_latency': self._percentiles(self._latency),
+        }
@@ -0,0 +1,246 @@
+"""
+Reading single entries out of a ZIP stored on GigaFile, via ranged reads.
+
+read_index() fetches the end of the archive, finds the end-of-central-
+directory record (ZIP64 included) and parses the central directory - a few
+requests however big the archive is. ZipIndexCache keeps parsed indexes
+per (server, file_id); GigaFile files never change, so entries only leave
+it by LRU. entry_body() turns the compressed bytes of one entry into its
+contents (stored or deflated) and checks the CRC-32.
+"""
+import asyncio
+import logging
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ZIP_INDEX_TAIL = 64 * 1024 + 22          # EOCD + the longest possible archive comment
+ZIP_INDEX_MAX_DIRECTORY = 64 * 1024 * 1024
+ZIP_INDEX_CACHE_ENTRIES = 256
+ZIP_INFLATE_READ = 1024 * 1024         # largest inflated chunk yielded at once
+
+_EOCD = struct.Struct('<IHHHHIIH')
+_EOCD64_LOCATOR = struct.Struct('<IIQI')
+_EOCD64 = struct.Struct('<IQHHIIQQQQ')
+_CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+_LOCAL = struct.Struct('<IHHHHHIIIHH')
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+
+class ZipFormatError(Exception):
+    pass
+
+
+class ZipEntry:
+    __slots__ = ('name', 'method', 'flags', 'crc', 'compressed_size', 'size', 'header_offset', 'modified')
+
+    def __init__(self, name: str, method: int, flags: int, crc: int, compressed_size: int, size: int,
+                 header_offset: int, modified: Optional[float]):
+        self.name = name
+        self.method = method
+        self.flags = flags
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.header_offset = header_offset
+        self.modified = modified
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith('/')
+
+    @property
+    def encrypted(self) -> bool:
+        return bool(self.flags & 0x1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'size': self.size,
+            'compressed_size': self.compressed_size,
+            'method': {METHOD_STORED: 'stored', METHOD_DEFLATED: 'deflated'}.get(self.method, str(self.method)),
+            'is_dir': self.is_dir,
+            'encrypted': self.encrypted,
+            'modified': self.modified,
+        }
+
+
+def _dos_timestamp(dos_time: int, dos_date: int) -> Optional[float]:
+    try:
+        return time.mktime((
+            (dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+            dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2, 0, 0, -1,
+        ))
+    except (OverflowError, ValueError):
+        return None
+
+
+def _parse_directory(data: bytes, count: int) -> List[ZipEntry]:
+    entries: List[ZipEntry] = []
+    pos = 0
+    for _ in range(count):
+        if pos + _CENTRAL.size > len(data):
+            raise ZipFormatError("central directory is truncated")
+        (sig, _made, _needed, flags, method, dos_time, dos_date, crc, csize, usize,
+         name_len, extra_len, comment_len, _disk, _internal, _external, offset) = _CENTRAL.unpack_from(data, pos)
+        if sig != 0x02014b50:
+            raise ZipFormatError("bad central directory entry")
+        pos += _CENTRAL.size
+        raw_name = data[pos:pos + name_len]
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437', errors='replace')
+        extra = data[pos + name_len:pos + name_len + extra_len]
+        pos += name_len + extra_len + comment_len
+
+        # ZIP64 extra field: only the fields saturated in the fixed record are present, in this order
+        i = 0
+        while i + 4 <= len(extra):
+            tag, size = struct.unpack_from('<HH', extra, i)
+            if tag == 0x0001:
+                values = iter(struct.unpack_from(f'<{size // 8}Q', extra, i + 4))
+                if usize == 0xFFFFFFFF:
+                    usize = next(values, usize)
+                if csize == 0xFFFFFFFF:
+                    csize = next(values, csize)
+                if offset == 0xFFFFFFFF:
+                    offset = next(values, offset)
+                break
+            i += 4 + size
+        entries.append(ZipEntry(name, method, flags, crc, csize, usize, offset, _dos_timestamp(dos_time, dos_date)))
+    return entries
+
+
+async def read_index(read: Callable[[int, int], Awaitable[bytes]], size: int) -> List[ZipEntry]:
+    """Entries of a ZIP of `size` bytes; `read(start, end)` returns bytes start..end (inclusive)."""
+    tail_start = max(0, size - ZIP_INDEX_TAIL)
+    tail = await read(tail_start, size - 1)
+    at = tail.rfind(b'PK\x05\x06')
+    if at < 0 or at + _EOCD.size > len(tail):
+        raise ZipFormatError("not a ZIP archive (no end of central directory)")
+    _sig, _disk, _cd_disk, _on_disk, count, cd_size, cd_offset, _comment = _EOCD.unpack_from(tail, at)
+
+    if count == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+        loc = at - _EOCD64_LOCATOR.size
+        if loc < 0 or tail[loc:loc + 4] != b'PK\x06\x07':
+            raise ZipFormatError("ZIP64 end of central directory locator missing")
+        _sig, _disk, eocd64_offset, _disks = _EOCD64_LOCATOR.unpack_from(tail, loc)
+        if eocd64_offset >= tail_start:
+            record = tail[eocd64_offset - tail_start:eocd64_offset - tail_start + _EOCD64.size]
+        else:
+            record = await read(eocd64_offset, eocd64_offset + _EOCD64.size - 1)
+        if len(record) < _EOCD64.size or record[:4] != b'PK\x06\x06':
+            raise ZipFormatError("bad ZIP64 end of central directory")
+        _sig, _rsize, _made, _needed, _disk, _cd_disk, _on_disk, count, cd_size, cd_offset = _EOCD64.unpack(record)
+
+    if cd_size > ZIP_INDEX_MAX_DIRECTORY:
+        raise ZipFormatError(f"central directory of {cd_size} bytes is too large")
+    if cd_offset + cd_size > size:
+        raise ZipFormatError("central directory lies outside the file")
+    if cd_size == 0:
+        return []
+    if cd_offset >= tail_start:
+        directory = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+    else:
+        directory = await read(cd_offset, cd_offset + cd_size - 1)
+    return _parse_directory(directory, count)
+
+
+async def data_offset(read: Callable[[int, int], Awaitable[bytes]], entry: ZipEntry, size: int) -> int:
+    """Offset of the entry's (compressed) bytes: after its local header, whose extra field may differ."""
+    header = await read(entry.header_offset, min(size, entry.header_offset + _LOCAL.size) - 1)
+    if len(header) < _LOCAL.size or header[:4] != b'PK\x03\x04':
+        raise ZipFormatError(f"bad local header for {entry.name}")
+    name_len, extra_len = struct.unpack_from('<HH', header, 26)
+    return entry.header_offset + _LOCAL.size + name_len + extra_len
+
+
+async def entry_body(entry: ZipEntry, compressed: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Contents of `entry` from its compressed bytes, CRC-checked at the end."""
+    inflater = zlib.decompressobj(-15) if entry.method == METHOD_DEFLATED else None
+    crc = 0
+    total = 0
+    try:
+        async for chunk in compressed:
+            while chunk:
+                if inflater is not None:
+                    # Bounded output per step: highly compressed data must not blow up memory
+                    data = inflater.decompress(chunk, ZIP_INFLATE_READ)
+                    chunk = inflater.unconsumed_tail
+                else:
+                    data, chunk = chunk, b''
+                if data:
+                    crc = zlib.crc32(data, crc)
+                    total += len(data)
+                    yield data
+        if inflater is not None:
+            data = inflater.flush()
+            if data:
+                crc = zlib.crc32(data, crc)
+                total += len(data)
+                yield data
+    finally:
+        aclose = getattr(compressed, 'aclose', None)
+        if aclose:
+            await aclose()
+    if total != entry.size or crc != entry.crc:
+        # Headers are already out; failing the stream is the only way to tell the client
+        raise ZipFormatError(
+            f"{entry.name}: got {total} bytes with CRC {crc:08x}, expected {entry.size} / {entry.crc:08x}"
+        )
+
+
+class ZipIndexCache:
+    def __init__(self, max_entries: int = ZIP_INDEX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._indexes: 'OrderedDict[Tuple[str, str], Dict[str, ZipEntry]]' = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self,
+        key: Tuple[str, str],
+        fetch: Callable[[], Awaitable[List[ZipEntry]]],
+    ) -> Dict[str, ZipEntry]:
+        """Entries of the archive `key` by name, parsed once and shared by concurrent callers."""
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            self.hits += 1
+            return index
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            index = {entry.name: entry for entry in await fetch()}
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+            future.set_result(index)
+            return index
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'archives': len(self._indexes),
+            'entries': sum(len(i) for i in self._indexes.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
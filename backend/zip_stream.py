@@ -0,0 +1,134 @@
+"""
+ZIP64 archives built on the fly from async byte streams (store mode).
+
+Nothing is compressed and nothing touches the disk: every member is a
+local header, the member's bytes as they arrive and a data descriptor
+with the CRC-32 computed while streaming. The central directory follows
+the last member. Memory use does not depend on the member sizes.
+
+All members use ZIP64 records, so the archive layout depends only on the
+names and sizes: when every size is known up front, archive_size() gives
+the exact length for Content-Length.
+"""
+import struct
+import time
+import zlib
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+ZIP_VERSION = 45            # 4.5: ZIP64
+ZIP_FLAGS = 0x0808          # bit 3: sizes and CRC in a data descriptor, bit 11: UTF-8 names
+ZIP_EXTERNAL_ATTR = 0o100644 << 16
+
+_LOCAL = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_ZIP64 = struct.Struct('<HHQQ')
+_DESCRIPTOR = struct.Struct('<IIQQ')
+_CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+_CENTRAL_ZIP64 = struct.Struct('<HHQQQ')
+_END64 = struct.Struct('<IQHHIIQQQQ')
+_END64_LOCATOR = struct.Struct('<IIQI')
+_END = struct.Struct('<IHHHHIIH')
+
+
+class ZipMember:
+    def __init__(
+        self,
+        name: str,
+        size: Optional[int],
+        open_body: Callable[[], AsyncIterator[bytes]],
+        modified: Optional[float] = None,
+    ):
+        """
+        `open_body()` is called when the member's turn comes, so only one
+        member is read at a time. A known `size` is checked against the
+        bytes actually received.
+        """
+        self.name = name
+        self.size = size
+        self.open_body = open_body
+        self.modified = modified if modified is not None else time.time()
+
+
+def _dos_time(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+def unique_names(names: Iterable[str]) -> List[str]:
+    """Archive-safe member names: no directories, duplicates become `name (2).ext`."""
+    result: List[str] = []
+    seen = set()
+    for name in names:
+        name = name.replace('/', '_').replace('\\', '_').strip() or 'file'
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            stem, dot, ext = name.rpartition('.')
+            candidate = f"{stem} ({n}).{ext}" if dot and stem else f"{name} ({n})"
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def archive_size(members: List[ZipMember]) -> Optional[int]:
+    """Exact archive length, or None when a member's size is unknown."""
+    total = _END64.size + _END64_LOCATOR.size + _END.size
+    for member in members:
+        if member.size is None:
+            return None
+        name = len(member.name.encode('utf-8'))
+        total += _LOCAL.size + name + _LOCAL_ZIP64.size + member.size + _DESCRIPTOR.size
+        total += _CENTRAL.size + name + _CENTRAL_ZIP64.size
+    return total
+
+
+async def stream_zip(members: List[ZipMember]) -> AsyncIterator[bytes]:
+    offset = 0
+    central: List[bytes] = []
+    for member in members:
+        name = member.name.encode('utf-8')
+        dos_time, dos_date = _dos_time(member.modified)
+        header = _LOCAL.pack(
+            0x04034b50, ZIP_VERSION, ZIP_FLAGS, 0, dos_time, dos_date,
+            0, 0xFFFFFFFF, 0xFFFFFFFF, len(name), _LOCAL_ZIP64.size,
+        ) + name + _LOCAL_ZIP64.pack(0x0001, 16, 0, 0)
+        yield header
+
+        crc = 0
+        size = 0
+        body = member.open_body()
+        try:
+            async for chunk in body:
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                yield chunk
+        finally:
+            aclose = getattr(body, 'aclose', None)
+            if aclose:
+                await aclose()
+        if member.size is not None and size != member.size:
+            # Content-Length was computed from this size - a short member would corrupt the archive
+            raise IOError(f"{member.name}: expected {member.size} bytes, got {size}")
+        yield _DESCRIPTOR.pack(0x08074b50, crc, size, size)
+
+        central.append(_CENTRAL.pack(
+            0x02014b50, ZIP_VERSION | (3 << 8), ZIP_VERSION, ZIP_FLAGS, 0, dos_time, dos_date,
+            crc, 0xFFFFFFFF, 0xFFFFFFFF, len(name), _CENTRAL_ZIP64.size, 0, 0, 0,
+            ZIP_EXTERNAL_ATTR, 0xFFFFFFFF,
+        ) + name + _CENTRAL_ZIP64.pack(0x0001, 24, size, size, offset))
+        offset += len(header) + size + _DESCRIPTOR.size
+
+    directory = b''.join(central)
+    yield directory
+    end64 = offset + len(directory)
+    count = len(members)
+    yield _END64.pack(
+        0x06064b50, _END64.size - 12, ZIP_VERSION | (3 << 8), ZIP_VERSION, 0, 0,
+        count, count, len(directory), offset,
+    )
+    yield _END64_LOCATOR.pack(0x07064b50, 0, end64, 1)
+    yield _END.pack(0x06054b50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
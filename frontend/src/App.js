@@ -6,6 +6,45 @@ const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
 const DURATIONS = [3, 5, 7, 14, 30, 60, 100];
+const PIECE_BYTES = 8 * 1024 * 1024;                  // one PUT of a resumable upload; a dropped connection re-sends at most this
+const RETRY_DELAYS = [1000, 2000, 5000, 10000, 20000, 30000];
+
+const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+const waitOnline = () => new Promise((r) => window.addEventListener("online", r, { once: true }));
+
+/* Resumable upload: the server forwards every complete chunk to GigaFile while the rest is still on its way.
+   After a network error it asks the server how much arrived and continues from there. */
+async function uploadResumable(file, duration, onProgress) {
+  const { data: session } = await axios.post(`${API}/upload/sessions`, { filename: file.name, size: file.size, duration });
+  const target = `${API}/upload/sessions/${session.id}`;
+  let offset = 0;
+  let failures = 0;
+  for (;;) {
+    try {
+      // At the end an empty PUT waits for the last chunks to reach GigaFile
+      const piece = file.slice(offset, Math.min(offset + PIECE_BYTES, file.size));
+      const start = offset;
+      const resp = await axios.put(target, piece, {
+        headers: { "Content-Type": "application/offset+octet-stream", "Upload-Offset": start.toString() },
+        onUploadProgress: (e) => onProgress(Math.min(99, Math.round(((start + e.loaded) * 100) / file.size))),
+      });
+      if (resp.data.complete) return resp.data.result;
+      offset = resp.data.offset;
+      failures = 0;
+    } catch (e) {
+      const status = e.response?.status;
+      if (status && status !== 409 && status < 500) throw e;   // session gone or request rejected
+      if (!navigator.onLine) await waitOnline();
+      else if (failures >= RETRY_DELAYS.length) throw e;
+      else await sleep(RETRY_DELAYS[failures++]);
+      try {
+        const { data } = await axios.get(target);
+        if (data.complete) return data.result;
+        offset = data.offset;
+      } catch (_) { /* still unreachable: the next PUT fails and waits again */ }
+    }
+  }
+}
 
 /* ─── i18n ─── */
 const LANGS = {
@@ -275,16 +314,17 @@ function UploadPage() {
     if (!file && !url.trim()) return;
     setUploading(true); setError(null); setResult(null); setProgress(0);
     try {
-      const formData = new FormData();
-      if (file) formData.append("file", file);
-      else formData.append("url", url.trim());
-      formData.append("duration", duration.toString());
-      const resp = await axios.post(`${API}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
-        onUploadProgress: (e) => { if (e.total) setProgress(Math.round((e.loaded * 100) / e.total)); },
-      });
-      if (resp.data.success) setResult(resp.data);
-      else setError(resp.data.error || "Upload failed");
+      let data;
+      if (file) {
+        data = await uploadResumable(file, duration, setProgress);
+      } else {
+        const formData = new FormData();
+        formData.append("duration", duration.toString());
+        formData.append("url", url.trim());
+        data = (await axios.post(`${API}/upload`, formData, { headers: { "Content-Type": "multipart/form-data" } })).data;
+      }
+      if (data.success) setResult(data);
+      else setError(data.error || "Upload failed");
     } catch (e) {
       setError(e.response?.data?.detail || e.message || "Upload failed");
     } finally { setUploading(false); }
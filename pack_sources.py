@@ -19,6 +19,23 @@ INCLUDE_FILES = [
     ('backend/server.py',          'backend/server.py'),
     ('backend/gigafile_client.py', 'backend/gigafile_client.py'),
     ('backend/bot.py',             'backend/bot.py'),
+    ('backend/upload_journal.py',  'backend/upload_journal.py'),
+    ('backend/transfer_scheduler.py', 'backend/transfer_scheduler.py'),
+    ('backend/upload_dedup.py',    'backend/upload_dedup.py'),
+    ('backend/spool_cache.py',     'backend/spool_cache.py'),
+    ('backend/gigafile_proxy.py',  'backend/gigafile_proxy.py'),
+    ('backend/proxy_cache.py',     'backend/proxy_cache.py'),
+    ('backend/proxy_fanout.py',    'backend/proxy_fanout.py'),
+    ('backend/proxy_admission.py', 'backend/proxy_admission.py'),
+    ('backend/link_metadata.py',   'backend/link_metadata.py'),
+    ('backend/proxy_accel.py',     'backend/proxy_accel.py'),
+    ('backend/zip_stream.py',      'backend/zip_stream.py'),
+    ('backend/zip_index.py',       'backend/zip_index.py'),
+    ('backend/multipart_stream.py', 'backend/multipart_stream.py'),
+    ('backend/jobs.py',            'backend/jobs.py'),
+    ('backend/job_worker.py',      'backend/job_worker.py'),
+    ('backend/upload_sessions.py', 'backend/upload_sessions.py'),
+    ('backend/webhook_pipeline.py', 'backend/webhook_pipeline.py'),
     ('backend/requirements.txt',   'backend/requirements.txt'),
     ('pack_sources.py',            'pack_sources.py'),
 ]
@@ -60,6 +77,7 @@ async def main():
     print("\n⬆️  Uploading to GigaFile.nu (lifetime=100 days)...")
 
     result = await gigafile_client.upload_file_path(tmp, lifetime=100)
+    await gigafile_client.close()
     os.unlink(tmp)
 
     if result.get('success'):